@@ -0,0 +1,179 @@
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from scripts.data_extraction import CrsDataPoint, CrsPointCollection, _dataset_columns, _extract_values
+
+
+class BatchExtractor :
+    """
+    Asyncio façade over the extraction functions for services answering many concurrent small queries.
+    Requests for the same dataset arriving within a short window are coalesced into one batched extraction (one read per pixel),
+    run in a bounded thread pool so the event loop is never blocked. No progress messages are printed.
+
+    Attributes
+    ----------
+    window : float
+        Time (in seconds) requests are collected for before a batch is extracted
+    max_batch : int
+        Number of data points that triggers the extraction of a batch before the end of the window
+    max_workers : int
+        Maximum number of batches extracted at the same time
+    executor : ThreadPoolExecutor
+        Bounded executor running the batched extractions
+
+    Methods
+    -------
+    extract(points, dataset, trimmed):
+        Coroutine returning the bioclim + elevation values of the data points as a DataFrame.
+
+    close():
+        Shuts down the executor.
+
+    Cancelling a request (e.g. with asyncio.wait_for) removes its data points from the batch if it was not extracted yet,
+    otherwise its result is discarded.
+    """
+
+    def __init__(self, window=0.005, max_batch=10000, max_workers=4) :
+        """
+        Constructor for BatchExtractor object.
+
+        Parameters
+        ----------
+        window : float
+            Time (in seconds) requests are collected for before a batch is extracted (default is 0.005)
+        max_batch : int
+            Number of data points that triggers the extraction of a batch before the end of the window (default is 10000)
+        max_workers : int
+            Maximum number of batches extracted at the same time (default is 4)
+        """
+        if window < 0 :
+            raise ValueError("window must be positive")
+        if not isinstance(max_batch, int) or max_batch < 1 :
+            raise ValueError("max_batch must be a positive integer")
+        self.window = window
+        self.max_batch = max_batch
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bioclim")
+        # Pending requests per (dataset, trimmed) : [(collection, future), ...] and the scheduled flushes
+        self._pending = {}
+        self._timers = {}
+
+    def __repr__(self) :
+        return f"BatchExtractor(window={self.window}, max_batch={self.max_batch}, max_workers={self.max_workers})"
+
+    async def extract(self, points, dataset, trimmed=True) :
+        """
+        Coroutine returning the bioclim + elevation values of the data points (same output as extract_multiple_bioclim_elev()).
+
+        Parameters
+        ----------
+        points : CrsDataPoint, list of CrsDataPoint or CrsPointCollection
+            Data points to extract
+        dataset : str
+            Name of the dataset : "chelsa", "worldclim" or a regional dataset (see clip.py)
+        trimmed : bool
+            Trimmed or full DataFrame (default is True)
+
+        Returns
+        -------
+        df : pandas DataFrame
+            One row per data point, in order
+        """
+        _dataset_columns(dataset)
+        if not isinstance(trimmed, bool) :
+            raise TypeError("trimmed argument must be a bool")
+        if isinstance(points, CrsDataPoint) :
+            points = [points]
+        if not isinstance(points, CrsPointCollection) :
+            points = CrsPointCollection.from_points(points)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (dataset, trimmed)
+        requests = self._pending.setdefault(key, [])
+        requests.append((points, future))
+        if sum(len(collection) for collection, _ in requests) >= self.max_batch :
+            self._flush(key)
+        elif key not in self._timers :
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return await future
+
+    def _flush(self, key) :
+        timer = self._timers.pop(key, None)
+        if timer is not None :
+            timer.cancel()
+        # Cancelled requests are left out of the batch
+        requests = [(collection, future) for collection, future in self._pending.pop(key, []) if not future.cancelled()]
+        if not requests :
+            return
+        batch = asyncio.get_running_loop().run_in_executor(self.executor, self._extract_batch, key, requests)
+        batch.add_done_callback(lambda batch : self._dispatch(batch, requests))
+
+    @staticmethod
+    def _extract_batch(key, requests) :
+        dataset, trimmed = key
+        specimens = CrsPointCollection.concat([collection for collection, _ in requests]).to_crs()
+        return _extract_values(specimens, dataset, trimmed)
+
+    @staticmethod
+    def _dispatch(batch, requests) :
+        # Split the batch back into the rows of each request
+        error = batch.exception() if not batch.cancelled() else asyncio.CancelledError()
+        start = 0
+        for collection, future in requests :
+            end = start + len(collection)
+            if not future.done() :
+                if error is not None :
+                    future.set_exception(error)
+                else :
+                    df = batch.result()
+                    future.set_result(df.iloc[start:end].reset_index(drop=True))
+            start = end
+
+    def close(self) :
+        """
+        Shuts down the executor (waiting for the running batches).
+        """
+        self.executor.shutdown(wait=True)
+
+
+# Default extractor of each running event loop
+_extractors = weakref.WeakKeyDictionary()
+
+async def extract_async(points, dataset, *, trimmed=True):
+    """
+    Coroutine extracting the bioclim + elevation values of data points without blocking the event loop,
+    with the default BatchExtractor of the running event loop (concurrent requests are coalesced into batches).
+
+    Parameters
+    ----------
+    points : CrsDataPoint, list of CrsDataPoint or CrsPointCollection
+        Data points to extract
+    dataset : str
+        Name of the dataset : "chelsa", "worldclim" or a regional dataset (see clip.py)
+    trimmed : bool
+        Trimmed or full DataFrame (default is True)
+
+    Returns
+    -------
+    df : pandas DataFrame
+        One row per data point, same columns as extract_multiple_bioclim_elev()
+
+    Examples
+    --------
+    >>> import asyncio
+    >>> from scripts.data_extraction import CrsDataPoint
+    >>> from scripts.async_extraction import extract_async
+
+    >>> async def main() :
+    ...     sherby = CrsDataPoint('Sherbrooke', epsg=4326, x=-71.890068, y=45.393869)
+    ...     paris = CrsDataPoint('Paris', epsg=4326, x=2.346963, y=48.858885)
+    ...     return await asyncio.gather(extract_async(sherby, 'worldclim'), extract_async(paris, 'worldclim'))
+    >>> sherby_df, paris_df = asyncio.run(main())     # Both requests are extracted in the same batch
+    """
+    loop = asyncio.get_running_loop()
+    extractor = _extractors.get(loop)
+    if extractor is None :
+        extractor = _extractors[loop] = BatchExtractor()
+        weakref.finalize(loop, extractor.executor.shutdown, wait=False)
+    return await extractor.extract(points, dataset, trimmed)
@@ -0,0 +1,265 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from scripts import data_extraction
+from scripts.data_extraction import (
+    CrsDataPoint, chelsa_data, worldclim_data, worldclim_elev, get_transformer, extract_multiple_bioclim_elev, trim_data,
+    set_data_dir
+)
+
+# Resolutions of the synthetic rasters (degrees per pixel), 30s is the resolution of the real CHELSA/WorldClim files
+resolutions = {'30s' : 1/120, '2.5m' : 1/24, '5m' : 1/12, '10m' : 1/6}
+
+# Internal layouts of the synthetic rasters : GDAL default strips (as downloaded) or 256 x 256 tiles (as prepared)
+layouts = {
+    'strips' : dict(tiled=False, compress="DEFLATE"),
+    'tiled' : dict(tiled=True, blockxsize=256, blockysize=256, compress="DEFLATE"),
+}
+
+# dtype and nodata of the synthetic layers shaped like the real files : scaled integers (CHELSA), floats (WorldClim), int16 (elevation)
+def layer_format(filename):
+    if filename == worldclim_elev['filename'] :
+        return "int16", -32768
+    if filename in [v['filename'] for v in chelsa_data.values()] :
+        return "uint16", 65535
+    return "float32", -3.4e38
+
+# Smooth synthetic field (latitude gradient + waves, different for each layer) with nodata "oceans"
+def layer_values(lon, lat, i, dtype, nodata):
+    values = np.cos(np.radians(lat)) * 30 + np.sin(np.radians(lon * (i % 5 + 1))) * 5 + np.cos(np.radians(lat * (i % 3 + 2))) * 3
+    if dtype == "uint16" :
+        values = (values + 273.15) * 10
+    elif dtype == "int16" :
+        values = np.abs(values) * 100
+    values = values.astype(dtype)
+    values[np.sin(np.radians(lon * 2)) * np.cos(np.radians(lat * 3)) > 0.6] = nodata
+    return values
+
+def make_rasters(out_dir, resolution="5m", layout="tiled", strip_rows=512):
+    """
+    Function that writes synthetic global EPSG:4326 GeoTIFF files for all the layers of config.yaml (CHELSA + WorldClim),
+    with the resolution and internal layout given. Existing files of the same variant are reused.
+
+    Returns
+    -------
+    out_dir : Path
+        Directory of the synthetic files, usable as data directory
+    """
+    out_dir = Path(out_dir) / "{}_{}".format(resolution, layout)
+    filenames = list(dict.fromkeys([v['filename'] for v in chelsa_data.values()] + [v['filename'] for v in worldclim_data.values()]))
+    if all((out_dir / filename).is_file() for filename in filenames) :
+        return out_dir
+    os.makedirs(out_dir, exist_ok=True)
+    res = resolutions[resolution]
+    width, height = int(round(360 / res)), int(round(180 / res))
+    start_time = time.time()
+    for i, filename in enumerate(filenames) :
+        dtype, nodata = layer_format(filename)
+        profile = dict(
+            driver="GTiff", width=width, height=height, count=1, dtype=dtype, nodata=nodata, crs="EPSG:4326",
+            transform=from_origin(-180, 90, res, res), **layouts[layout]
+        )
+        with rasterio.open(str(out_dir / filename)+".part", 'w', **profile) as dst :
+            lon = -180 + (np.arange(width) + 0.5) * res
+            for row_off in range(0, height, strip_rows) :
+                rows = min(strip_rows, height - row_off)
+                lat = 90 - (np.arange(row_off, row_off + rows) + 0.5) * res
+                dst.write(layer_values(lon[None, :], lat[:, None], i, dtype, nodata), 1, window=Window(0, row_off, width, rows))
+        os.replace(str(out_dir / filename)+".part", out_dir / filename)
+    print("Generated {} synthetic {} {} rasters ({} x {} pixels) in {:.1f} seconds".format(
+        len(filenames), resolution, layout, width, height, time.time()-start_time
+    ))
+    return out_dir
+
+def make_points(n_points, distribution="uniform", seed=0, n_clusters=50, sigma=0.5):
+    """
+    Function that returns a dataframe (id, epsg, x, y) of random data points over the land latitudes, half of them in EPSG:3857.
+    Uniform points are spread over the globe, clustered points are drawn around n_clusters centres (sigma in degrees).
+    """
+    rng = np.random.default_rng(seed)
+    if distribution == "uniform" :
+        lon, lat = rng.uniform(-180, 180, n_points), rng.uniform(-60, 80, n_points)
+    elif distribution == "clustered" :
+        centres = np.column_stack([rng.uniform(-170, 170, n_clusters), rng.uniform(-55, 70, n_clusters)])
+        cluster = rng.integers(0, n_clusters, n_points)
+        lon = np.clip(centres[cluster, 0] + rng.normal(0, sigma, n_points), -180, 180)
+        lat = np.clip(centres[cluster, 1] + rng.normal(0, sigma, n_points), -60, 80)
+    else :
+        raise ValueError("distribution must be \"uniform\" or \"clustered\"")
+    epsg = np.where(np.arange(n_points) % 2 == 0, 4326, 3857)
+    x, y = lon.copy(), lat.copy()
+    x[epsg == 3857], y[epsg == 3857] = get_transformer(4326, 3857).transform(lon[epsg == 3857], lat[epsg == 3857])
+    return pd.DataFrame({'id' : ["pt{}".format(i) for i in range(n_points)], 'epsg' : epsg, 'x' : x, 'y' : y})
+
+@contextlib.contextmanager
+def use_data_dir(path):
+    """
+    Context manager pointing the extraction functions to another data directory (e.g. synthetic rasters).
+    """
+    saved = data_extraction.data_dir
+    try :
+        yield set_data_dir(path)
+    finally :
+        set_data_dir(saved)
+
+# Time a function (progress messages silenced) : first and best of the repeats
+def time_call(func, repeat=3):
+    timings = []
+    for _ in range(repeat) :
+        with contextlib.redirect_stdout(io.StringIO()) :
+            start_time = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start_time)
+    return timings[0], min(timings)
+
+def benchmark_points(csvfile, dataset="chelsa", repeat=3, max_calls=1000, max_single=200, workers=None):
+    """
+    Function that times the extraction hot paths on a csv of data points. transform_crs() is timed on at most max_calls points,
+    extract_bioclim_elev() (which reads every layer for each point) and trim_data() of its results on at most max_single points.
+
+    Returns
+    -------
+    results : list
+        {'operation', 'n_calls', 'first_seconds', 'seconds', 'us_per_call', 'calls_per_second'} dicts, calls being data points
+    """
+    df = pd.read_csv(csvfile, dtype={'id' : str})
+    with contextlib.redirect_stdout(io.StringIO()) :
+        points = CrsDataPoint.load_csv(csvfile)
+    projected = [point for point in points if point.epsg != 4326][:max_calls]
+    single = [point for point in points if point.epsg == 4326][:max_single]
+    with contextlib.redirect_stdout(io.StringIO()) :
+        extracted = [point.extract_bioclim_elev(dataset) for point in single]
+
+    def run_singles() :
+        for point in single :
+            point.extract_bioclim_elev(dataset)
+
+    operations = [
+        ("load_csv", len(df), lambda : CrsDataPoint.load_csv(csvfile)),
+        ("df_to_dict", len(df), lambda : CrsDataPoint.df_to_dict(df)),
+        ("transform_crs", len(projected), lambda : [point.transform_crs() for point in projected]),
+        ("extract_bioclim_elev", len(single), run_singles),
+        ("extract_multiple_bioclim_elev", len(df), lambda : extract_multiple_bioclim_elev(points, dataset, workers=workers)),
+        ("trim_data", len(extracted), lambda : [trim_data(data) for data in extracted]),
+    ]
+    results = []
+    for operation, n_calls, func in operations :
+        first, best = time_call(func, repeat)
+        results.append({
+            'operation' : operation,
+            'n_calls' : n_calls,
+            'first_seconds' : first,
+            'seconds' : best,
+            'us_per_call' : best / n_calls * 1e6 if n_calls else None,
+            'calls_per_second' : n_calls / best if best else None,
+        })
+        print("    {:<30} {:>9} calls {:>10.4f} s {:>12.2f} us/call".format(operation, n_calls, best, results[-1]['us_per_call'] or 0))
+    return results
+
+def environment():
+    """
+    Function that describes the machine and library versions of a benchmark run.
+    """
+    try :
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError) :
+        commit = None
+    return {
+        'commit' : commit,
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+        'cpu_count' : os.cpu_count(),
+        'numpy' : np.__version__,
+        'pandas' : pd.__version__,
+        'rasterio' : rasterio.__version__,
+        'gdal' : rasterio.__gdal_version__,
+    }
+
+def run_benchmarks(out_dir, point_counts, distributions=("uniform", "clustered"), resolution="5m", layout_names=("tiled",),
+                   dataset="chelsa", repeat=3, max_calls=1000, max_single=200, workers=None):
+    """
+    Function that runs the benchmark suite on synthetic rasters for all the combinations of layouts, distributions and point counts.
+
+    Returns
+    -------
+    report : dict
+        Machine-readable report : 'created', 'environment', 'config' and a 'results' list (one dict per operation and combination)
+    """
+    report = {
+        'created' : datetime.datetime.now().isoformat(timespec='seconds'),
+        'environment' : environment(),
+        'config' : {
+            'resolution' : resolution, 'layouts' : list(layout_names), 'distributions' : list(distributions),
+            'point_counts' : list(point_counts), 'dataset' : dataset, 'repeat' : repeat,
+            'max_calls' : max_calls, 'max_single' : max_single, 'workers' : workers,
+        },
+        'results' : [],
+    }
+    for layout in layout_names :
+        rasters_dir = make_rasters(out_dir, resolution, layout)
+        with use_data_dir(rasters_dir) :
+            for distribution in distributions :
+                for n_points in point_counts :
+                    csvfile = Path(out_dir) / "points_{}_{}.csv".format(distribution, n_points)
+                    if not csvfile.is_file() :
+                        make_points(n_points, distribution).to_csv(csvfile, index=False)
+                    print("{} {} rasters, {} {} points :".format(resolution, layout, n_points, distribution))
+                    for result in benchmark_points(csvfile, dataset, repeat, max_calls, max_single, workers) :
+                        report['results'].append(dict(
+                            resolution=resolution, layout=layout, distribution=distribution, n_points=n_points, **result
+                        ))
+    return report
+
+def compare_reports(old, new):
+    """
+    Function that prints the speedup (time per call) of each result of a new report over the same result (resolution, layout, distribution, points, operation) of an old report.
+    """
+    key = lambda result : (result['resolution'], result['layout'], result['distribution'], result['n_points'], result['operation'])
+    old_results = {key(result) : result for result in old['results']}
+    commit = old['environment']['commit']
+    print("Speedup over the report of {} ({}) :".format(old['created'], commit[:10] if commit else "unknown commit"))
+    for result in new['results'] :
+        previous = old_results.get(key(result))
+        if previous is not None and previous['us_per_call'] and result['us_per_call'] :
+            print("    {:<30} {:>9} {:<9} {:>8.2f}x".format(
+                result['operation'], result['n_points'], result['distribution'], previous['us_per_call'] / result['us_per_call']
+            ))
+
+
+if __name__ == "__main__" :
+    parser = argparse.ArgumentParser(description="Benchmark the extraction hot paths on synthetic rasters shaped like the config.yaml layers.")
+    parser.add_argument("--dir", default="./data/benchmark", help="directory of the synthetic rasters and points (reused between runs)")
+    parser.add_argument("--points", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000, 1000000], help="point counts")
+    parser.add_argument("--distributions", nargs="+", choices=["uniform", "clustered"], default=["uniform", "clustered"])
+    parser.add_argument("--resolution", choices=list(resolutions), default="5m", help="resolution of the synthetic rasters")
+    parser.add_argument("--layouts", nargs="+", choices=list(layouts), default=["strips", "tiled"], help="internal layouts of the synthetic rasters")
+    parser.add_argument("--dataset", choices=["chelsa", "worldclim"], default="chelsa")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs of each operation (best is kept)")
+    parser.add_argument("--max-calls", type=int, default=1000, help="maximum number of points timed for transform_crs()")
+    parser.add_argument("--max-single", type=int, default=200, help="maximum number of points timed for extract_bioclim_elev() and trim_data()")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes of extract_multiple_bioclim_elev()")
+    parser.add_argument("--output", default="benchmark_results.json", help="machine-readable report")
+    parser.add_argument("--compare", default=None, help="previous report to compare the results with")
+    args = parser.parse_args()
+
+    report = run_benchmarks(
+        args.dir, args.points, args.distributions, args.resolution, args.layouts, args.dataset, args.repeat, args.max_calls, args.max_single, args.workers
+    )
+    with open(args.output, 'w') as f :
+        json.dump(report, f, indent=2)
+    print("Wrote {} results to {}".format(len(report['results']), args.output))
+    if args.compare is not None :
+        with open(args.compare) as f :
+            compare_reports(json.load(f), report)
@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import rasterio
+from rasterio.windows import Window, from_bounds
+from scripts import data_extraction
+from scripts.data_extraction import (
+    CrsPointCollection, raster_path, registered_regions, variable_metadata
+)
+
+# Extent (xmin, ymin, xmax, ymax) of the data points of a csv file (id, epsg, x, y header) in lon/lat, widened by a margin in degrees
+def csv_bounds(csvfile, margin=1.0):
+    points = CrsPointCollection.from_csv(csvfile).to_crs()
+    if not len(points) :
+        raise ValueError("No data points in {}".format(csvfile))
+    return (
+        max(points.x.min() - margin, -180.0), max(points.y.min() - margin, -90.0),
+        min(points.x.max() + margin, 180.0), min(points.y.max() + margin, 90.0),
+    )
+
+# Copy the pixels of a layer covering the bounds (whole pixels, same grid as the global file) by windows of rows
+def clip_layer(filename, bounds, out_dir, compress="ZSTD", strip_rows=1024):
+    dst_path = out_dir / filename
+    with rasterio.open(raster_path(filename)) as src :
+        window = from_bounds(*bounds, transform=src.transform)
+        row_start, col_start = max(int(np.floor(window.row_off)), 0), max(int(np.floor(window.col_off)), 0)
+        row_stop = min(int(np.ceil(window.row_off + window.height)), src.height)
+        col_stop = min(int(np.ceil(window.col_off + window.width)), src.width)
+        if row_stop <= row_start or col_stop <= col_start :
+            raise ValueError("Bounds {} do not overlap {}".format(bounds, filename))
+        window = Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+        profile = src.profile
+        profile.update(
+            driver="GTiff", width=window.width, height=window.height, transform=src.window_transform(window),
+            tiled=True, blockxsize=256, blockysize=256, compress=compress,
+            predictor=3 if np.dtype(src.dtypes[0]).kind == 'f' else 2, bigtiff="IF_SAFER",
+        )
+        with rasterio.open(str(dst_path)+".part", 'w', **profile) as dst :
+            for row_off in range(0, window.height, strip_rows) :
+                strip = Window(0, row_off, window.width, min(strip_rows, window.height - row_off))
+                src_strip = Window(window.col_off, window.row_off + row_off, strip.width, strip.height)
+                dst.write(src.read(window=src_strip), window=strip)
+    os.replace(str(dst_path)+".part", dst_path)
+    return filename, (window.width, window.height)
+
+def clip_region(name, dataset, bounds, workers=None, compress="ZSTD"):
+    """
+    Function that clips all the layers of a dataset (config.yaml) to a bounding box in parallel and registers the result as a regional dataset.
+    The regional dataset can then be used as the dataset of the extraction functions (e.g. extract_multiple_bioclim_elev(points, "quebec")),
+    the values of the points within the bounding box are the same as with the global files.
+
+    Parameters
+    ----------
+    name : str
+        Name of the regional dataset (letters, digits, "-" and "_")
+    dataset : str
+        Dataset to clip : "chelsa" or "worldclim"
+    bounds : tuple
+        (xmin, ymin, xmax, ymax) bounding box in lon/lat
+    workers : int
+        Number of layers clipped in parallel (default is the number of CPUs)
+    compress : str
+        GDAL compression codec of the regional files (default is "ZSTD")
+
+    Returns
+    -------
+    region : dict
+        Registered entry of the regional dataset
+
+    Examples
+    --------
+    >>> from scripts.clip import clip_region, csv_bounds
+    >>> clip_region("us-capitals", "chelsa", csv_bounds("./data/us-state-capitals.csv", margin=1))
+    Clipped 20 layers of chelsa to data/bioclim/regions/us-capitals (66 x 31 pixels) in 0.4 seconds
+    Registered regional dataset us-capitals
+    """
+    if not re.fullmatch("[A-Za-z0-9_-]+", name) or name in ("chelsa", "worldclim", "both") :
+        raise ValueError("Regional dataset name must only contain letters, digits, \"-\" and \"_\" and not be a dataset name")
+    if dataset not in ("chelsa", "worldclim") :
+        raise ValueError("Enter the dataset to clip : \"chelsa\" or \"worldclim\"")
+    xmin, ymin, xmax, ymax = (float(bound) for bound in bounds)
+    if not (xmin < xmax and ymin < ymax) :
+        raise ValueError("Bounds must be xmin, ymin, xmax, ymax with xmin < xmax and ymin < ymax")
+
+    # Written next to the final directory, then swapped in
+    out_dir = data_extraction.regions_dir / name
+    part_dir = data_extraction.regions_dir / (name+".part")
+    shutil.rmtree(part_dir, ignore_errors=True)
+    os.makedirs(part_dir)
+    start_time = time.time()
+    filenames = list(dict.fromkeys(variable_metadata(dataset)['filename']))
+    with ProcessPoolExecutor(max_workers=workers) as executor :
+        jobs = [executor.submit(clip_layer, filename, (xmin, ymin, xmax, ymax), part_dir, compress) for filename in filenames]
+        shapes = dict(job.result() for job in jobs)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(part_dir, out_dir)
+    print("Clipped {} layers of {} to {} ({} x {} pixels) in {:.1f} seconds".format(
+        len(filenames), dataset, out_dir, *shapes[filenames[0]], time.time()-start_time
+    ))
+
+    regions = registered_regions()
+    regions[name] = {'dataset' : dataset, 'bounds' : [xmin, ymin, xmax, ymax]}
+    regions_file = data_extraction.regions_dir / "regions.json"
+    with open(str(regions_file)+".part", 'w') as f :
+        json.dump(regions, f, indent=2)
+    os.replace(str(regions_file)+".part", regions_file)
+    print("Registered regional dataset {}".format(name))
+    return regions[name]
+
+
+if __name__ == "__main__" :
+    parser = argparse.ArgumentParser(description="Clip the bioclim GeoTIFF files to a region and register it as a named dataset.")
+    parser.add_argument("name", help="name of the regional dataset")
+    parser.add_argument("dataset", choices=["chelsa", "worldclim"])
+    extent = parser.add_mutually_exclusive_group(required=True)
+    extent.add_argument("--bbox", type=float, nargs=4, metavar=("XMIN", "YMIN", "XMAX", "YMAX"), help="bounding box in lon/lat")
+    extent.add_argument("--csv", help="csv file of data points (id, epsg, x, y header) whose extent is clipped")
+    parser.add_argument("--margin", type=float, default=1.0, help="margin around the extent of the csv data points, in degrees")
+    parser.add_argument("--workers", type=int, default=None, help="number of layers clipped in parallel")
+    parser.add_argument("--compress", default="ZSTD", help="GDAL compression codec (e.g. ZSTD, LZW, DEFLATE)")
+    args = parser.parse_args()
+
+    bounds = args.bbox if args.bbox is not None else csv_bounds(args.csv, args.margin)
+    clip_region(args.name, args.dataset, bounds, args.workers, args.compress)
@@ -1,507 +1,2556 @@
 from pathlib import Path
-import csv
-import rasterio
-from rasterio import sample
-from rasterio.crs import CRS
-import pyproj
-from pyproj import Transformer
-import yaml
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import atexit
+import contextlib
+import itertools
+import os
+import sqlite3
+import threading
+import time
+import weakref
+import json
+import hashlib
+import importlib
 import re
-import pandas as pd
+import numpy as np
 
-# Path references for src and data files
-data_dir = Path("./data/bioclim/")
-scr_dir = Path("./scripts/")
 
- 
+class _LazyModule :
+    """
+    Placeholder of a module (and its listed submodules) imported on first attribute access, which then replaces the placeholder in the module globals.
+    Keeps the import of data_extraction (CLI tools, spawned worker processes) from loading rasterio, pyproj and pandas before they are used.
+    """
+
+    def __init__(self, alias, name, submodules=()) :
+        self._alias = alias
+        self._name = name
+        self._submodules = submodules
+
+    def __getattr__(self, attr) :
+        module = importlib.import_module(self._name)
+        for submodule in self._submodules :
+            importlib.import_module(self._name + "." + submodule)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+rasterio = _LazyModule("rasterio", "rasterio", ("crs", "features", "transform", "warp", "windows"))
+pyproj = _LazyModule("pyproj", "pyproj")
+pd = _LazyModule("pd", "pandas")
+
+# Path references for src and data files, the data directory can be set with the BIOCLIM_DATA_DIR environment variable (or set_data_dir())
+data_dir = Path(os.environ.get("BIOCLIM_DATA_DIR", "./data/bioclim/"))
+scr_dir = Path(__file__).parent
+prepared_dir = data_dir / "prepared"     # Optimized copies of the GeoTIFF files (see prepare.py)
+regions_dir = data_dir / "regions"       # Regional extracts of the GeoTIFF files (see clip.py)
+
+def set_data_dir(path):
+    """
+    Function that sets the directory of the GeoTIFF files (and of their prepared copies and regional extracts) used by the extraction functions.
+    The opened rasters and the cached manifest are dropped, and the directory is also passed to worker processes through BIOCLIM_DATA_DIR.
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import set_data_dir
+    >>> set_data_dir("/mnt/rasters/bioclim")
+    PosixPath('/mnt/rasters/bioclim')
+    """
+    global data_dir, prepared_dir, regions_dir
+    data_dir = Path(path)
+    prepared_dir = data_dir / "prepared"
+    regions_dir = data_dir / "regions"
+    os.environ["BIOCLIM_DATA_DIR"] = str(data_dir)
+    _manifest.update(mtime=None, files={})
+    _dataset_columns.cache_clear()
+    with _raster_arrays_lock :
+        _raster_arrays.clear()
+    raster_pool.close()
+    return data_dir
+
 # Reference to config.YAML containing metadata from https://chelsa-climate.org/bioclim/ 
-with open(scr_dir / "config.yaml") as f:
-    cfg = yaml.safe_load(f)
+config_file = scr_dir / "config.yaml"
+
+# Best-effort cache of the parsed config.yaml in the user cache directory (one file per installation)
+def _config_cache_file():
+    cache_home = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    key = hashlib.sha1(str(config_file.resolve()).encode()).hexdigest()[:16]
+    return cache_home / "bioclim-data-extraction" / "config-{}.json".format(key)
+
+@lru_cache(maxsize=None)
+def load_config():
+    """
+    Function that returns the parsed config.yaml, parsed on first use only. The parsed config is also cached as JSON in the user cache directory
+    ($XDG_CACHE_HOME or ~/.cache, until config.yaml is modified) so that new processes do not parse the YAML file again.
+    The cache is skipped if it cannot be read or written (e.g. read-only home directory).
+    """
+    stat = config_file.stat()
+    identity = [str(config_file.resolve()), stat.st_size, stat.st_mtime_ns]
+    try :
+        cache_file = _config_cache_file()
+        with open(cache_file) as f :
+            cached = json.load(f)
+        if cached['identity'] == identity :
+            return cached['config']
+    except (OSError, RuntimeError, ValueError, KeyError, TypeError) :
+        cache_file = None
+    import yaml
+    with open(config_file) as f :
+        config = yaml.safe_load(f)
+    try :
+        cache_file = cache_file or _config_cache_file()
+        os.makedirs(cache_file.parent, exist_ok=True)
+        part = "{}.{}.part".format(cache_file, os.getpid())
+        with open(part, 'w') as f :
+            json.dump({'identity' : identity, 'config' : config}, f)
+        os.replace(part, cache_file)
+    except (OSError, RuntimeError) :
+        pass
+    return config
 
-# YAML shorthand refs
-chelsa_data = cfg['chelsa_data']        # Nested dicts of Chelsa metadata
-worldclim_data = cfg['worldclim_data']      # Nested dicts of Worldclim metadata
-worldclim_elev = cfg['worldclim_data']['elevation']     # Worldclim elevation dict of params
+# Full names of the datasets
+dataset_names = {
+    'chelsa' : "CHELSA V2.1 (1981-2010) + WorldClim 2.1 (elevation)",
+    'worldclim' : "WorldClim 2.1 (1970-2000)",
+}
 
-# List of all EPSG reference codes
-EPSG_codes = [int(code) for code in pyproj.get_codes('EPSG', 'CRS')]
+def registered_regions():
+    """
+    Function that returns the regional datasets registered by clip.py, usable as dataset names by the extraction functions.
 
-class CrsDataPoint :
+    Returns
+    -------
+    regions : dict
+        {name : {'dataset' : source dataset ("chelsa" or "worldclim"), 'bounds' : [xmin, ymin, xmax, ymax]}}
     """
-    A class to represent, transform and extract information of a data point under a geographic coordinate system standard (CRS) 
+    regions_file = regions_dir / "regions.json"
+    if not regions_file.is_file() :
+        return {}
+    with open(regions_file) as f :
+        return json.load(f)
 
-    ...
+def dataset_config(dataset):
+    """
+    Function that returns the config.yaml metadata of the variables of a dataset and of its elevation layer.
 
-    Attributes
+    Parameters
     ----------
-    all : list
-        list of all the instances of CrsDataPoint created
-    id : str
-        identifier of single specimen data point
-    epsg : int
-        EPSG Geodetic Parameter Dataset code of the coordinate reference system (CRS)
-    x : float
-        x-value (equivalent of East-West latitude lines) of the CRS
-    y : float
-        y-value (equivalent of North-Sound longitude lines) of the CRS
-    coord_xy : tuple
-        x,y in tuple format
+    dataset : str
+        "chelsa", "worldclim" or the name of a regional dataset (see clip.py), whose filenames are relative to the data directory
 
-    Methods
+    Returns
     -------
-    load_csv(csvfile):
-        Instantiate CrsDataPoint objects into a list by parsing a csv file containing the attributes.
+    bioclim_data, elev : dict, dict
+        Nested dicts of the variables metadata (as chelsa_data or worldclim_data) and the elevation dict of params (as worldclim_elev)
+    """
+    cfg = load_config()
+    if dataset == "chelsa" :
+        return cfg['chelsa_data'], cfg['worldclim_data']['elevation']
+    elif dataset == "worldclim" :
+        return cfg['worldclim_data'], cfg['worldclim_data']['elevation']
+    region = registered_regions().get(dataset) if isinstance(dataset, str) else None
+    if region is None :
+        raise ValueError(
+            "Enter the dataset you want to extract the climate data from : \"chelsa\" or \"worldclim\" (or a regional dataset, see clip.py)"
+        )
+    # Same variables, files of the regional extract
+    bioclim_data, elev = dataset_config(region['dataset'])
+    bioclim_data = {k : dict(v, filename="regions/{}/{}".format(dataset, v['filename'])) for k,v in bioclim_data.items()}
+    return bioclim_data, dict(elev, filename="regions/{}/{}".format(dataset, elev['filename']))
 
-    __repr__():
-        Lists all of created instances of CrsDataPoint objects
+def dataset_label(dataset):
+    """
+    Function that returns the full name of a dataset (see dataset_names), for the progress messages.
+    """
+    if dataset in dataset_names :
+        return dataset_names[dataset]
+    return "{} ({} regional extract)".format(dataset_names[registered_regions()[dataset]['dataset']], dataset)
 
-    get_info():
-        Prints the CrsDataPoint information
+def outside_region(dataset, coords):
+    """
+    Function that returns which points are outside of the bounds registered for a regional dataset (see clip.py).
+    The regional files only cover their bounds, the values of these points are NaN instead of the nodata value of the files.
 
-    transform_crs(epsg_out):
-        Transforms the coordinates to the desired EPSG coordinate reference system
+    Parameters
+    ----------
+    dataset : str
+        "chelsa", "worldclim" or the name of a regional dataset
+    coords : array-like
+        (lon, lat) coordinates of the points, in EPSG:4326
 
-    df_to_dict(df):
-        Takes the input df and returns a dictionnary of CrsDataPoint objects.
-        Calls transform_crs() method if any epsg codes are not 4326.
+    Returns
+    -------
+    outside : numpy array
+        Boolean mask of the points outside of the region (all False for the global datasets)
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if dataset in dataset_names :
+        return np.zeros(len(coords), dtype=bool)
+    xmin, ymin, xmax, ymax = registered_regions()[dataset]['bounds']
+    x, y = coords[:, 0], coords[:, 1]
+    return ~((x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax))
 
-    extract_bioclim_elev(dataset):
-        Extracts the pixel values from the specified GeoTIFF file. Calls transform_crs() method if needed.
+# Set of all EPSG reference codes, only queried from the pyproj database on first use
+@lru_cache(maxsize=None)
+def get_epsg_codes():
+    """
+    Returns the frozenset of all the EPSG reference codes of the pyproj database (built once on first use).
     """
+    return frozenset(int(code) for code in pyproj.get_codes('EPSG', 'CRS'))
 
-    all = []
+def check_epsg_codes(codes):
+    """
+    Function that validates one or many EPSG codes in a single pass over the unique codes.
 
-    def __init__(self, id, epsg, x, y,) :
+    Parameters
+    ----------
+    codes : int or array-like
+        EPSG code(s) to validate
+
+    Raises
+    ------
+    ValueError
+        If any of the codes is not in the pyproj EPSG database
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import check_epsg_codes
+    >>> check_epsg_codes([4326, 3857, 4326])
+    >>> check_epsg_codes([4326, 1])
+    Traceback (most recent call last):
+    ...
+    ValueError: ('Input EPSG code(s) [1] not valid, ', 'see https://pyproj4.github.io/pyproj/stable/api/database.html#pyproj.database.get_codes')
+    """
+    invalid = sorted(set(np.unique(codes).tolist()) - get_epsg_codes())
+    if invalid :
+        raise ValueError(
+            "Input EPSG code(s) {} not valid, ".format(invalid),
+            "see https://pyproj4.github.io/pyproj/stable/api/database.html#pyproj.database.get_codes"
+        )
+
+# Lazy module attributes : EPSG codes and YAML shorthand refs
+def __getattr__(name):
+    if name == "EPSG_codes" :
+        return get_epsg_codes()
+    if name == "cfg" :
+        return load_config()
+    if name == "chelsa_data" :
+        return load_config()['chelsa_data']     # Nested dicts of Chelsa metadata
+    if name == "worldclim_data" :
+        return load_config()['worldclim_data']      # Nested dicts of Worldclim metadata
+    if name == "worldclim_elev" :
+        return load_config()['worldclim_data']['elevation']     # Worldclim elevation dict of params
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@lru_cache(maxsize=None)
+def get_transformer(epsg_in, epsg_out=4326):
+    """
+    Returns the (cached) pyproj Transformer from epsg_in to epsg_out, always in x,y (lon,lat) order.
+    """
+    return pyproj.Transformer.from_crs(epsg_in, epsg_out, always_xy=True)
+
+def transform_points(x, y, epsg, epsg_out=4326):
+    """
+    Function that transforms arrays of coordinates to the desired EPSG coordinate reference system in bulk.
+    Coordinates are grouped by source EPSG code and each group is transformed with a single call to a cached Transformer.
+
+    Parameters
+    ----------
+    x, y : array-like
+        x and y values of the coordinates
+    epsg : int or array-like
+        EPSG code of the coordinates, either a single code for all of them or one code per coordinate
+    epsg_out : int
+        EPSG Geodetic Parameter Dataset code of the output coordinate reference system (CRS) (default is 4326)
+
+    Returns
+    -------
+    x_out, y_out : numpy arrays
+        Transformed x and y values (unchanged for coordinates already in epsg_out)
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import transform_points
+    >>> transform_points([-8002765.769038227, 2.346963], [5683742.6823244635, 48.858885], [3857, 4326])
+    (array([-71.89006806,   2.346963  ]), array([45.39386889, 48.858885  ]))
+    """
+    check_epsg_codes(epsg_out)
+    x_out = np.array(x, dtype=float, ndmin=1)
+    y_out = np.array(y, dtype=float, ndmin=1)
+    epsgs = np.broadcast_to(np.asarray(epsg, dtype=int), x_out.shape)
+    for epsg_in in np.unique(epsgs) :
+        if epsg_in == epsg_out :
+            continue
+        group = epsgs == epsg_in
+        with _timed("transform") :
+            x_out[group], y_out[group] = get_transformer(int(epsg_in), epsg_out).transform(x_out[group], y_out[group])
+    return x_out, y_out
+
+class ExtractionMetrics :
+    """
+    Counters and timers of the extraction hot paths, collected by the extraction functions once enabled with set_metrics()
+
+    ...
+
+    Stages are timed with time.perf_counter() : "transform" (CRS transforms), "open" (opening GeoTIFF files), "index" (pixel indices,
+    deduplication and block plans), "cache" (pixel cache lookups and writes), "read" (block reads and decompression),
+    "memory_map" (memory-mapped lookups), "aggregate" (window modes), "dict" and "dataframe" (building the outputs),
+    and "extract" (whole extraction calls). Counters include the data points, the pixels requested (within the rasters, unique) and read, the pixel cache hits and misses,
+    the blocks read and the GeoTIFF files opened, and the decompressed bytes read are counted per layer.
+    Counters of the worker processes (workers argument) are merged back into the metrics of the main process.
+
+    Attributes
+    ----------
+    stages : dict
+        Total time (in seconds) and number of calls of each stage : {stage : [seconds, calls]}
+    counters : dict
+        Value of each counter : {counter : value}
+    bytes_read : dict
+        Decompressed bytes read from each layer (GeoTIFF or raw file name) : {layer : bytes}
+    callback : callable
+        Called with (stage, seconds) at the end of each timed stage (default is None)
+
+    Methods
+    -------
+    stage(name):
+        Context manager timing a stage.
+
+    add(name, value):
+        Increments a counter.
+
+    report(since):
+        Returns the stages, counters and bytes read as a dict (minus those of an older report).
+
+    summary(since):
+        Returns a human-readable report (points per second, time per stage, pixels, cache and bytes read).
+    """
+
+    def __init__(self, callback=None) :
         """
-        Constructor for CrsDataPoint object.
+        Constructor for ExtractionMetrics object.
 
         Parameters
         ----------
-        id : str
-            identifier of single data point
-        epsg : int
-            EPSG Geodetic Parameter Dataset code of the coordinate reference system (CRS)
-        x : float
-            x-value (equivalent of East-West longitude lines for EPSG:4326) of the CRS
-        y : float
-            y-value (equivalent of North-Sound latitude lines for EPSG:4326) of the CRS
-        xy_pt : tuple
-            x,y values in tuple format
+        callback : callable
+            Called with (stage, seconds) at the end of each timed stage, e.g. to forward the timings to a monitoring system (default is None)
+        """
+        self.callback = callback
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __repr__(self) :
+        return f"ExtractionMetrics(points={self.counters.get('points', 0)}, stages={len(self.stages)})"
+
+    def reset(self) :
+        """
+        Sets all the timers and counters back to 0.
+        """
+        with self._lock :
+            self.stages = {}
+            self.counters = {}
+            self.bytes_read = {}
+
+    @contextlib.contextmanager
+    def stage(self, name) :
+        """
+        Context manager adding the time spent in the block to the stage.
+        """
+        start = time.perf_counter()
+        try :
+            yield
+        finally :
+            seconds = time.perf_counter() - start
+            with self._lock :
+                timer = self.stages.setdefault(name, [0.0, 0])
+                timer[0] += seconds
+                timer[1] += 1
+            if self.callback is not None :
+                self.callback(name, seconds)
+
+    def add(self, name, value=1) :
+        """
+        Increments the counter by value.
+        """
+        with self._lock :
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_bytes(self, layer, n_bytes) :
+        """
+        Adds n_bytes to the decompressed bytes read from the layer.
+        """
+        with self._lock :
+            self.bytes_read[layer] = self.bytes_read.get(layer, 0) + n_bytes
+
+    def merge(self, report) :
+        """
+        Adds the timers and counters of a report (e.g. of a worker process) to these metrics.
+        """
+        with self._lock :
+            for name, timer in report['stages'].items() :
+                total = self.stages.setdefault(name, [0.0, 0])
+                total[0] += timer['seconds']
+                total[1] += timer['calls']
+            for name, value in report['counters'].items() :
+                self.counters[name] = self.counters.get(name, 0) + value
+            for layer, n_bytes in report['bytes_read'].items() :
+                self.bytes_read[layer] = self.bytes_read.get(layer, 0) + n_bytes
+
+    def report(self, since=None) :
+        """
+        Returns the stages ({stage : {'seconds', 'calls'}}), counters and bytes read per layer as a dict (JSON serializable),
+        minus those of an older report if since is given.
+        """
+        with self._lock :
+            report = {
+                'stages' : {name : {'seconds' : seconds, 'calls' : calls} for name, (seconds, calls) in self.stages.items()},
+                'counters' : dict(self.counters),
+                'bytes_read' : dict(self.bytes_read),
+            }
+        if since is not None :
+            no_timer = {'seconds' : 0.0, 'calls' : 0}
+            report['stages'] = {
+                name : {key : timer[key] - since['stages'].get(name, no_timer)[key] for key in ('seconds', 'calls')}
+                for name, timer in report['stages'].items()
+            }
+            report['stages'] = {name : timer for name, timer in report['stages'].items() if timer['calls']}
+            for key in ('counters', 'bytes_read') :
+                report[key] = {name : value - since[key].get(name, 0) for name, value in report[key].items() if value != since[key].get(name, 0)}
+        return report
+
+    def summary(self, since=None) :
+        """
+        Returns a human-readable report of the metrics (minus those of an older report if since is given).
 
         Examples
         --------
-        Create an instance for a single specimen:
-        >>> from data_extraction import CrsDataPoint
-        >>> sherby = CrsDataPoint('Sherbrooke', epsg=4326, x=-71.890068, y=45.393869)
-        >>> print(sherby)
-        id : Sherbrooke
-        EPSG : 4326
-        Map coordinates :
-            x = -71.890068
-            y = 45.393869
-            (x,y) = (-71.890068, 45.393869)
+        >>> from scripts.data_extraction import ExtractionMetrics, set_metrics, extract_multiple_bioclim_elev, CrsPointCollection
+        >>> metrics = set_metrics(ExtractionMetrics())
+        >>> df = extract_multiple_bioclim_elev(CrsPointCollection.from_csv("./data/us-state-capitals.csv"), 'worldclim')
+        >>> print(metrics.summary())
+        50 data points extracted in 0.042 seconds (1190 points/s)
+            extract        0.0420 s  100.0%      1 calls
+            transform      0.0004 s    1.0%      1 calls
+            open           0.0090 s   21.4%     20 calls
+            ...
+        """
+        report = self.report(since)
+        stages, counters = report['stages'], report['counters']
+        total = stages.get('extract', {'seconds' : sum(timer['seconds'] for timer in stages.values())})['seconds']
+        points = counters.get('points', 0)
+        lines = ["{} data points extracted in {:.3f} seconds ({:.0f} points/s)".format(
+            points, total, points / total if total else 0.0
+        )]
+        for name, timer in sorted(stages.items(), key=lambda item : (item[0] != 'extract', -item[1]['seconds'])) :
+            lines.append("    {:<12} {:>8.4f} s {:>6.1%} {:>6} calls".format(
+                name, timer['seconds'], timer['seconds'] / total if total else 0.0, timer['calls']
+            ))
+        # Share of the requested pixels (within the rasters) already requested for another point or window
+        pixels, inside, unique = counters.get('pixels', 0), counters.get('pixels_inside', 0), counters.get('unique_pixels', 0)
+        lines.append("    {} pixels requested, {} unique ({:.1%} duplicates), {} read in {} blocks, {} memory-mapped".format(
+            pixels, unique, 1 - unique / inside if inside else 0.0, counters.get('pixels_read', 0), counters.get('blocks_read', 0),
+            counters.get('memory_mapped_pixels', 0)
+        ))
+        hits, misses = counters.get('cache_hits', 0), counters.get('cache_misses', 0)
+        if hits or misses :
+            lines.append("    Pixel cache : {} hits, {} misses ({:.1%} hit rate)".format(hits, misses, hits / (hits + misses)))
+        lines.append("    {} GeoTIFF files opened, {:.1f} MB decompressed".format(
+            counters.get('raster_opens', 0), sum(report['bytes_read'].values()) / 1e6
+        ))
+        for layer, n_bytes in sorted(report['bytes_read'].items()) :
+            lines.append("        {:<40} {:>10.3f} MB".format(layer, n_bytes / 1e6))
+        return "\n".join(lines)
 
-        List all created instances:
-        >>> sherby = CrsDataPoint('Sherbrooke', epsg=3857, x=-8002765.769038227, y=5683742.6823244635)
-        >>> paris = CrsDataPoint('Paris', epsg=4236, x=2.346963, y=48.858885)
-        >>> print(CrsDataPoint.all)
-        [CrsDataPoint(Sherbrooke, epsg=3857, x=-8002765.769038227, y=5683742.6823244635, CrsDataPoint(Paris, epsg=4236, x=2.346963, y=48.858885]
+# Metrics collected by the extraction functions and progress messages switch (both disabled by default)
+metrics = None
+verbose = False
+_no_stage = contextlib.nullcontext()
+
+def set_metrics(extraction_metrics):
+    """
+    Function that enables (or disables with None) the collection of the extraction metrics (see ExtractionMetrics).
+    When disabled, the instrumented hot paths only check that metrics is None.
+
+    Returns
+    -------
+    metrics : ExtractionMetrics
+        The enabled metrics (None if disabled)
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import ExtractionMetrics, set_metrics
+    >>> metrics = set_metrics(ExtractionMetrics(callback=lambda stage, seconds : print(stage, seconds)))
+    """
+    global metrics
+    metrics = extraction_metrics
+    return metrics
+
+def set_verbose(enabled):
+    """
+    Function that enables or disables the progress messages printed by the extraction functions (disabled by default).
+    With batch runs of extract_bioclim_elev(), one message is printed per data point.
+    """
+    global verbose
+    verbose = bool(enabled)
+
+# Progress message, printed only if verbose
+def _progress(*message):
+    if verbose :
+        print(*message)
+
+# Stage timer of the enabled metrics (no-op context if disabled)
+def _timed(stage):
+    return metrics.stage(stage) if metrics is not None else _no_stage
+
+# Per-thread state of a RasterPool : opened handles (LRU order) and the pool generation they belong to
+class _ThreadHandles :
+    __slots__ = ('handles', 'generation', '__weakref__')
+
+    def __init__(self, generation) :
+        self.handles = OrderedDict()
+        self.generation = generation
+
+class RasterPool :
+    """
+    A bounded pool of opened rasterio datasets (GeoTIFF handles) shared by all the extraction functions
+
+    ...
+
+    Handles are kept open between calls so that the GeoTIFF header, tile index and CRS are only parsed once.
+    GDAL datasets must not be used by several threads at the same time : each thread gets its own handles, and only closes its own.
+    When a thread holds maxsize handles, or all the threads together hold max_total handles, the least recently used (LRU) handles
+    of the calling thread are closed to make room for a new one. The handles of a thread are closed when the thread ends,
+    close() invalidates the handles of the other threads, which close them on their next call. All the remaining handles are closed at interpreter exit.
+
+    Attributes
+    ----------
+    maxsize : int
+        maximum number of datasets kept open at the same time by each thread
+    max_total : int
+        maximum number of datasets kept open at the same time by all the threads
+
+    Methods
+    -------
+    get(path):
+        Returns the opened dataset for the given file path, opening it if it is not already in the pool.
+
+    close():
+        Closes the opened datasets of the calling thread and invalidates those of the other threads.
+    """
+
+    def __init__(self, maxsize=40, max_total=160) :
         """
-        self.id = id
-        self.epsg = epsg
-        self.x = x
-        self.y = y
-        self.xy_pt = (self.x, self.y)
+        Constructor for RasterPool object.
 
-        # Append each instance of CrsDataPoint to all list upon creation
-        CrsDataPoint.all.append(self)
+        Parameters
+        ----------
+        maxsize : int
+            maximum number of datasets kept open at the same time by each thread (default is 40, enough for the Chelsa + WorldClim layers)
+        max_total : int
+            maximum number of datasets kept open at the same time by all the threads (default is 160, all the layers in 4 threads)
+        """
+        if not isinstance(maxsize, int) or maxsize < 1 :
+            raise ValueError("maxsize must be a positive integer")
+        if not isinstance(max_total, int) or max_total < maxsize :
+            raise ValueError("max_total must be an integer greater than or equal to maxsize")
+        self.maxsize = maxsize
+        self.max_total = max_total
+        self._reset()
+        atexit.register(self._close_all)
 
-    @classmethod
-    def load_csv(cls, csvfile):
+    def _reset(self) :
+        # Handles of the current thread + registry of the handles of all the live threads
+        self._local = threading.local()
+        self._threads = {}
+        self._total = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _thread_handles(self) :
+        # GDAL handles cannot be shared with a forked process : start from an empty pool in the child
+        if self._pid != os.getpid() :
+            self._reset()
+        state = getattr(self._local, 'state', None)
+        if state is None :
+            state = self._local.state = _ThreadHandles(self._generation)
+            with self._lock :
+                self._threads[id(state)] = state.handles
+            # The thread local state is released when the thread ends : close its handles
+            weakref.finalize(state, self._release, id(state), self._pid)
+        elif state.generation != self._generation :
+            self._close_handles(state.handles)
+            state.generation = self._generation
+        return state.handles
+
+    def _close_handles(self, handles, keep=0) :
+        while len(handles) > keep :
+            _, tiff = handles.popitem(last=False)
+            tiff.close()
+            with self._lock :
+                self._total -= 1
+
+    def _release(self, key, pid) :
+        if pid != self._pid :
+            return
+        with self._lock :
+            handles = self._threads.pop(key, None)
+        if handles is not None :
+            self._close_handles(handles)
+
+    def __len__(self) :
+        return self._total
+
+    def __repr__(self) :
+        return f"RasterPool(maxsize={self.maxsize}, max_total={self.max_total}, open={len(self)})"
+
+    def get(self, path) :
         """
-        Instantiate CrsDataPoint objects into a list by parsing a csv file containing the attributes.
+        Returns the opened dataset for the given file path, opening it if it is not already in the pool.
 
         Parameters
         ----------
-        csvfile : .csv
-            .csv file containing attributes for CrsDataPoint. Header be included and follow this order : 
-            id, epsg, x, y,
+        path : str or Path
+            Path of the GeoTIFF file
 
         Returns
         -------
-        [CrsDataPoint(id,epsg,x,y)] : list
-            List of all CrsDataPoint instances created from the csv file containing data. 
-        
+        tiff : rasterio DatasetReader
+            Opened dataset, must not be closed by the caller
 
         Examples
         --------
-        >>> from scripts.data_extraction import CrsDataPoint
-        >>> from pathlib import Path
-        >>> csv_file = Path("./data/cities.csv")
-        >>> data = CrsDataPoint.load_csv(csv_file)
-        >>> print(data)
-        [CrsDataPoint(sherby, epsg=3857, x=-8002765.769038227, y=5683742.6823244635, CrsDataPoint(paris, epsg=4326, x=2.346963, y=48.858885]
+        >>> from scripts.data_extraction import raster_pool, data_dir
+        >>> tiff = raster_pool.get(data_dir / "wc2.1_30s_elev.tif")
+        >>> print(raster_pool)
+        RasterPool(maxsize=40, max_total=160, open=1)
         """
-        with open(csvfile, 'r') as file:
-            reader = csv.DictReader(file)
-            # Loop through csv and instantiate objects with proper types
-            return [CrsDataPoint(
-                id = row['id'],
-                epsg = int(row['epsg']),
-                x = float(row['x']),
-                y = float(row['y']))
-                for row in reader]
+        key = str(path)
+        handles = self._thread_handles()
+        if key in handles :
+            handles.move_to_end(key)
+            return handles[key]
+        with _timed("open") :
+            tiff = rasterio.open(path)
+        if metrics is not None :
+            metrics.add('raster_opens')
+        handles[key] = tiff
+        with self._lock :
+            self._total += 1
+            excess = max(len(handles) - self.maxsize, self._total - self.max_total)
+        # Evict the least recently used handles of this thread (the new one is kept)
+        if excess > 0 :
+            self._close_handles(handles, keep=max(len(handles) - excess, 1))
+        return tiff
 
-    @property
-    def epsg(self) :
-        return self._epsg
-    @property
-    def x(self) : 
-        return self._x
-    @property
-    def y(self) : 
-        return self._y
+    def close(self) :
+        """
+        Closes the opened datasets of the calling thread. The datasets of the other threads are closed by each thread on its next call.
+        """
+        with self._lock :
+            self._generation += 1
+        state = getattr(self._local, 'state', None)
+        if state is not None and self._pid == os.getpid() :
+            self._close_handles(state.handles)
+            state.generation = self._generation
 
-    @epsg.setter
-    def epsg(self, value):
-        if not isinstance(value, int):
-            raise TypeError("EPSG code must be an integer.")
-        if value not in EPSG_codes :
-            raise ValueError(
-                "Input EPSG code not valid, ",
-                "see https://pyproj4.github.io/pyproj/stable/api/database.html#pyproj.database.get_codes"
-            )   
-        else :
-            self._epsg = value
-    @x.setter
-    def x(self, value) :
-        if not isinstance(value, float):
-            raise TypeError("x value must be a float")
-        else : 
-            self._x = value
-    @y.setter
-    def y(self, value) :
-        if not isinstance(value, float):
-            raise TypeError("y value must be a float") 
-        else : 
-            self._y = value 
+    def _close_all(self) :
+        # Interpreter exit : no thread is reading anymore
+        if self._pid != os.getpid() :
+            return
+        with self._lock :
+            threads = list(self._threads.values())
+        for handles in threads :
+            self._close_handles(handles)
+
+# Shared pool of opened GeoTIFF files
+raster_pool = RasterPool()
+
+# Manifest of the prepared GeoTIFF files, reloaded when modified
+_manifest = {'mtime' : None, 'files' : {}}
+
+def _load_manifest():
+    manifest_file = prepared_dir / "manifest.json"
+    try :
+        mtime = manifest_file.stat().st_mtime_ns
+    except OSError :
+        return {}
+    if mtime != _manifest['mtime'] :
+        with open(manifest_file) as f :
+            _manifest['files'] = json.load(f)
+        _manifest['mtime'] = mtime
+    return _manifest['files']
+
+# Prepared copy is stale if the source file changed (still used if the source was deleted)
+def _is_fresh(filename, source_size, source_mtime):
+    source = data_dir / filename
+    if source.is_file() :
+        stat = source.stat()
+        return (stat.st_size, stat.st_mtime_ns) == (source_size, source_mtime)
+    return True
+
+def raster_path(filename):
+    """
+    Function that returns the path of the GeoTIFF file to read for a dataset filename (from config.yaml).
+    The optimized copy listed in the prepared/manifest.json file (see prepare.py) is used when it exists and its source file was not modified since,
+    otherwise the original file in the data directory is used.
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import raster_path
+    >>> raster_path("wc2.1_30s_elev.tif")
+    PosixPath('data/bioclim/prepared/wc2.1_30s_elev.tif')
+    """
+    entry = _load_manifest().get(filename)
+    if (
+        entry is None or 'bands' in entry or not (prepared_dir / entry['prepared']).is_file()
+        or not _is_fresh(filename, entry['source_size'], entry['source_mtime'])
+    ) :
+        return data_dir / filename
+    return prepared_dir / entry['prepared']
+
+def cube_path(filenames):
+    """
+    Function that returns the multi-band cube (see prepare.py) containing the most of the given dataset filenames, if one was built and is up to date.
+
+    Parameters
+    ----------
+    filenames : list
+        Names of the GeoTIFF files (from config.yaml)
+
+    Returns
+    -------
+    cube : dict
+        Path of the cube ('path') and the 'filenames' it contains with their band index ('bands'), original 'dtypes' and 'nodata' values
+        (None if no cube contains at least 2 of the filenames)
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import cube_path
+    >>> cube_path(["wc2.1_30s_bio_1.tif", "wc2.1_30s_bio_2.tif"])['bands']
+    [1, 2]
+    """
+    best = None
+    for entry in _load_manifest().values() :
+        if 'bands' not in entry or not (prepared_dir / entry['prepared']).is_file() :
+            continue
+        if not all(_is_fresh(band['filename'], band['source_size'], band['source_mtime']) for band in entry['bands']) :
+            continue
+        bands = {band['filename'] : (i+1, band) for i, band in enumerate(entry['bands'])}
+        covered = [filename for filename in filenames if filename in bands]
+        if len(covered) >= 2 and (best is None or len(covered) > len(best['filenames'])) :
+            best = {
+                'path' : prepared_dir / entry['prepared'],
+                'filenames' : covered,
+                'bands' : [bands[filename][0] for filename in covered],
+                'dtypes' : [bands[filename][1]['dtype'] for filename in covered],
+                'nodata' : [bands[filename][1]['nodata'] for filename in covered],
+            }
+    return best
+
+class PixelCache :
+    """
+    A persistent (SQLite) cache of raw pixel values, shared by all the extraction functions once enabled with set_pixel_cache()
+
+    ...
+
+    Values are keyed by the identity of the GeoTIFF file (resolved path + size + modification time) and by the pixel row/col index,
+    so all the data points falling in the same pixel share an entry and a modified file is never read from stale entries.
+    The number of entries is kept in a one-row meta table updated in the same transaction as the pixels (no COUNT(*) per write).
+    When the cache holds more than max_entries values, the oldest entries are deleted in one batch, down to 90% of max_entries.
+
+    Attributes
+    ----------
+    path : Path
+        path of the SQLite database file
+    max_entries : int
+        maximum number of pixel values kept in the cache
+
+    Methods
+    -------
+    get_many(raster_path, width, rows, cols, band):
+        Returns the cached values of the pixels and a mask of the pixels found in the cache.
+
+    put_many(raster_path, width, rows, cols, values, band):
+        Stores the values of the pixels, deleting the oldest entries if the cache is full.
+
+    clear():
+        Deletes all the cached values.
+    """
+
+    # Max number of pixels per SELECT ... IN (...) query
+    query_size = 10000
+
+    def __init__(self, path, max_entries=50000000) :
+        """
+        Constructor for PixelCache object.
+
+        Parameters
+        ----------
+        path : str or Path
+            path of the SQLite database file, created if it does not exist
+        max_entries : int
+            maximum number of pixel values kept in the cache (default is 50 000 000, ~1.5 GB on disk)
+        """
+        if not isinstance(max_entries, int) or max_entries < 1 :
+            raise ValueError("max_entries must be a positive integer")
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connect()
+        atexit.register(self.close)
+
+    def _connect(self) :
+        self._pid = os.getpid()
+        self._file_ids = {}
+        self._connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self._connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS files (
+                file_id INTEGER PRIMARY KEY, path TEXT, size INTEGER, mtime INTEGER, UNIQUE(path, size, mtime)
+            );
+            CREATE TABLE IF NOT EXISTS pixels (
+                file_id INTEGER, pixel INTEGER, value REAL, PRIMARY KEY(file_id, pixel)
+            );
+            CREATE TABLE IF NOT EXISTS meta (n_entries INTEGER);
+        """)
+        # Entries counted once when the meta table is created (e.g. cache written by a previous version)
+        if self._connection.execute("SELECT COUNT(*) FROM meta").fetchone()[0] == 0 :
+            self._connection.execute("INSERT INTO meta SELECT COUNT(*) FROM pixels")
+            self._connection.commit()
+
+    def __repr__(self) :
+        return f"PixelCache({str(self.path)!r}, max_entries={self.max_entries})"
+
+    def _file_id(self, raster_path, band=1) :
+        # Identity of the GeoTIFF file (+ band of multi-band files) : entries of a previous version of the file are dropped
+        raster_path = Path(raster_path).resolve()
+        stat = raster_path.stat()
+        identity = (str(raster_path) if band == 1 else f"{raster_path}:{band}", stat.st_size, stat.st_mtime_ns)
+        if identity not in self._file_ids :
+            row = self._connection.execute(
+                "SELECT file_id FROM files WHERE path=? AND size=? AND mtime=?", identity
+            ).fetchone()
+            if row is None :
+                stale = [file_id for (file_id,) in self._connection.execute(
+                    "SELECT file_id FROM files WHERE path=?", identity[:1]
+                )]
+                for file_id in stale :
+                    n_deleted = self._connection.execute("DELETE FROM pixels WHERE file_id=?", (file_id,)).rowcount
+                    self._connection.execute("UPDATE meta SET n_entries = n_entries - ?", (n_deleted,))
+                    self._connection.execute("DELETE FROM files WHERE file_id=?", (file_id,))
+                row = (self._connection.execute("INSERT INTO files (path, size, mtime) VALUES (?,?,?)", identity).lastrowid,)
+                self._connection.commit()
+            self._file_ids[identity] = row[0]
+        return self._file_ids[identity]
+
+    def _check_process(self) :
+        # SQLite connections cannot be shared with a forked process : reconnect in the child
+        if self._pid != os.getpid() :
+            self._lock = threading.Lock()
+            self._connect()
+
+    def get_many(self, raster_path, width, rows, cols, band=1) :
+        """
+        Returns the cached values of the pixels and a mask of the pixels found in the cache.
+
+        Parameters
+        ----------
+        raster_path : str or Path
+            Path of the GeoTIFF file
+        width : int
+            Width (number of columns) of the raster
+        rows, cols : numpy arrays
+            Row and column pixel indices
+        band : int
+            Band index (default is 1)
+
+        Returns
+        -------
+        values : numpy array
+            Cached values (as floats, NaN where not found)
+        found : numpy array
+            Boolean mask of the pixels found in the cache
+        """
+        values = np.full(len(rows), np.nan)
+        found = np.zeros(len(rows), dtype=bool)
+        if not len(rows) :
+            return values, found
+        pixels = rows.astype(np.int64) * width + cols
+        unique_pixels = np.unique(pixels).tolist()
+        self._check_process()
+        with self._lock :
+            file_id = self._file_id(raster_path, band)
+            hits = []
+            for start in range(0, len(unique_pixels), self.query_size) :
+                chunk = unique_pixels[start:start + self.query_size]
+                hits += self._connection.execute(
+                    "SELECT pixel, value FROM pixels WHERE file_id=? AND pixel IN ({})".format(",".join("?" * len(chunk))),
+                    [file_id] + chunk
+                ).fetchall()
+        # Scatter the hits back to the requested pixels
+        if hits :
+            hits = np.array(hits, dtype=[('pixel', np.int64), ('value', float)])
+            hits.sort(order='pixel')
+            positions = np.clip(np.searchsorted(hits['pixel'], pixels), 0, len(hits) - 1)
+            found = hits['pixel'][positions] == pixels
+            values[found] = hits['value'][positions[found]]
+        return values, found
+
+    def put_many(self, raster_path, width, rows, cols, values, band=1) :
+        """
+        Stores the values of the pixels, deleting the oldest entries (down to 90% of max_entries) if the cache is full.
+        """
+        if not len(rows) :
+            return
+        pixels = rows.astype(np.int64) * width + cols
+        self._check_process()
+        with self._lock :
+            file_id = self._file_id(raster_path, band)
+            # Pixels of a file identity never change : entries already cached are kept
+            n_inserted = self._connection.executemany(
+                "INSERT OR IGNORE INTO pixels VALUES (?,?,?)",
+                zip(itertools.repeat(file_id), pixels.tolist(), np.asarray(values, dtype=float).tolist())
+            ).rowcount
+            self._connection.execute("UPDATE meta SET n_entries = n_entries + ?", (n_inserted,))
+            n_entries = self._connection.execute("SELECT n_entries FROM meta").fetchone()[0]
+            # Oldest entries have the smallest (implicit) rowid
+            if n_entries > self.max_entries :
+                n_deleted = self._connection.execute(
+                    "DELETE FROM pixels WHERE rowid IN (SELECT rowid FROM pixels ORDER BY rowid LIMIT ?)",
+                    (n_entries - self.max_entries * 9 // 10,)
+                ).rowcount
+                self._connection.execute("UPDATE meta SET n_entries = n_entries - ?", (n_deleted,))
+            self._connection.commit()
+
+    def clear(self) :
+        """
+        Deletes all the cached values.
+        """
+        self._check_process()
+        with self._lock :
+            self._connection.execute("DELETE FROM pixels")
+            self._connection.execute("DELETE FROM files")
+            self._connection.execute("UPDATE meta SET n_entries = 0")
+            self._connection.commit()
+            self._file_ids = {}
+
+    def close(self) :
+        """
+        Closes the connection to the SQLite database.
+        """
+        if self._pid == os.getpid() :
+            self._connection.close()
+
+# Pixel cache used by the extraction functions (disabled by default)
+pixel_cache = None
+
+def set_pixel_cache(path, max_entries=50000000):
+    """
+    Function that enables (or disables with path=None) the persistent pixel cache used by the extraction functions.
+
+    Parameters
+    ----------
+    path : str or Path
+        Path of the SQLite database file, or None to disable the cache
+    max_entries : int
+        Maximum number of pixel values kept in the cache (default is 50 000 000)
+
+    Returns
+    -------
+    pixel_cache : PixelCache
+        The enabled cache (None if disabled)
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import set_pixel_cache
+    >>> set_pixel_cache("./data/bioclim/pixel_cache.sqlite")
+    PixelCache('data/bioclim/pixel_cache.sqlite', max_entries=50000000)
+    """
+    global pixel_cache
+    if pixel_cache is not None :
+        pixel_cache.close()
+    pixel_cache = PixelCache(path, max_entries) if path is not None else None
+    return pixel_cache
+
+class RasterArray :
+    """
+    A raster band decompressed once to a raw .npy file and memory-mapped as a read-only NumPy array, so that point lookups are plain
+    index arithmetic on the array (no GDAL call). The pages of the array are shared by all processes through the OS page cache.
+
+    Attributes
+    ----------
+    source : Path
+        Path of the GeoTIFF file
+    array : numpy memmap
+        Raw pixel values of the first band, of shape (height, width)
+    transform : Affine
+        Affine transform of the raster
+    width, height : int
+        Size of the raster
+    nodata : float
+        Nodata value of the raster (None if not set)
+    crs : CRS
+        Coordinate reference system of the raster
+
+    Methods
+    -------
+    read(rows, cols):
+        Returns the raw values of the pixels.
+
+    sample(coords, mode, size, radius):
+        Returns the raw (or aggregated) pixel values at the coordinates.
+    """
+    __slots__ = ('source', 'array', 'transform', 'width', 'height', 'nodata', 'crs')
+
+    def __init__(self, source, raw_dir, name=None) :
+        self.source = Path(source)
+        # Raw files named after the GeoTIFF file unless another name is given
+        name = name or self.source.stem
+        raw_file = Path(raw_dir) / (name + ".npy")
+        info_file = Path(raw_dir) / (name + ".json")
+        stat = self.source.stat()
+        identity = {'source' : str(self.source.resolve()), 'size' : stat.st_size, 'mtime' : stat.st_mtime_ns}
+        info = None
+        if raw_file.is_file() and info_file.is_file() :
+            with open(info_file) as f :
+                info = json.load(f)
+        # Decompressed again if the GeoTIFF file changed
+        if info is None or info['identity'] != identity or 'crs' not in info :
+            info = self._decompress(raw_file, info_file, identity)
+        self.array = np.load(raw_file, mmap_mode='r')
+        self.transform = rasterio.Affine(*info['transform'])
+        self.height, self.width = self.array.shape
+        self.nodata = info['nodata']
+        self.crs = rasterio.crs.CRS.from_wkt(info['crs']) if info['crs'] else None
+
+    def __repr__(self) :
+        return f"RasterArray({str(self.source)!r}, shape={self.array.shape}, dtype={self.array.dtype})"
+
+    def _decompress(self, raw_file, info_file, identity) :
+        os.makedirs(raw_file.parent, exist_ok=True)
+        # Temporary files unique to the process : several processes may decompress the same file at the same time
+        part = ".{}.part".format(os.getpid())
+        with rasterio.open(self.source) as tiff :
+            array = np.lib.format.open_memmap(
+                str(raw_file)+part, mode='w+', dtype=tiff.dtypes[0], shape=(tiff.height, tiff.width)
+            )
+            # One row of blocks at a time
+            block_height = tiff.block_shapes[0][0]
+            for row_off in range(0, tiff.height, block_height) :
+                window = rasterio.windows.Window(0, row_off, tiff.width, min(block_height, tiff.height - row_off))
+                array[row_off:row_off + window.height] = tiff.read(1, window=window)
+            array.flush()
+            del array
+            info = {
+                'identity' : identity, 'transform' : list(tiff.transform)[:6], 'nodata' : tiff.nodata,
+                'crs' : tiff.crs.to_wkt() if tiff.crs else None,
+            }
+        os.replace(str(raw_file)+part, raw_file)
+        with open(str(info_file)+part, 'w') as f :
+            json.dump(info, f)
+        os.replace(str(info_file)+part, info_file)
+        return info
+
+    def read(self, rows, cols) :
+        """
+        Returns the raw values of the pixels at the row and column indices (nodata value or 0 outside of the raster).
+        """
+        values = np.full(len(rows), self.nodata or 0, dtype=self.array.dtype)
+        inside = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+        values[inside] = self.array[rows[inside], cols[inside]]
+        if metrics is not None :
+            metrics.add('memory_mapped_pixels', int(inside.sum()))
+            metrics.add_bytes(self.source.name, int(inside.sum()) * self.array.itemsize)
+        return values
+
+    def sample(self, coords, mode="nearest", size=3, radius=None) :
+        """
+        Returns the pixel values at the coordinates (same values as sample_raster() on the GeoTIFF file).
+
+        Parameters
+        ----------
+        coords : list or numpy array
+            List of (x,y) tuples (or array of shape (n, 2)) in the CRS of the raster
+        mode, size, radius :
+            Sampling mode, window size (in pixels) and radius (in metres), see sample_raster() (default is "nearest", 3, None)
+
+        Returns
+        -------
+        values : numpy array
+            Raw (uncorrected) pixel values in the same order as the input coordinates, nodata value (or 0) outside of the raster,
+            or aggregated values (floats) for the window modes
+        """
+        if mode == "nearest" :
+            # Same inverse affine transform + floor as rasterio's rowcol()
+            frows, fcols = fractional_index(self.transform, coords)
+            return self.read(np.floor(frows).astype(int), np.floor(fcols).astype(int))
+        values = np.full(len(coords), np.nan)
+        for positions, rows, cols, weights in window_groups(self, coords, mode, size, radius) :
+            values[positions] = aggregate_window(self.read(rows.ravel(), cols.ravel()).reshape(rows.shape), weights, mode, self.nodata)
+        return values
+
+# Memory-mapped mode settings : (raw array directory, selected filenames or None for all), disabled if None
+memory_map = None
+_raster_arrays = {}
+_raster_arrays_lock = threading.Lock()
+
+def set_memory_map(path, filenames=None):
+    """
+    Function that enables (or disables with path=None) the memory-mapped mode used by the extraction functions : the selected layers
+    are decompressed to raw .npy files on first use and then sampled from memory-mapped NumPy arrays (see RasterArray).
+
+    Parameters
+    ----------
+    path : str or Path
+        Directory of the raw .npy files, or None to disable the memory-mapped mode
+    filenames : list
+        Names of the GeoTIFF files (from config.yaml) to memory-map, all the layers if None (default is None)
+
+    Returns
+    -------
+    memory_map : tuple
+        The (path, filenames) settings (None if disabled)
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import set_memory_map
+    >>> set_memory_map("./data/bioclim/raw", ["wc2.1_30s_elev.tif"])
+    (PosixPath('data/bioclim/raw'), frozenset({'wc2.1_30s_elev.tif'}))
+    """
+    global memory_map
+    with _raster_arrays_lock :
+        _raster_arrays.clear()
+        memory_map = (Path(path), frozenset(filenames) if filenames is not None else None) if path is not None else None
+    return memory_map
+
+def raster_array(filename):
+    """
+    Function that returns the memory-mapped RasterArray of a dataset filename (from config.yaml),
+    or None if the memory-mapped mode is disabled (see set_memory_map()) or the file is not selected.
+    """
+    if memory_map is None :
+        return None
+    raw_dir, filenames = memory_map
+    if filenames is not None and filename not in filenames :
+        return None
+    array = _raster_arrays.get(filename)
+    if array is None :
+        with _raster_arrays_lock :
+            array = _raster_arrays.get(filename)
+            if array is None :
+                # Regional files ("regions/<name>/<filename>") get their own raw files
+                array = _raster_arrays[filename] = RasterArray(
+                    raster_path(filename), raw_dir, name=Path(filename).with_suffix("").as_posix().replace("/", "_")
+                )
+    return array
+
+class _WeakInstanceList :
+    """
+    List-like registry of live instances. Instances are weakly referenced so they are garbage collected
+    as soon as they are not used anymore, instead of being kept alive forever by the registry.
+    """
+
+    def __init__(self) :
+        self._refs = weakref.WeakValueDictionary()
+        self._counter = itertools.count()
+
+    def append(self, instance) :
+        self._refs[next(self._counter)] = instance
+
+    def __iter__(self) :
+        return iter(list(self._refs.values()))
+
+    def __len__(self) :
+        return len(self._refs)
+
+    def __getitem__(self, index) :
+        return list(self)[index]
+
+    def __repr__(self) :
+        return repr(list(self))
+
+class CrsDataPoint :
+    """
+    A class to represent, transform and extract information of a data point under a geographic coordinate system standard (CRS) 
+
+    ...
+
+    A CrsDataPoint is a thin view over a single point of a CrsPointCollection (its own single-point collection when created directly).
+
+    Attributes
+    ----------
+    all : list
+        list of all the instances of CrsDataPoint created (and still in use)
+    id : str
+        identifier of single specimen data point
+    epsg : int
+        EPSG Geodetic Parameter Dataset code of the coordinate reference system (CRS)
+    x : float
+        x-value (equivalent of East-West latitude lines) of the CRS
+    y : float
+        y-value (equivalent of North-Sound longitude lines) of the CRS
+    xy_pt : tuple
+        x,y in tuple format
+
+    Methods
+    -------
+    load_csv(csvfile):
+        Instantiate CrsDataPoint objects into a list by parsing a csv file containing the attributes.
+
+    __repr__():
+        Lists all of created instances of CrsDataPoint objects
+
+    get_info():
+        Prints the CrsDataPoint information
+
+    transform_crs(epsg_out):
+        Transforms the coordinates to the desired EPSG coordinate reference system
+
+    df_to_dict(df):
+        Takes the input df and returns a dictionnary of CrsDataPoint objects.
+        Calls transform_crs() method if any epsg codes are not 4326.
+
+    extract_bioclim_elev(dataset):
+        Extracts the pixel values from the specified GeoTIFF file. Calls transform_crs() method if needed.
+    """
+
+    __slots__ = ('_points', '_index', '__weakref__')
+
+    all = _WeakInstanceList()
+
+    def __init__(self, id, epsg, x, y,) :
+        """
+        Constructor for CrsDataPoint object.
+
+        Parameters
+        ----------
+        id : str
+            identifier of single data point
+        epsg : int
+            EPSG Geodetic Parameter Dataset code of the coordinate reference system (CRS)
+        x : float
+            x-value (equivalent of East-West longitude lines for EPSG:4326) of the CRS
+        y : float
+            y-value (equivalent of North-Sound latitude lines for EPSG:4326) of the CRS
+
+        Examples
+        --------
+        Create an instance for a single specimen:
+        >>> from data_extraction import CrsDataPoint
+        >>> sherby = CrsDataPoint('Sherbrooke', epsg=4326, x=-71.890068, y=45.393869)
+        >>> print(sherby)
+        id : Sherbrooke
+        EPSG : 4326
+        Map coordinates :
+            x = -71.890068
+            y = 45.393869
+            (x,y) = (-71.890068, 45.393869)
+
+        List all created instances:
+        >>> sherby = CrsDataPoint('Sherbrooke', epsg=3857, x=-8002765.769038227, y=5683742.6823244635)
+        >>> paris = CrsDataPoint('Paris', epsg=4236, x=2.346963, y=48.858885)
+        >>> print(CrsDataPoint.all)
+        [CrsDataPoint(Sherbrooke, epsg=3857, x=-8002765.769038227, y=5683742.6823244635, CrsDataPoint(Paris, epsg=4236, x=2.346963, y=48.858885]
+        """
+        CrsDataPoint._check_types(epsg, x, y)
+        self._points = CrsPointCollection([id], [epsg], [x], [y])
+        self._index = 0
+
+        # Append each instance of CrsDataPoint to all list upon creation
+        CrsDataPoint.all.append(self)
+
+    @classmethod
+    def _view(cls, points, index) :
+        # Point of an existing CrsPointCollection (no copy of the data)
+        view = cls.__new__(cls)
+        view._points = points
+        view._index = index
+        return view
+
+    @staticmethod
+    def _check_types(epsg, x, y) :
+        if not isinstance(epsg, (int, np.integer)):
+            raise TypeError("EPSG code must be an integer.")
+        if not isinstance(x, float):
+            raise TypeError("x value must be a float")
+        if not isinstance(y, float):
+            raise TypeError("y value must be a float")
+
+    @classmethod
+    def load_csv(cls, csvfile):
+        """
+        Instantiate CrsDataPoint objects into a list by parsing a csv file containing the attributes.
+        The points are views over a single CrsPointCollection (see CrsPointCollection.from_csv()).
+
+        Parameters
+        ----------
+        csvfile : .csv
+            .csv file containing attributes for CrsDataPoint. Header be included and follow this order : 
+            id, epsg, x, y,
+
+        Returns
+        -------
+        [CrsDataPoint(id,epsg,x,y)] : list
+            List of all CrsDataPoint instances created from the csv file containing data. 
+        
+
+        Examples
+        --------
+        >>> from scripts.data_extraction import CrsDataPoint
+        >>> from pathlib import Path
+        >>> csv_file = Path("./data/cities.csv")
+        >>> data = CrsDataPoint.load_csv(csv_file)
+        >>> print(data)
+        [CrsDataPoint(sherby, epsg=3857, x=-8002765.769038227, y=5683742.6823244635, CrsDataPoint(paris, epsg=4326, x=2.346963, y=48.858885]
+        """
+        data_points = list(CrsPointCollection.from_csv(csvfile))
+        for data_point in data_points :
+            CrsDataPoint.all.append(data_point)
+        return data_points
+
+    @property
+    def id(self) :
+        return self._points.ids[self._index]
+    @property
+    def epsg(self) :
+        return int(self._points.epsg[self._index])
+    @property
+    def x(self) : 
+        return float(self._points.x[self._index])
+    @property
+    def y(self) : 
+        return float(self._points.y[self._index])
+    @property
+    def xy_pt(self) :
+        return (self.x, self.y)
+
+    @id.setter
+    def id(self, value) :
+        self._points.ids[self._index] = value
+    @epsg.setter
+    def epsg(self, value):
+        if not isinstance(value, int):
+            raise TypeError("EPSG code must be an integer.")
+        if value not in get_epsg_codes() :
+            raise ValueError(
+                "Input EPSG code not valid, ",
+                "see https://pyproj4.github.io/pyproj/stable/api/database.html#pyproj.database.get_codes"
+            )   
+        else :
+            self._points.epsg[self._index] = value
+    @x.setter
+    def x(self, value) :
+        if not isinstance(value, float):
+            raise TypeError("x value must be a float")
+        else : 
+            self._points.x[self._index] = value
+    @y.setter
+    def y(self, value) :
+        if not isinstance(value, float):
+            raise TypeError("y value must be a float") 
+        else : 
+            self._points.y[self._index] = value 
+
+    def __repr__(self):
+        return f"CrsDataPoint({self.id}, epsg={self.epsg}, x={self.x}, y={self.y})"
+            
+    def get_info(self):
+        """
+        Prints the CrsDataPoint object information. 
+        """
+        return print(
+            "id : {}\nEPSG : {}\nMap coordinates :\n\tx = {}\n\ty = {}\n\t(x,y) = {}"
+            .format(self.id, self.epsg, self.x, self.y, self.xy_pt)
+            )
+
+    def transform_crs(self, epsg_out=4326):
+        """
+        Transforms the coordinates to the desired EPSG coordinate reference system. 
+        Default argument is EPSG:4326 which is the reference for the WorldClim and Chelsa datasets
+        
+        Parameters
+        ----------
+        epsg_out : int
+            EPSG Geodetic Parameter Dataset code of the coordinate reference system (CRS) (default is 4326)
+
+        Returns
+        -------
+        CrsDataPoint object with updated x-y values for the given EPSG code. 
+        With default arg it will output the following x/y values :
+        x_out : float
+            longitude (x-value, North-South lines) that range between -180 and +180 degrees.
+        y_out : float
+            latitude (y-value, East-West lines) that range between -90 and +90 degrees.
+
+        Examples
+        --------
+        >>> sherby = CrsDataPoint('Sherbrooke', epsg=3857, x=-8002765.769038227, y=5683742.6823244635)
+        >>> sherby_gps = sherby.transform_crs()
+        >>> print(sherby_gps)
+        id : Sherbrooke_transformed
+        EPSG : 4326
+        Map coordinates :
+            x = -71.89006805555556
+            y = 45.39386888888889
+            (x,y) = (-71.89006805555556, 45.39386888888889)
+
+        """
+        # Check if code valid
+        if epsg_out not in get_epsg_codes():
+            raise ValueError("Input EPSG code not valid, see https://pyproj4.github.io/pyproj/stable/api/database.html#pyproj.database.get_codes")
+        
+        # Call transform method from the cached pyproj transformer
+        with _timed("transform") :
+            x_out, y_out = get_transformer(self.epsg, epsg_out).transform(self.x, self.y)
+        return CrsDataPoint(self.id+"_transformed", epsg_out, x_out, y_out)
+
+    def df_to_dict(df) :
+        """
+        Takes the input df and returns a dictionnary of CrsDataPoint objects.
+        Calls transform_crs() method if any epsg codes are not 4326.
+
+        Parameters
+        ----------
+        df : dataframe
+            Input dataframe with the following structure : 
+            {'id' : specimen name(any) , 'epsg' : code(int), 'x' : x-value(float), 'y' : y-value(float)}
+
+        Returns
+        -------
+        Dictionnary of CrsDataPoint objects
+
+        Examples
+        --------
+        >>> df = pd.DataFrame({
+        ...     'id' : ['Sherbrooke', 'Paris'],
+        ...     'epsg' : [3857, 4326],
+        ...     'x' : [-8002765.769038227, 2.346963],
+        ...     'y' : [5683742.6823244635, 48.858885],
+        ...         })
+        >>> cities = CrsDataPoint.df_to_dict(df)
+        Dataframe contains data with CRS other than EPSG:4326. Calling transform_crs()...
+        >>> print(cities['Sherbrooke'])
+        id : Sherbrooke_transformed
+        EPSG : 4326
+        Map coordinates :
+            x = -71.89006805555556
+            y = 45.39386888888889
+            (x,y) = (-71.89006805555556, 45.39386888888889)
+
+        """
+        # Transform all coordinates in bulk (grouped by EPSG code)
+        points = CrsPointCollection.from_df(df)
+        if (points.epsg != 4326).any() == True :
+            _progress("Dataframe contains data with CRS other than EPSG:4326. Calling transform_crs()...")
+        return {id : point for id, point in zip(df['id'], points.to_crs())}
+
+    def extract_bioclim_elev(self, dataset, *, mode="nearest", size=3, radius=None):
+        """
+        Extracts the pixel values (for all bioclim variables) from the specified GeoTIFF file. Calls transform_crs() method if needed. 
+        
+
+        Parameters
+        ----------
+        dataset : string
+            Name of the dataset to extract the data from : "chelsa", "worldclim" or a regional dataset (see clip.py),
+            the values are NaN if the point is outside of the region
+        mode : string
+            Sampling mode : "nearest" pixel, "bilinear" interpolation, or "mean", "median" or "max" of a window around the point (default is "nearest")
+        size : int
+            Size (odd number of pixels) of the square window (default is 3)
+        radius : float
+            Radius (in metres) of the window, replaces size if given (default is None)
+
+        Returns
+        -------
+        A dictionnary containing sample id, epsg, lon(x), lat(y), bio# (Unit) : Corrected (scale + offset where needed) pixel value
+        and elevation_Unit : Elevation value, the same keys as the columns of extract_multiple_bioclim_elev().
+        The longname, explanation and unit of the variables are given by variable_metadata(dataset).
+
+        Examples
+        --------
+        >>> sherby = CrsDataPoint('Sherbrooke', epsg=4326, x=-71.890068, y=45.393869) 
+        >>> sherby_chelsa = sherby.extract_bioclim_elev(dataset='chelsa')
+        >>> import pandas as pd
+        >>> pd.DataFrame([sherby_chelsa])
+                   id  epsg        lon  ...  bio18 (kg / m**2 / month)  bio19 (kg / m**2 / month)  elevation_Meters
+        0  Sherbrooke  4326 -71.890068  ...                      375.8                      243.0               158
+
+        [1 rows x 24 columns]
+        >>> from scripts.data_extraction import variable_metadata
+        >>> variable_metadata('chelsa').loc['bio1 (Celcius)', 'longname']
+        'mean annual air temperature'
+        """
+        columns = _dataset_columns(dataset)
+        check_sampling(mode, size, radius)
+
+        with _timed("extract") :
+            # Calling transform_crs() method to convert coordinates if needed
+            if self.epsg == 4326 :
+                point = self
+            else :
+                _progress("Data point with x,y other than EPSG:4326. Calling transform_crs() method...")
+                point = self.transform_crs()
+            _progress(
+                "Extracting values for {} at lon={:.3f} lat={:.3f}".format(point.id, point.x, point.y),
+                "for all climate variables bio1 to bio19 + elevation in {} dataset...".format(dataset_label(dataset))
+            )
+            raw_values = sample_files(
+                [v['filename'] for v in columns.values()], [point.xy_pt], mode=mode, size=size, radius=radius
+            )
+            # Point outside of a regional dataset, read as nodata : NaN instead
+            if outside_region(dataset, [point.xy_pt])[0] :
+                _progress("{} is outside of the bounds of the {} region, its values are NaN".format(point.id, dataset))
+                raw_values = {filename : np.full(1, np.nan) for filename in raw_values}
+
+            with _timed("dict") :
+                single_pt_clim_data = {
+                    'id' : point.id,
+                    'epsg' : point.epsg,
+                    'lon' : point.x,
+                    'lat' : point.y,
+                }
+                # Numeric values only, corrected with scale + offset where needed (Chelsa)
+                for column, v in columns.items() :
+                    val = raw_values[v['filename']][0]    # Raw pixel value
+                    single_pt_clim_data[column] = val*v['scale']+v['offset'] if 'scale' in v else val
+        if metrics is not None :
+            metrics.add('points')
+        _progress("Done!")
+        return single_pt_clim_data
+
+class CrsPointCollection :
+    """
+    A class to represent a collection of data points as contiguous arrays (columnar storage) instead of a list of CrsDataPoint objects
+
+    ...
+
+    Attributes
+    ----------
+    ids : numpy array
+        identifiers of the data points
+    epsg : numpy array
+        EPSG Geodetic Parameter Dataset codes of the coordinate reference system (CRS) of each data point
+    x : numpy array
+        x-values of the data points
+    y : numpy array
+        y-values of the data points
+
+    Methods
+    -------
+    from_csv(csvfile):
+        Creates a CrsPointCollection from a csv file containing the id, epsg, x, y columns.
+
+    from_df(df):
+        Creates a CrsPointCollection from a dataframe containing the id, epsg, x, y columns.
+
+    from_points(data_points):
+        Creates a CrsPointCollection from a list of CrsDataPoint objects.
+
+    concat(collections):
+        Creates a CrsPointCollection with all the data points of several collections.
+
+    to_crs(epsg_out):
+        Transforms all the coordinates (in bulk) to the desired EPSG coordinate reference system.
+
+    to_df():
+        Returns the collection as a dataframe.
+
+    spatial_index():
+        Returns a SpatialIndex of the data points (in EPSG:4326) for bounding box queries.
+
+    within_bbox(xmin, ymin, xmax, ymax):
+        Returns a new collection with the data points within a lon/lat bounding box.
+
+    Indexing with an integer returns a CrsDataPoint view over the collection (no copy),
+    slicing or indexing with an array of positions (or a boolean mask) returns a new collection.
+    """
+
+    __slots__ = ('ids', 'epsg', 'x', 'y')
+
+    def __init__(self, ids, epsg, x, y) :
+        """
+        Constructor for CrsPointCollection object. All the values are validated in bulk.
+
+        Parameters
+        ----------
+        ids : array-like
+            identifiers of the data points
+        epsg : int or array-like
+            EPSG code(s) of the coordinate reference system (CRS), a single code is used for all data points
+        x : array-like
+            x-values (equivalent of East-West longitude lines for EPSG:4326) of the CRS
+        y : array-like
+            y-values (equivalent of North-Sound latitude lines for EPSG:4326) of the CRS
+
+        Examples
+        --------
+        >>> from scripts.data_extraction import CrsPointCollection
+        >>> cities = CrsPointCollection(['Sherbrooke', 'Paris'], [3857, 4326], [-8002765.769038227, 2.346963], [5683742.6823244635, 48.858885])
+        >>> print(cities)
+        CrsPointCollection(2 points, epsg=[3857, 4326])
+        >>> cities[1]
+        CrsDataPoint(Paris, epsg=4326, x=2.346963, y=48.858885)
+        """
+        self.ids = np.array(ids, dtype=object, ndmin=1)
+        epsg, self.x, self.y = np.asarray(epsg), np.array(x, ndmin=1), np.array(y, ndmin=1)
+        # (Empty columns, e.g. of an empty csv file, have no numeric dtype)
+        if epsg.dtype.kind not in 'iu' and epsg.size :
+            raise TypeError("EPSG codes must be integers.")
+        if (self.x.dtype.kind not in 'iuf' and self.x.size) or (self.y.dtype.kind not in 'iuf' and self.y.size) :
+            raise TypeError("x and y values must be floats")
+        self.x, self.y = self.x.astype(np.float64), self.y.astype(np.float64)
+        self.epsg = np.array(np.broadcast_to(epsg, self.ids.shape), dtype=np.int32)
+        if not len(self.ids) == len(self.x) == len(self.y) :
+            raise ValueError("ids, x and y must have the same length")
+        check_epsg_codes(self.epsg)
+
+    @classmethod
+    def from_csv(cls, csvfile, chunksize=None) :
+        """
+        Creates a CrsPointCollection from a csv file containing the attributes. Header must include : id, epsg, x, y
+        If chunksize is given, returns an iterator of CrsPointCollection of at most chunksize data points, the file being read lazily.
+
+        Examples
+        --------
+        >>> from scripts.data_extraction import CrsPointCollection
+        >>> capitals = CrsPointCollection.from_csv("./data/us-state-capitals.csv")
+        >>> len(capitals)
+        50
+        >>> [len(chunk) for chunk in CrsPointCollection.from_csv("./data/us-state-capitals.csv", chunksize=20)]
+        [20, 20, 10]
+        """
+        options = {'usecols' : ['id', 'epsg', 'x', 'y'], 'dtype' : {'id' : str}, 'float_precision' : 'round_trip'}
+        if chunksize is not None :
+            return cls._csv_chunks(pd.read_csv(csvfile, chunksize=chunksize, **options))
+        return cls.from_df(pd.read_csv(csvfile, **options))
+
+    # Collections of the chunks of a csv reader, the reader is closed when the iterator is closed
+    @classmethod
+    def _csv_chunks(cls, reader) :
+        with reader :
+            for chunk in reader :
+                yield cls.from_df(chunk)
+
+    @classmethod
+    def from_df(cls, df) :
+        """
+        Creates a CrsPointCollection from a dataframe with the following structure :
+        {'id' : specimen name(any) , 'epsg' : code(int), 'x' : x-value(float), 'y' : y-value(float)}
+        """
+        return cls(df['id'].to_numpy(dtype=object), df['epsg'].to_numpy(), df['x'].to_numpy(), df['y'].to_numpy())
+
+    @classmethod
+    def from_points(cls, data_points) :
+        """
+        Creates a CrsPointCollection from a list of CrsDataPoint objects.
+        """
+        data_points = list(data_points)
+        return cls(
+            [data_point.id for data_point in data_points],
+            np.array([data_point.epsg for data_point in data_points], dtype=int),
+            np.array([data_point.x for data_point in data_points], dtype=float),
+            np.array([data_point.y for data_point in data_points], dtype=float),
+        )
+
+    @classmethod
+    def concat(cls, collections) :
+        """
+        Creates a CrsPointCollection with all the data points of several collections, in order.
+        """
+        collections = list(collections)
+        return cls(
+            np.concatenate([collection.ids for collection in collections]),
+            np.concatenate([collection.epsg for collection in collections]),
+            np.concatenate([collection.x for collection in collections]),
+            np.concatenate([collection.y for collection in collections]),
+        )
+
+    def __len__(self) :
+        return len(self.ids)
+
+    def __getitem__(self, index) :
+        if isinstance(index, (slice, list, np.ndarray)) :
+            return CrsPointCollection(self.ids[index], self.epsg[index], self.x[index], self.y[index])
+        return CrsDataPoint._view(self, range(len(self))[index])
+
+    def __iter__(self) :
+        return (CrsDataPoint._view(self, index) for index in range(len(self)))
+
+    def __repr__(self) :
+        return f"CrsPointCollection({len(self)} points, epsg={np.unique(self.epsg).tolist()})"
+
+    @property
+    def coords(self) :
+        """(n, 2) array of the x,y values"""
+        return np.column_stack([self.x, self.y])
+
+    def to_crs(self, epsg_out=4326) :
+        """
+        Transforms all the coordinates to the desired EPSG coordinate reference system with transform_points().
+        As with the transform_crs() method, "_transformed" is appended to the id of the transformed data points.
+
+        Parameters
+        ----------
+        epsg_out : int
+            EPSG Geodetic Parameter Dataset code of the coordinate reference system (CRS) (default is 4326)
+
+        Returns
+        -------
+        New CrsPointCollection with all data points in epsg_out
+
+        Examples
+        --------
+        >>> from scripts.data_extraction import CrsPointCollection
+        >>> cities = CrsPointCollection(['Sherbrooke', 'Paris'], [3857, 4326], [-8002765.769038227, 2.346963], [5683742.6823244635, 48.858885])
+        >>> cities.to_crs()[0]
+        CrsDataPoint(Sherbrooke_transformed, epsg=4326, x=-71.89006805555556, y=45.39386888888889)
+        """
+        x_out, y_out = transform_points(self.x, self.y, self.epsg, epsg_out)
+        transformed = self.epsg != epsg_out
+        ids = self.ids.copy()
+        ids[transformed] = [str(id)+"_transformed" for id in ids[transformed]]
+        return CrsPointCollection(ids, epsg_out, x_out, y_out)
+
+    def to_df(self) :
+        """
+        Returns the collection as a dataframe with id, epsg, x, y columns.
+        """
+        return pd.DataFrame({'id' : self.ids, 'epsg' : self.epsg, 'x' : self.x, 'y' : self.y})
+
+    def spatial_index(self, page_size=256) :
+        """
+        Returns a SpatialIndex of the data points in lon/lat (data points in another CRS are transformed to EPSG:4326).
+        Build it once to run many bounding box queries on the same collection, its query() returns positions in the collection.
+        """
+        points = self if (self.epsg == 4326).all() else self.to_crs()
+        return SpatialIndex(points.x, points.y, page_size)
+
+    def within_bbox(self, xmin, ymin, xmax, ymax) :
+        """
+        Returns a new collection with the data points within the lon/lat bounding box (bounds included), in their original order.
+
+        Examples
+        --------
+        >>> from scripts.data_extraction import CrsPointCollection
+        >>> capitals = CrsPointCollection.from_csv("./data/us-state-capitals.csv")
+        >>> capitals.within_bbox(-80, 40, -70, 45)
+        CrsPointCollection(8 points, epsg=[4326])
+        """
+        return self[self.spatial_index().query(xmin, ymin, xmax, ymax)]
+
+# Precomputed output columns (bio# (Unit) + elevation_Unit) of each dataset with their config.yaml metadata
+@lru_cache(maxsize=None)
+def _dataset_columns(dataset):
+    bioclim_data, elev = dataset_config(dataset)
+    columns = {
+        k+' ('+v['unit']+')' : v for k,v in bioclim_data.items()
+        if re.search("bio[0-9]* ", k+' ('+v['unit']+')')
+    }
+    columns[elev['name']+"_"+elev['unit']] = elev
+    return columns
+
+def variable_metadata(dataset):
+    """
+    Function that returns the metadata (from config.yaml) of the extracted variables for a dataset, one row per output column.
+
+    Parameters
+    ----------
+    dataset : str
+        Name of the dataset : "chelsa", "worldclim" or a regional dataset (see clip.py)
+
+    Returns
+    -------
+    df : pandas DataFrame
+        Metadata indexed by output column name (e.g. "bio1 (Celcius)") with name, longname, unit, explanation, filename
+        (+ scale and offset for the Chelsa bioclim variables) columns
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import variable_metadata
+    >>> variable_metadata('chelsa').loc['bio1 (Celcius)', 'longname']
+    'mean annual air temperature'
+    """
+    return pd.DataFrame.from_dict(_dataset_columns(dataset), orient='index')
+
+# Keys kept by trim_data() : base CrsDataPoint attributes + bioclim/elevation values of both datasets
+@lru_cache(maxsize=None)
+def _trimmed_keys():
+    return frozenset(
+        ['id', 'epsg', 'lon', 'lat'] + list(_dataset_columns("chelsa")) + list(_dataset_columns("worldclim"))
+    )
+
+# Trim data dict with base CrsDataPoint attributes (may be crs_transformed) + bioclim_elev values
+def trim_data(full_bioclim_data):
+    """
+    Function that trims the extracted climate data dictionnary and returns a simplified version with essential data only.
+    The dictionnaries returned by extract_bioclim_elev() already only contain these keys, extra keys (e.g. added by the user) are dropped.
+
+    Parameters
+    ----------
+    full_bioclim_data : dictionnary
+        Dictionnary containing the climate data obtained with the extract_bioclim_elev() method
+
+    Returns
+    -------
+    Trimmed down version of the extracted climate data dictionnary
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import CrsDataPoint
+    >>> sherby = CrsDataPoint('Sherbrooke', epsg=4326, x=-71.890068, y=45.393869)
+    >>> sherby_chelsa = sherby.extract_bioclim_elev('chelsa')
+
+    >>> from scripts.data_extraction import trim_data
+    >>> sherby_trimmed = trim_data(sherby_chelsa)
+    >>> print(sherby_trimmed)
+    {'id': 'Sherbrooke', 'epsg': 4326, 'lon': -71.890068, 'lat': 45.393869, 'bio1 (Celcius)': 6.050000000000011, 'bio2 (Celcius)': 9.1, 'bio3 (Celcius)': 23.400000000000002, 'bio4 (Celcius/100)': 1020.1, 'bio5 (Celcius)': 24.250000000000057, 'bio6 (Celcius)': -14.749999999999943, 'bio7 (Celcius)': 39.0, 'bio8 (Celcius)': 18.650000000000034, 'bio9 (Celcius)': -6.449999999999989, 'bio10 (Celcius)': 18.650000000000034, 'bio11 (Celcius)': -7.649999999999977, 'bio12 (kg / m**2 / year)': 1188.5, 'bio13 (kg / m**2 / month)': 129.4, 'bio14 (kg / m**2 / month)': 65.4, 'bio15 (kg / m**2)': 19.6, 'bio16 (kg / m**2 / month)': 375.8, 'bio17 (kg / m**2 / month)': 219.4, 'bio18 (kg / m**2 / month)': 375.8, 'bio19 (kg / m**2 / month)': 243.0}
+    
+    """
+    # Keep id,epsg,lon,lat + corrected climate data (bio# (Unit) key) + elevation with the precomputed set of keys
+    trimmed_clim_data_dict = dict((k, v) for k,v in full_bioclim_data.items() if k in _trimmed_keys())
+    return trimmed_clim_data_dict
+
+def hilbert_keys(x, y, order=16, bounds=(-180.0, -90.0, 180.0, 90.0)):
+    """
+    Function that computes the position of points along a Hilbert space-filling curve (vectorized over all the points).
+    Points close along the curve are close in space, so sorting by key groups nearby points together.
+
+    Parameters
+    ----------
+    x, y : numpy arrays
+        Coordinates of the points (lon/lat for the default bounds), clipped to the bounds
+    order : int
+        Number of bits per axis of the curve grid : 2**order x 2**order cells (default is 16, ~0.0055 degree cells)
+    bounds : tuple
+        (xmin, ymin, xmax, ymax) extent covered by the curve (default is the EPSG:4326 extent)
+
+    Returns
+    -------
+    keys : numpy array
+        Hilbert keys (int64) of the points
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import hilbert_keys
+    >>> hilbert_keys(np.array([-71.890068, 2.346963]), np.array([45.393869, 48.858885]))
+    array([1626389759, 2419644831])
+    """
+    n = 1 << order
+    xmin, ymin, xmax, ymax = bounds
+    xi = np.clip(np.nan_to_num((np.asarray(x, dtype=float) - xmin) / (xmax - xmin) * n), 0, n - 1).astype(np.int64)
+    yi = np.clip(np.nan_to_num((np.asarray(y, dtype=float) - ymin) / (ymax - ymin) * n), 0, n - 1).astype(np.int64)
+    keys = np.zeros(xi.shape, dtype=np.int64)
+    s = n >> 1
+    while s > 0 :
+        rx, ry = (xi & s) > 0, (yi & s) > 0
+        keys += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant so that the curve stays continuous
+        flip = ~ry & rx
+        xi, yi = np.where(flip, n - 1 - xi, xi), np.where(flip, n - 1 - yi, yi)
+        xi, yi = np.where(ry, xi, yi), np.where(ry, yi, xi)
+        s >>= 1
+    return keys
+
+def spatial_order(coords, order=16):
+    """
+    Function that returns the permutation sorting the coordinates along a Hilbert curve (see hilbert_keys()), ties keep the input order.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    return np.argsort(hilbert_keys(coords[:, 0], coords[:, 1], order), kind='stable')
+
+class SpatialIndex :
+    """
+    A packed Hilbert index of points for bounding box queries : the points are sorted along a Hilbert curve and grouped in pages
+    of consecutive points, so a query only tests the points of the pages whose bounding box intersects the query box.
+
+    Attributes
+    ----------
+    order : numpy array
+        Positions of the points sorted along the Hilbert curve
+    page_size : int
+        Number of consecutive (sorted) points per page
+
+    Methods
+    -------
+    query(xmin, ymin, xmax, ymax):
+        Returns the positions of the points within the bounding box.
+    """
+    __slots__ = ('order', 'page_size', '_x', '_y', '_pages')
+
+    def __init__(self, x, y, page_size=256) :
+        """
+        Constructor for SpatialIndex object.
+
+        Parameters
+        ----------
+        x, y : array-like
+            Coordinates of the points (lon/lat)
+        page_size : int
+            Number of consecutive points per page (default is 256)
+        """
+        if not isinstance(page_size, int) or page_size < 1 :
+            raise ValueError("page_size must be a positive integer")
+        self.page_size = page_size
+        self.order = spatial_order(np.column_stack([x, y]))
+        self._x, self._y = np.asarray(x, dtype=float)[self.order], np.asarray(y, dtype=float)[self.order]
+        # Bounding box of each page : (xmin, ymin, xmax, ymax) rows, ignoring NaN coordinates (never within a query box)
+        starts = np.arange(0, len(self.order), page_size)
+        self._pages = np.column_stack([
+            np.fmin.reduceat(self._x, starts), np.fmin.reduceat(self._y, starts),
+            np.fmax.reduceat(self._x, starts), np.fmax.reduceat(self._y, starts),
+        ]) if len(starts) else np.empty((0, 4))
+
+    def __len__(self) :
+        return len(self.order)
+
+    def __repr__(self) :
+        return f"SpatialIndex({len(self)} points, {len(self._pages)} pages)"
+
+    def query(self, xmin, ymin, xmax, ymax) :
+        """
+        Returns the positions (in the indexed order, sorted) of the points within the bounding box (bounds included).
+
+        Examples
+        --------
+        >>> from scripts.data_extraction import CrsPointCollection
+        >>> capitals = CrsPointCollection.from_csv("./data/us-state-capitals.csv")
+        >>> capitals.spatial_index().query(-80, 40, -70, 45)
+        array([ 6, 20, 28, 29, 31, 37, 38, 44])
+        """
+        pages = np.flatnonzero(
+            (self._pages[:, 0] <= xmax) & (self._pages[:, 2] >= xmin) & (self._pages[:, 1] <= ymax) & (self._pages[:, 3] >= ymin)
+        )
+        if not len(pages) :
+            return np.array([], dtype=np.int64)
+        candidates = (pages[:, None] * self.page_size + np.arange(self.page_size)).ravel()
+        candidates = candidates[candidates < len(self.order)]
+        x, y = self._x[candidates], self._y[candidates]
+        inside = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+        return np.sort(self.order[candidates[inside]])
+
+def pixel_index(tiff, coords):
+    """
+    Function that maps the coordinates to the row/col pixel indices of an opened raster (vectorized over all the coordinates).
+
+    Parameters
+    ----------
+    tiff : rasterio DatasetReader
+        Opened GeoTIFF file.
+
+    coords : list or numpy array
+        List of (x,y) tuples (or array of shape (n, 2)) in the CRS of the raster (EPSG:4326 for the WorldClim and Chelsa datasets).
+
+    Returns
+    -------
+    rows, cols : numpy arrays
+        Row and column pixel indices of each coordinate.
+    inside : numpy array
+        Boolean mask of the coordinates that fall within the extent of the raster.
+    """
+    if not len(coords) :
+        empty = np.array([], dtype=int)
+        return empty, empty, np.array([], dtype=bool)
+    xs, ys = np.asarray(coords, dtype=float).reshape(-1, 2).T
+    rows, cols = rasterio.transform.rowcol(tiff.transform, xs, ys)
+    rows, cols = np.atleast_1d(np.asarray(rows, dtype=int)), np.atleast_1d(np.asarray(cols, dtype=int))
+    inside = (rows >= 0) & (rows < tiff.height) & (cols >= 0) & (cols < tiff.width)
+    return rows, cols, inside
+
+def unique_pixels(tiff, rows, cols, inside):
+    """
+    Function that deduplicates the points falling in the same pixel of a raster.
+
+    Parameters
+    ----------
+    tiff : rasterio DatasetReader
+        Opened GeoTIFF file.
+
+    rows, cols, inside : numpy arrays
+        Row and column pixel indices of the points and mask of the points within the extent of the raster (see pixel_index()).
+
+    Returns
+    -------
+    point_idx : numpy array
+        Index of one point per unique pixel (within the extent of the raster).
+    inverse : numpy array
+        For each point within the extent, the position in point_idx of its pixel : values[inside] = values[point_idx][inverse]
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import raster_pool, data_dir, pixel_index, unique_pixels
+    >>> tiff = raster_pool.get(data_dir / "wc2.1_30s_elev.tif")
+    >>> rows, cols, inside = pixel_index(tiff, [(-71.890068, 45.393869), (2.346963, 48.858885), (-71.890069, 45.393870)])
+    >>> unique_pixels(tiff, rows, cols, inside)
+    (array([1, 0]), array([1, 0, 1]))
+    """
+    inside_idx = np.flatnonzero(inside)
+    pixels = rows[inside_idx].astype(np.int64) * tiff.width + cols[inside_idx]
+    _, first, inverse = np.unique(pixels, return_index=True, return_inverse=True)
+    return inside_idx[first], inverse.reshape(-1)
+
+def plan_block_reads(tiff, rows, cols):
+    """
+    Function that groups pixels by the internal GeoTIFF block (tile or strip) containing them, so that each block is read and decompressed only once.
+
+    Parameters
+    ----------
+    tiff : rasterio DatasetReader
+        Opened GeoTIFF file.
+
+    rows, cols : numpy arrays
+        Row and column pixel indices, all within the extent of the raster (see pixel_index()).
+
+    Returns
+    -------
+    [(window, positions)] : list
+        One entry per block to read, sorted in block order : the rasterio Window of the block and the positions (in rows/cols) of the pixels it contains.
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import raster_pool, data_dir, pixel_index, plan_block_reads
+    >>> tiff = raster_pool.get(data_dir / "wc2.1_30s_elev.tif")
+    >>> rows, cols, inside = pixel_index(tiff, [(-71.890068, 45.393869), (-71.9, 45.4), (2.346963, 48.858885)])
+    >>> [positions for window, positions in plan_block_reads(tiff, rows, cols)]
+    [array([0, 1]), array([2])]
+    """
+    block_height, block_width = tiff.block_shapes[0]
+    n_block_cols = -(-tiff.width // block_width)
+    blocks = (rows // block_height) * n_block_cols + cols // block_width
+    order = np.argsort(blocks, kind='stable')
+    sorted_blocks = blocks[order]
+    # Start/end of each run of points sharing the same block
+    starts = np.flatnonzero(np.r_[True, sorted_blocks[1:] != sorted_blocks[:-1]]) if len(order) else np.array([], dtype=int)
+    ends = np.r_[starts[1:], len(order)]
+    plan = []
+    for start, end in zip(starts, ends) :
+        block_row, block_col = divmod(int(sorted_blocks[start]), n_block_cols)
+        plan.append((tiff.block_window(1, block_row, block_col), order[start:end]))
+    return plan
+
+# Blocks with at most this number of pixels to read are read pixel by pixel (1 x 1 windows) instead of copying the whole block
+sparse_block_pixels = 2
+
+def read_pixels(tiff, rows, cols, cache=None, indexes=1):
+    """
+    Function that reads the raw values of pixels of one or several bands of an opened raster in a single pass.
+    Each unique pixel is read once (see unique_pixels()) and the pixels are grouped by internal GeoTIFF block
+    with plan_block_reads() so that each block is decompressed once, then the values are scattered back into the input order. Pixels outside of the raster get the nodata value (or 0).
+    The pixels of a block with at most sparse_block_pixels pixels to read are read as 1 x 1 windows, as rasterio's sample_gen() does,
+    to avoid copying whole blocks (e.g. the strips of the CHELSA files) for isolated points.
+
+    Parameters
+    ----------
+    tiff : rasterio DatasetReader
+        Opened GeoTIFF file to read from.
+
+    rows, cols : numpy arrays
+        Row and column indices of the pixels (may be outside of the raster).
+
+    cache : PixelCache
+        If given, pixels found in the cache are not read from the raster and the pixels read are added to the cache. (Default = None)
+
+    indexes : int or list
+        Band index or list of band indexes to read, all bands of a pixel are read together. (Default = 1)
+
+    Returns
+    -------
+    values : numpy array
+        Raw pixel values in the same order as the input indices, of shape (n,) for a single band index
+        or (len(indexes), n) for a list of band indexes.
+    """
+    bands = [indexes] if isinstance(indexes, int) else list(indexes)
+    values = np.full((len(bands), len(rows)), tiff.nodata or 0, dtype=tiff.dtypes[0])
+    with _timed("index") :
+        inside = (rows >= 0) & (rows < tiff.height) & (cols >= 0) & (cols < tiff.width)
+        # Read each unique pixel once and broadcast the values to all the positions of that pixel
+        unique_idx, inverse = unique_pixels(tiff, rows, cols, inside)
+    read_idx = unique_idx
+    if cache is not None :
+        with _timed("cache") :
+            missing = np.zeros(len(read_idx), dtype=bool)
+            for i, band in enumerate(bands) :
+                cached_values, found = cache.get_many(tiff.name, tiff.width, rows[read_idx], cols[read_idx], band)
+                values[i, read_idx[found]] = cached_values[found]
+                missing |= ~found
+            read_idx = read_idx[missing]
+    with _timed("index") :
+        plan = plan_block_reads(tiff, rows[read_idx], cols[read_idx])
+    n_bytes = 0
+    with _timed("read") :
+        for window, positions in plan :
+            point_idx = read_idx[positions]
+            if len(point_idx) <= sparse_block_pixels :
+                for i in point_idx :
+                    values[:, i] = tiff.read(bands, window=rasterio.windows.Window(cols[i], rows[i], 1, 1))[:, 0, 0]
+            else :
+                block = tiff.read(bands, window=window)
+                values[:, point_idx] = block[:, rows[point_idx] - window.row_off, cols[point_idx] - window.col_off]
+            # The whole block is decompressed in both cases
+            n_bytes += window.width * window.height * len(bands) * values.itemsize
+    if cache is not None :
+        with _timed("cache") :
+            for i, band in enumerate(bands) :
+                cache.put_many(tiff.name, tiff.width, rows[read_idx], cols[read_idx], values[i, read_idx], band)
+    if metrics is not None :
+        metrics.add('pixels', len(rows) * len(bands))
+        metrics.add('pixels_inside', int(inside.sum()) * len(bands))
+        metrics.add('unique_pixels', len(unique_idx) * len(bands))
+        metrics.add('pixels_read', len(read_idx) * len(bands))
+        metrics.add('blocks_read', len(plan))
+        metrics.add_bytes(Path(tiff.name).name, n_bytes)
+        if cache is not None :
+            metrics.add('cache_hits', (len(unique_idx) - len(read_idx)) * len(bands))
+            metrics.add('cache_misses', len(read_idx) * len(bands))
+    values[:, inside] = values[:, unique_idx][:, inverse]
+    return values[0] if isinstance(indexes, int) else values
 
-    def __repr__(self):
-        return f"CrsDataPoint({self.id}, epsg={self.epsg}, x={self.x}, y={self.y})"
-            
-    def get_info(self):
-        """
-        Prints the CrsDataPoint object information. 
-        """
-        return print(
-            "id : {}\nEPSG : {}\nMap coordinates :\n\tx = {}\n\ty = {}\n\t(x,y) = {}"
-            .format(self.id, self.epsg, self.x, self.y, self.xy_pt)
-            )
+# Sampling modes : value of the pixel containing the point, bilinear interpolation of the 4 nearest pixel centres,
+# or aggregation of the pixels of a size x size window (or within a radius in metres) around the point
+sampling_modes = ("nearest", "bilinear", "mean", "median", "max")
 
-    def transform_crs(self, epsg_out=4326):
-        """
-        Transforms the coordinates to the desired EPSG coordinate reference system. 
-        Default argument is EPSG:4326 which is the reference for the WorldClim and Chelsa datasets
-        
-        Parameters
-        ----------
-        epsg_out : int
-            EPSG Geodetic Parameter Dataset code of the coordinate reference system (CRS) (default is 4326)
+# Length of a degree of latitude (mean Earth radius of 6 371 008.8 m), used for the radius of geographic rasters
+METRES_PER_DEGREE = 6371008.8 * np.pi / 180
 
-        Returns
-        -------
-        CrsDataPoint object with updated x-y values for the given EPSG code. 
-        With default arg it will output the following x/y values :
-        x_out : float
-            longitude (x-value, North-South lines) that range between -180 and +180 degrees.
-        y_out : float
-            latitude (y-value, East-West lines) that range between -90 and +90 degrees.
+def check_sampling(mode, size=3, radius=None):
+    """
+    Function that checks the sampling mode (see sampling_modes) and its window size or radius, raising a ValueError if not valid.
+    """
+    if mode not in sampling_modes :
+        raise ValueError("Sampling mode must be one of {}".format(", ".join(sampling_modes)))
+    if radius is not None and (isinstance(radius, bool) or not isinstance(radius, (int, float)) or not radius > 0) :
+        raise ValueError("radius must be a positive number of metres")
+    if isinstance(size, bool) or not isinstance(size, (int, np.integer)) or size < 1 or size % 2 == 0 :
+        raise ValueError("size must be a positive odd number of pixels")
 
-        Examples
-        --------
-        >>> sherby = CrsDataPoint('Sherbrooke', epsg=3857, x=-8002765.769038227, y=5683742.6823244635)
-        >>> sherby_gps = sherby.transform_crs()
-        >>> print(sherby_gps)
-        id : Sherbrooke_transformed
-        EPSG : 4326
-        Map coordinates :
-            x = -71.89006805555556
-            y = 45.39386888888889
-            (x,y) = (-71.89006805555556, 45.39386888888889)
+def fractional_index(transform, coords):
+    """
+    Function that maps the coordinates to fractional (row, col) pixel positions with the inverse affine transform.
+    The floor of the positions are the same pixel indices as rasterio's rowcol().
+    """
+    xy = np.ones((3, len(coords)))
+    if len(coords) :
+        xy[:2] = np.asarray(coords, dtype=float).reshape(-1, 2).T
+    np.array(~transform).reshape(3, 3).dot(xy, out=xy)
+    return xy[1], xy[0]
 
-        """
-        # Check if code valid
-        if epsg_out not in EPSG_codes:
-            raise ValueError("Input EPSG code not valid, see https://pyproj4.github.io/pyproj/stable/api/database.html#pyproj.database.get_codes")
-        
-        # Call transform method from pyproj
-        transformer = Transformer.from_crs(self.epsg, CRS.from_epsg(epsg_out), always_xy=True)
-        x_out, y_out = transformer.transform(self.x, self.y)
-        return CrsDataPoint(self.id+"_transformed", epsg_out, x_out, y_out)
+def radius_windows(raster, coords, radius):
+    """
+    Function that returns the metres per pixel along x and y at each coordinate and the half sizes (in pixels) of its radius window.
+    The radius is computed on a sphere for geographic rasters : windows get wider towards the poles.
 
-    def df_to_dict(df) :
-        """
-        Takes the input df and returns a dictionnary of CrsDataPoint objects.
-        Calls transform_crs() method if any epsg codes are not 4326.
+    Returns
+    -------
+    metres_x, metres_y : numpy arrays
+        Metres per pixel along x and y at each coordinate
+    half_x, half_y : numpy arrays
+        Number of pixels of the window on each side of the pixel containing the coordinate (at most max_window_size),
+        -1 for the coordinates without a window (NaN)
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    res_x, res_y = abs(raster.transform.a), abs(raster.transform.e)
+    if raster.crs is None or raster.crs.is_geographic :
+        lat = np.clip(coords[:, 1], -89, 89)
+        metres_x, metres_y = METRES_PER_DEGREE * res_x * np.cos(np.radians(lat)), np.full(len(lat), METRES_PER_DEGREE * res_y)
+    else :
+        metres_x, metres_y = np.full(len(coords), res_x), np.full(len(coords), res_y)
+    halves = [np.ceil(radius / metres + 0.5) for metres in (metres_x, metres_y)]
+    finite = np.isfinite(halves[0]) & np.isfinite(halves[1]) & np.isfinite(coords).all(axis=1)
+    half_x, half_y = (np.where(finite, np.minimum(half, max_window_size), -1).astype(int) for half in halves)
+    return metres_x, metres_y, half_x, half_y
 
-        Parameters
-        ----------
-        df : dataframe
-            Input dataframe with the following structure : 
-            {'id' : specimen name(any) , 'epsg' : code(int), 'x' : x-value(float), 'y' : y-value(float)}
+# Maximum number of pixels of the window of a point, points needing a larger radius window get NaN values
+max_window_size = 100000
 
-        Returns
-        -------
-        Dictionnary of CrsDataPoint objects
+# Maximum number of window pixels (points x pixels per window) allocated at a time by window_groups()
+max_window_pixels = 10000000
 
-        Examples
-        --------
-        >>> df = pd.DataFrame({
-        ...     'id' : ['Sherbrooke', 'Paris'],
-        ...     'epsg' : [3857, 4326],
-        ...     'x' : [-8002765.769038227, 2.346963],
-        ...     'y' : [5683742.6823244635, 48.858885],
-        ...         })
-        >>> cities = CrsDataPoint.df_to_dict(df)
-        Dataframe contains data with CRS other than EPSG:4326. Calling transform_crs()...
-        >>> print(cities['Sherbrooke'])
-        id : Sherbrooke_transformed
-        EPSG : 4326
-        Map coordinates :
-            x = -71.89006805555556
-            y = 45.39386888888889
-            (x,y) = (-71.89006805555556, 45.39386888888889)
+def window_groups(raster, coords, mode, size=3, radius=None):
+    """
+    Function that splits the coordinates into groups sharing the same window size, each group in chunks of at most max_window_pixels
+    window pixels, and yields the window pixels of each chunk (see window_pixels()). Radius windows are sized per point :
+    a point near a pole does not widen the windows of the other points, and a large batch never allocates all its windows at once.
+    The points without a radius window (NaN coordinates, or more than max_window_size pixels) are left out of the groups :
+    their values stay NaN instead of failing the whole batch.
 
-        """
-        crs_data_points = {}
-        if (df['epsg'] != 4326).any() == True :
-            print("Dataframe contains data with CRS other than EPSG:4326. Calling transform_crs()...")
-            for index, row in df.iterrows() :
-                if row['epsg'] == 4326 : 
-                    crs_data_points[row['id']] = CrsDataPoint(row['id'], row['epsg'], row['x'], row['y'])
-                else : 
-                    crs_data_points[row['id']] = CrsDataPoint(row['id'], row['epsg'], row['x'], row['y']).transform_crs()
-            return crs_data_points
-        else :     
-            for index, row in df.iterrows() :
-                crs_data_points[row['id']] = CrsDataPoint(row['id'], row['epsg'], row['x'], row['y'])
-            return crs_data_points
+    Yields
+    ------
+    positions : numpy array
+        Positions (in coords) of the points of the chunk
+    rows, cols, weights : numpy arrays
+        Window pixels of the points of the chunk and their weights, see window_pixels()
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if radius is not None and mode != "bilinear" and len(coords) :
+        _, _, half_x, half_y = radius_windows(raster, coords, radius)
+        shapes, groups = np.unique(np.column_stack([half_x, half_y]), axis=0, return_inverse=True)
+        groups = groups.reshape(-1)
+        window_sizes = (2*shapes[:, 0] + 1) * (2*shapes[:, 1] + 1)
+        # Group of the points without a window, never yielded
+        window_sizes[(shapes[:, 0] < 0) | (window_sizes > max_window_size)] = 0
+    else :
+        groups = np.zeros(len(coords), dtype=int)
+        window_sizes = [4 if mode == "bilinear" else size * size]
+    for group, window_size in enumerate(window_sizes) :
+        if not window_size :
+            continue
+        positions = np.flatnonzero(groups == group)
+        chunk_size = max(max_window_pixels // int(window_size), 1)
+        for start in range(0, len(positions), chunk_size) :
+            chunk = positions[start:start + chunk_size]
+            with _timed("index") :
+                window = window_pixels(raster, coords[chunk], mode, size, radius)
+            yield (chunk,) + window
 
-    def extract_bioclim_elev(self, dataset):
-        """
-        Extracts the pixel values (for all bioclim variables) from the specified GeoTIFF file. Calls transform_crs() method if needed. 
-        
+def window_pixels(raster, coords, mode, size=3, radius=None):
+    """
+    Function that returns the pixels of the window (or the bilinear neighbourhood) of each coordinate and their weights, vectorized over all the coordinates.
 
-        Parameters
-        ----------
-        dataset : string
-            Name of the dataset to extract the data from : "chelsa" or "worldclim"
+    Parameters
+    ----------
+    raster : rasterio DatasetReader or RasterArray
+        Opened raster (transform, width and height are used, and the crs to compute a radius in metres).
 
-        Returns
-        -------
-        A dictionnary containing sample id, lon(x), lat(y), bio# (Unit) : Corrected (scale + offset where needed) pixel value,
-        bio#_longname : Name of the measurement, bio#_explanation : Brief explanation of measurement.
+    coords : list or numpy array
+        List of (x,y) tuples (or array of shape (n, 2)) in the CRS of the raster.
 
-        Examples
-        --------
-        >>> sherby = CrsDataPoint('Sherbrooke', epsg=4326, x=-71.890068, y=45.393869) 
-        >>> sherby_chelsa = sherby.extract_bioclim_elev(dataset='chelsa')
-        Extracting values for Sherbrooke at lon=-71.890 lat=45.394  for all climate variables bio1 to bio19 in CHELSA V2.1 (1981-2010)  + elevation from WorldClim 2.1 dataset...
-        Done!
-        >>> import pandas as pd
-        >>> pd.DataFrame([sherby_chelsa])
-                id  epsg  ...  elevation_Meters                              elevation_explanation
-        0  Sherbrooke  4326  ...               158  Elevation in meters derived from Shuttle Radar...
+    mode, size, radius :
+        Sampling mode (see sampling_modes), size of the square window in pixels or radius of the window in metres (replaces size if given).
+        The radius is computed on a sphere for geographic rasters, and is always large enough to include the pixel containing the point.
 
-        [1 rows x 63 columns]
-        """
-        # CHELSA data extraction
-        if dataset == "chelsa" :
-            # Checking for EPSG:4326
-            if self.epsg == 4326 :  
-                single_pt_clim_data = {
-                    'id' : self.id,
-                    'epsg' : self.epsg,
-                    'lon' : self.x,
-                    'lat' : self.y,
-                }
-                print(
-                    "Extracting values for {} at lon={:.3f} lat={:.3f}".format(self.id, self.x, self.y),
-                    " for all climate variables bio1 to bio19 in CHELSA V2.1 (1981-2010)",
-                    " + elevation from WorldClim 2.1 dataset..."
-                ) 
-                for k,v in chelsa_data.items() :
-                    with rasterio.open(data_dir / v['filename']) as tiff :
-                        pixel_val = rasterio.sample.sample_gen(tiff, [self.xy_pt])    # Extracting raw pixel value
-                        for val in pixel_val :
-                            single_pt_clim_data[k+' ('+v['unit']+')'] = val[0]*v['scale']+v['offset']
-                            single_pt_clim_data[k+"_longname"] = v['longname']
-                            single_pt_clim_data[k+"_explanation"] = v['explanation']
-                
-                # Extract elevation data
-                with rasterio.open(data_dir / worldclim_elev['filename']) as tiff :
-                    pixel_val = rasterio.sample.sample_gen(tiff, [self.xy_pt])
-                    for val in pixel_val :
-                        single_pt_clim_data[worldclim_elev['name']+"_"+worldclim_elev['unit']] = val[0]
-                        single_pt_clim_data[worldclim_elev['name']+"_explanation"] = worldclim_elev['explanation']
-                print("Done!")
-                return single_pt_clim_data
-
-            # Calling transform_crs() method to convert coordinates
-            else :
-                print("Data point with x,y other than EPSG:4326. Calling transform_crs() method...")
-                transformed = self.transform_crs()
-                single_pt_clim_data = {
-                    'id' : transformed.id,
-                    'epsg' : transformed.epsg,
-                    'lon' : transformed.x,
-                    'lat' : transformed.y,
-                }
-                print(
-                    "...than extracting values for {} at lon={:.3f} lat={:.3f}".format(transformed.id, transformed.x, transformed.y),
-                    " for all climate variables bio1 to bio19 in CHELSA V2.1 (1981-2010)",
-                    " + elevation in WorldClim 2.1 dataset..."
-                )
-                for k,v in chelsa_data.items() :
-                    with rasterio.open(data_dir / v['filename']) as tiff :
-                        pixel_val = rasterio.sample.sample_gen(tiff, [transformed.xy_pt])    # Extracting raw pixel value
-                        for val in pixel_val :
-                            single_pt_clim_data[k+' ('+v['unit']+')'] = val[0]*v['scale']+v['offset']
-                            single_pt_clim_data[k+"_longname"] = v['longname']
-                            single_pt_clim_data[k+"_explanation"] = v['explanation']
-                    
-                # Extract elevation data
-                with rasterio.open(data_dir / worldclim_elev['filename']) as tiff :
-                    pixel_val = rasterio.sample.sample_gen(tiff, [transformed.xy_pt])
-                    for val in pixel_val :
-                        single_pt_clim_data[worldclim_elev['name']+"_"+worldclim_elev['unit']] = val[0]
-                        single_pt_clim_data[worldclim_elev['name']+"_explanation"] = worldclim_elev['explanation']
-                print("Done!")
-                return single_pt_clim_data  
-        
-        # WorldClim data extraction
-        if dataset == "worldclim" :
-            # Checking for EPSG:4326
-            if self.epsg == 4326 :  
-                single_pt_clim_data = {
-                    'id' : self.id,
-                    'epsg' : self.epsg,
-                    'lon' : self.x,
-                    'lat' : self.y,
-                }
-                print(
-                    "Extracting values for {} at lon={:.3f} lat={:.3f}".format(self.id, self.x, self.y),
-                    " for all climate variables bio1 to bio19", 
-                    " + elevation in WorldClim 2.1 (1970-2000) dataset..."
-                ) 
-                for k,v in worldclim_data.items() :
-                    with rasterio.open(data_dir / v['filename']) as tiff :
-                        pixel_val = rasterio.sample.sample_gen(tiff, [self.xy_pt])    # Extracting raw pixel value
-                        for val in pixel_val :
-                            single_pt_clim_data[k+' ('+v['unit']+')'] = val[0]
-                            single_pt_clim_data[k+"_longname"] = v['longname']
-                            single_pt_clim_data[k+"_explanation"] = v['explanation']
-                    
-                    # Extract elevation data
-                with rasterio.open(data_dir / worldclim_elev['filename']) as tiff :
-                    pixel_val = rasterio.sample.sample_gen(tiff, [self.xy_pt])
-                    for val in pixel_val :
-                        single_pt_clim_data[worldclim_elev['name']+"_"+worldclim_elev['unit']] = val[0]
-                        single_pt_clim_data[worldclim_elev['name']+"_explanation"] = worldclim_elev['explanation']
-                print("Done!")
-                return single_pt_clim_data
-
-            # Calling transform_crs() method to convert coordinates
-            else :
-                print("Data point with x,y other than EPSG:4326. Calling transform_crs() method...")
-                transformed = self.transform_crs()
-                single_pt_clim_data = {
-                    'id' : transformed.id,
-                    'epsg' : transformed.epsg,
-                    'lon' : transformed.x,
-                    'lat' : transformed.y,
-                }
-                print(
-                    "...than extracting values for {} at lon={:.3f} lat={:.3f}".format(transformed.id, transformed.x, transformed.y), 
-                    "for all climate variables bio1 to bio19 + elevation in WorldClim V2.1 (1970-2000)..."
-                )
-                for k,v in worldclim_data.items() :
-                    with rasterio.open(data_dir / v['filename']) as tiff :
-                        pixel_val = rasterio.sample.sample_gen(tiff, [transformed.xy_pt])    # Extracting raw pixel value
-                        for val in pixel_val :
-                            single_pt_clim_data[k+' ('+v['unit']+')'] = val[0]
-                            single_pt_clim_data[k+"_longname"] = v['longname']
-                            single_pt_clim_data[k+"_explanation"] = v['explanation']
-                    
-                    # Extract elevation data
-                with rasterio.open(data_dir / worldclim_elev['filename']) as tiff :
-                    pixel_val = rasterio.sample.sample_gen(tiff, [transformed.xy_pt])
-                    for val in pixel_val :
-                        single_pt_clim_data[worldclim_elev['name']+"_"+worldclim_elev['unit']] = val[0]
-                        single_pt_clim_data[worldclim_elev['name']+"_explanation"] = worldclim_elev['explanation']   
-                return single_pt_clim_data    
-        
+    Returns
+    -------
+    rows, cols : numpy arrays
+        Row and column indices of the pixels of each window, of shape (n, pixels per window).
+    weights : numpy array
+        Weight of each pixel (bilinear weights, or 1 for the pixels of the window), 0 for the pixels outside of the window or the raster.
+    """
+    frows, fcols = fractional_index(raster.transform, coords)
+    # Points with NaN coordinates : placeholder position, weights set to 0 below
+    finite = np.isfinite(frows) & np.isfinite(fcols)
+    frows, fcols = np.where(finite, frows, 0.0), np.where(finite, fcols, 0.0)
+    if mode == "bilinear" :
+        # 4 pixel centres surrounding the point
+        row0, col0 = np.floor(frows - 0.5), np.floor(fcols - 0.5)
+        ty, tx = (frows - 0.5 - row0)[:, None], (fcols - 0.5 - col0)[:, None]
+        rows, cols = row0[:, None] + [0, 0, 1, 1], col0[:, None] + [0, 1, 0, 1]
+        weights = np.where([0, 1, 0, 1], tx, 1 - tx) * np.where([0, 0, 1, 1], ty, 1 - ty)
+    else :
+        row0, col0 = np.floor(frows), np.floor(fcols)
+        if radius is None :
+            half_x = half_y = size // 2
         else :
-            raise ValueError("Enter the dataset you want to extract the climate data from : \"chelsa\" or \"worldclim\"") 
+            # Window of the point needing the most pixels (see window_groups() to size the windows per point)
+            metres_x, metres_y, half_xs, half_ys = radius_windows(raster, coords, radius)
+            half_x = max(int(half_xs.max()), 0) if len(frows) else 0
+            half_y = max(int(half_ys.max()), 0) if len(frows) else 0
+            if (2*half_x + 1) * (2*half_y + 1) > max_window_size :
+                raise ValueError("radius is too large for the resolution of the raster (more than {} pixels per window)".format(max_window_size))
+        offset_rows, offset_cols = [offsets.ravel() for offsets in np.mgrid[-half_y:half_y+1, -half_x:half_x+1]]
+        rows, cols = row0[:, None] + offset_rows, col0[:, None] + offset_cols
+        if radius is None :
+            weights = np.ones(rows.shape)
+        else :
+            # Pixel centres within the radius of the point (+ the pixel containing the point)
+            dy = (rows + 0.5 - frows[:, None]) * metres_y[:, None]
+            dx = (cols + 0.5 - fcols[:, None]) * metres_x[:, None]
+            weights = ((dx**2 + dy**2 <= radius**2) | ((offset_rows == 0) & (offset_cols == 0))).astype(float)
+    rows, cols = rows.astype(int), cols.astype(int)
+    weights = weights * ((rows >= 0) & (rows < raster.height) & (cols >= 0) & (cols < raster.width) & finite[:, None])
+    return rows, cols, weights
 
-# Trim data dict with base CrsDataPoint attributes (may be crs_transformed) + bioclim_elev values
-def trim_data(full_bioclim_data):
+def aggregate_window(values, weights, mode, nodata=None):
     """
-    Function that trims the extracted climate data dictionnary and returns a simplified version with essential data only.
+    Function that aggregates the raw values of the window pixels (see window_pixels()) of each point, vectorized over all the points.
+    Nodata pixels are left out, the bilinear weights are normalized over the remaining pixels.
 
     Parameters
     ----------
-    full_bioclim_data : dictionnary
-        Dictionnary containing the full climate data obtained with the extract_bioclim_elev() method
+    values : numpy array
+        Raw pixel values of shape (..., n, pixels per window)
+    weights : numpy array
+        Weights of the pixels of shape (n, pixels per window)
+    mode : str
+        "bilinear" or "mean" (weighted mean), "median" or "max"
+    nodata : float
+        Nodata value of the raster (Default = None)
 
     Returns
     -------
-    Trimmed down version of the extracted climate data dictionnary
+    values : numpy array
+        Aggregated values as floats of shape (..., n), NaN where the window has no valid pixel.
+    """
+    values = values.astype(float)
+    valid = (weights > 0) & ~np.isnan(values)
+    if nodata is not None :
+        valid &= values != nodata
+    counts = valid.sum(axis=-1)
+    if mode in ("bilinear", "mean") :
+        weights = np.where(valid, weights, 0)
+        with np.errstate(invalid='ignore', divide='ignore') :
+            result = (np.where(valid, values, 0) * weights).sum(axis=-1) / weights.sum(axis=-1)
+    elif mode == "max" :
+        result = np.where(valid, values, -np.inf).max(axis=-1)
+    elif mode == "median" :
+        # Valid values sorted first (NaN last), median of the first counts values
+        ordered = np.sort(np.where(valid, values, np.nan), axis=-1)
+        low = np.take_along_axis(ordered, np.maximum(counts - 1, 0)[..., None] // 2, axis=-1)[..., 0]
+        high = np.take_along_axis(ordered, (counts // 2)[..., None], axis=-1)[..., 0] if ordered.shape[-1] else low
+        result = (low + np.where(counts > 0, high, low)) / 2
+    else :
+        raise ValueError("Sampling mode must be one of {}".format(", ".join(sampling_modes[1:])))
+    return np.where(counts > 0, result, np.nan)
+
+def sample_raster(tiff, coords, cache=None, indexes=1, mode="nearest", size=3, radius=None):
+    """
+    Function that samples the pixel values of one or several bands of an opened raster for all the coordinates in a single pass (see read_pixels()).
+    The windows of nearby points are read together, each unique pixel once.
+
+    Parameters
+    ----------
+    tiff : rasterio DatasetReader
+        Opened GeoTIFF file to sample from.
+
+    coords : list or numpy array
+        List of (x,y) tuples (or array of shape (n, 2)) in the CRS of the raster (EPSG:4326 for the WorldClim and Chelsa datasets).
+
+    cache : PixelCache
+        If given, pixels found in the cache are not read from the raster and the pixels read are added to the cache. (Default = None)
+
+    indexes : int or list
+        Band index or list of band indexes to sample, all bands of a pixel are read together. (Default = 1)
+
+    mode : str
+        Sampling mode : "nearest" (pixel containing the point), "bilinear", or "mean", "median" or "max" of the pixels of the window. (Default = "nearest")
+
+    size : int
+        Size (odd number of pixels) of the square window around the point. (Default = 3)
+
+    radius : float
+        Radius (in metres) of the window around the point, replaces size if given. (Default = None)
+
+    Returns
+    -------
+    values : numpy array
+        Raw (uncorrected) pixel values in the same order as the input coordinates (nodata value or 0 outside of the raster),
+        or floats aggregated with window_groups() and aggregate_window() for the other modes (NaN if no valid pixel),
+        of shape (n,) for a single band index or (len(indexes), n) for a list of band indexes.
+    """
+    check_sampling(mode, size, radius)
+    if mode == "nearest" :
+        with _timed("index") :
+            rows, cols, _ = pixel_index(tiff, coords)
+        return read_pixels(tiff, rows, cols, cache=cache, indexes=indexes)
+    # Points grouped by window size (see window_groups())
+    values = np.full((len(coords),) if isinstance(indexes, int) else (len(indexes), len(coords)), np.nan)
+    for positions, rows, cols, weights in window_groups(tiff, coords, mode, size, radius) :
+        window_values = read_pixels(tiff, rows.ravel(), cols.ravel(), cache=cache, indexes=indexes)
+        with _timed("aggregate") :
+            values[..., positions] = aggregate_window(
+                window_values.reshape(window_values.shape[:-1] + rows.shape), weights, mode, tiff.nodata
+            )
+    return values
+
+# (workers, executor) of the process pool shared by the sample_files() calls of a thread within worker_pool()
+_worker_pool = threading.local()
+
+@contextlib.contextmanager
+def worker_pool(workers):
+    """
+    Context manager that starts one process pool of workers, reused by all the sample_files() calls with the same number of workers
+    within the block (e.g. the chunks of extract_csv_to_file()) instead of starting a new pool per call, and shut down at the end.
+    Nested blocks reuse the outer pool, None or 1 worker does not start any pool. The pool is only used by the thread that started it.
 
     Examples
     --------
-    >>> from scripts.data_extraction import CrsDataPoint
-    >>> sherby = CrsDataPoint('Sherbrooke', epsg=4326, x=-71.890068, y=45.393869)
-    >>> sherby_chelsa = sherby.extract_bioclim_elev('chelsa')
-    Extracting values for Sherbrooke at lon=-71.890 lat=45.394  for all climate variables bio1 to bio19 in CHELSA V2.1 (1981-2010)  + elevation from WorldClim 2.1 dataset...
-    Done!
-
-    >>> from scripts.data_extraction import trim_data
-    >>> sherby_trimmed = trim_data(sherby_chelsa)
-    >>> print(sherby_trimmed)
-    {'id': 'Sherbrooke', 'epsg': 4326, 'lon': -71.890068, 'lat': 45.393869, 'bio1 (Celcius)': 6.050000000000011, 'bio2 (Celcius)': 9.1, 'bio3 (Celcius)': 23.400000000000002, 'bio4 (Celcius/100)': 1020.1, 'bio5 (Celcius)': 24.250000000000057, 'bio6 (Celcius)': -14.749999999999943, 'bio7 (Celcius)': 39.0, 'bio8 (Celcius)': 18.650000000000034, 'bio9 (Celcius)': -6.449999999999989, 'bio10 (Celcius)': 18.650000000000034, 'bio11 (Celcius)': -7.649999999999977, 'bio12 (kg / m**2 / year)': 1188.5, 'bio13 (kg / m**2 / month)': 129.4, 'bio14 (kg / m**2 / month)': 65.4, 'bio15 (kg / m**2)': 19.6, 'bio16 (kg / m**2 / month)': 375.8, 'bio17 (kg / m**2 / month)': 219.4, 'bio18 (kg / m**2 / month)': 375.8, 'bio19 (kg / m**2 / month)': 243.0}
-    
+    >>> from scripts.data_extraction import worker_pool, extract_multiple_bioclim_elev
+    >>> with worker_pool(4) :
+    ...     dfs = [extract_multiple_bioclim_elev(batch, 'chelsa', workers=4) for batch in batches]
     """
-    # Return all keys from dict
-    all_keys = [k for k in full_bioclim_data.keys()]
-    # Filter for columns with corrected climate data (bio# (Unit) key) + append to id,epsg,lon,lat cols
-    filtered_keys = (
-        all_keys[:4] + 
-        [key for key in all_keys[4:] if re.search("bio[0-9]* ", key)] + 
-        [worldclim_elev['name']+"_"+worldclim_elev['unit']]
+    if workers is None or workers == 1 or getattr(_worker_pool, 'pool', None) is not None :
+        yield
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor :
+        _worker_pool.pool = (workers, executor)
+        try :
+            yield
+        finally :
+            _worker_pool.pool = None
+
+# Process pool job : each worker process samples from its own raster_pool (and pixel cache connection)
+# With collect_metrics, the metrics of the job are returned with the values (merged by the main process)
+def _sample_file_job(path, coords, cache_settings=None, indexes=1, sampling=("nearest", 3, None), collect_metrics=False):
+    if cache_settings is not None and (pixel_cache is None or (pixel_cache.path, pixel_cache.max_entries) != cache_settings) :
+        set_pixel_cache(*cache_settings)
+    set_metrics(ExtractionMetrics() if collect_metrics else None)
+    values = sample_raster(
+        raster_pool.get(path), coords, cache=pixel_cache if cache_settings is not None else None, indexes=indexes, mode=sampling[0],
+        size=sampling[1], radius=sampling[2]
     )
+    return (values, metrics.report()) if collect_metrics else values
 
-    # Extract filtered keys from full climate data dict
-    trimmed_clim_data_dict = dict((k, full_bioclim_data[k]) for k in filtered_keys if k in full_bioclim_data)
-    return trimmed_clim_data_dict
+def sample_files(filenames, coords, *, workers=None, mode="nearest", size=3, radius=None, spatial_sort=True):
+    """
+    Function that samples the raw pixel values of several GeoTIFF files (from the data directory) for all the coordinates.
+    If a multi-band cube containing all the files was built (see prepare.py), all the values of a pixel are read at once from the cube (nearest mode only).
+
+    Parameters
+    ----------
+    filenames : list
+        Names of the GeoTIFF files to sample (see raster_path()), duplicates are only sampled once.
+
+    coords : list or numpy array
+        List of (x,y) tuples (or array of shape (n, 2)) in EPSG:4326.
+
+    workers : int
+        Number of worker processes. If None or 1, the files are sampled serially in the current process.
+        Otherwise, one job per file (split in point chunks when there are more workers than files) is sent to a process pool,
+        each worker holding its own opened rasters. The pool is started for the call, unless the call is within a worker_pool() block. (Default = None)
+
+    mode, size, radius :
+        Sampling mode, window size (in pixels) and radius (in metres), see sample_raster(). (Default = "nearest", 3, None)
+
+    spatial_sort : bool
+        If true, batches of more than 1024 points are sampled in Hilbert curve order (see spatial_order()) so that nearby points
+        are read together (and split between the same workers), the values are returned in the input order. (Default = True)
+
+    The pixel cache is used if enabled with set_pixel_cache(). Files memory-mapped with set_memory_map() are always sampled in the current process
+    (plain array indexing) and do not go through the pixel cache or the cube.
+
+    Returns
+    -------
+    raw_values : dict
+        Raw (uncorrected) pixel values for each filename, in the same order as the input coordinates (floats for the window modes).
+    """
+    if workers is not None and (not isinstance(workers, int) or workers < 1) :
+        raise ValueError("workers must be a positive integer")
+    check_sampling(mode, size, radius)
+    filenames = list(dict.fromkeys(filenames))
+
+    # Sample in spatial order, then restore the input order
+    if spatial_sort and len(coords) > 1024 :
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        order = spatial_order(coords)
+        sorted_values = sample_files(
+            filenames, coords[order], workers=workers, mode=mode, size=size, radius=radius, spatial_sort=False
+        )
+        restore = np.empty_like(order)
+        restore[order] = np.arange(len(order))
+        return {filename : values[restore] for filename, values in sorted_values.items()}
 
-def extract_multiple_bioclim_elev(specimens, dataset, *, trimmed=True):
+    # Memory-mapped files : no GDAL call
+    raw_values = {}
+    for filename in filenames :
+        array = raster_array(filename)
+        if array is not None :
+            with _timed("memory_map") :
+                raw_values[filename] = array.sample(coords, mode, size, radius)
+    mapped_filenames = list(raw_values)
+    filenames = [filename for filename in filenames if filename not in raw_values]
+    if not filenames :
+        return raw_values
+
+    # Rasters to sample : (path, band indexes) of a cube for the files it contains + one per remaining file
+    # (the bands of a cube have different nodata values : window modes sample each file)
+    cube = cube_path(filenames) if mode == "nearest" else None
+    sources = []
+    if cube is not None :
+        sources.append((cube['path'], cube['bands']))
+    sources += [
+        (raster_path(filename), 1) for filename in filenames
+        if cube is None or filename not in cube['filenames']
+    ]
+
+    # Serial sampling from the shared pool
+    if workers is None or workers == 1 or not len(coords) :
+        results = [
+            sample_raster(raster_pool.get(path), coords, cache=pixel_cache, indexes=indexes, mode=mode, size=size, radius=radius)
+            for path, indexes in sources
+        ]
+
+    # Fan out per file x point chunk jobs
+    else :
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        n_chunks = min(-(-workers // len(sources)), len(coords))
+        coords_chunks = np.array_split(coords, n_chunks)
+        cache_settings = (pixel_cache.path, pixel_cache.max_entries) if pixel_cache is not None else None
+        collect_metrics = metrics is not None
+        # Pool of the enclosing worker_pool() block, else a pool for this call
+        shared = getattr(_worker_pool, 'pool', None)
+        with (
+            contextlib.nullcontext(shared[1]) if shared is not None and shared[0] == workers else ProcessPoolExecutor(max_workers=workers)
+        ) as executor :
+            jobs = [
+                [
+                    executor.submit(
+                        _sample_file_job, str(Path(path).resolve()), chunk, cache_settings, indexes, (mode, size, radius), collect_metrics
+                    )
+                    for chunk in coords_chunks
+                ]
+                for path, indexes in sources
+            ]
+            results = []
+            for source_jobs in jobs :
+                chunk_values = [job.result() for job in source_jobs]
+                if collect_metrics :
+                    for _, report in chunk_values :
+                        metrics.merge(report)
+                    chunk_values = [values for values, _ in chunk_values]
+                results.append(np.concatenate(chunk_values, axis=-1))
+
+    if cube is not None :
+        # Cube values back to the dtype of each original file (and its own nodata value outside of the raster)
+        cube_values = results.pop(0)
+        outside = ~pixel_index(raster_pool.get(cube['path']), coords)[2] if len(coords) else np.zeros(0, dtype=bool)
+        for filename, band_values, dtype, nodata in zip(cube['filenames'], cube_values, cube['dtypes'], cube['nodata']) :
+            band_values = band_values.astype(dtype)
+            band_values[outside] = nodata or 0
+            raw_values[filename] = band_values
+    raw_values.update({filename : values for (filename, values) in zip(
+        [filename for filename in filenames if filename not in raw_values], results
+    )})
+    return {filename : raw_values[filename] for filename in mapped_filenames + filenames}
+
+def extract_multiple_bioclim_elev(specimens, dataset, *, trimmed=True, workers=None, mode="nearest", size=3, radius=None):
     """
     Function that extracts the pixel values (for all bioclim variables) from the specified GeoTIFF file for the desired dataset.
-    Calls the extract_bioclim_elev() (thus possibly transform_crs()) method(s) and trim_data() function.
+    Each GeoTIFF file is opened only once and sampled for all the specimens at the same time, the dataframe is then built column by column.
+    Specimens with an EPSG code other than 4326 are transformed in bulk (see CrsPointCollection.to_crs()).
 
     Parameters
     ----------
-    specimens : list
-        List of the CrsDataPoint objects to extract the value of. Can be generated using the load_csv() @classmethod.
+    specimens : list or CrsPointCollection
+        List of the CrsDataPoint objects to extract the value of. Can be generated using the load_csv() @classmethod,
+        or a CrsPointCollection (e.g. from CrsPointCollection.from_csv()).
 
     dataset : str
-        Name of the dataset to extract the data from : "chelsa" or "worldclim".
+        Name of the dataset to extract the data from : "chelsa", "worldclim" or a regional dataset (see clip.py).
+        The values of the data points outside of a regional dataset are NaN.
 
     trimmed : bool
         Sets the amount of details to include in the returned dataframe following the extraction of the data.
-        If false, will return the a dataframe with all columns as the output of the extract_bioclim_elev() method.
-        If true, will return a trimmed dataframe with only the necessary extracted values + specimen information. (Default = True)
+        In both cases the rows only contain the specimen information + the extracted values (same columns as trim_data()).
+        If false, the variables metadata (longname, explanation, unit, ...) is also attached once to the dataframe in df.attrs['metadata'] (see variable_metadata()).
+        If true, no metadata is attached. (Default = True)
+
+    workers : int
+        Number of worker processes used to sample the GeoTIFF files in parallel (see sample_files()).
+        If None, all the files are sampled serially in the current process. (Default = None)
+
+    mode : str
+        Sampling mode : "nearest" pixel, "bilinear" interpolation, or "mean", "median" or "max" of a window around each point,
+        computed for all the points at once (see sample_raster()). (Default = "nearest")
+
+    size : int
+        Size (odd number of pixels) of the square window of the mean, median and max modes. (Default = 3)
+
+    radius : float
+        Radius (in metres) of the window of the mean, median and max modes, replaces size if given. (Default = None)
+
+    Progress messages are printed if enabled with set_verbose(True). If metrics are also enabled with set_metrics(),
+    a summary report of the call (points per second, time per stage, pixels, cache hits and bytes read) is printed at the end
+    (see ExtractionMetrics.summary() to get it without the progress messages).
 
     Returns
     -------
@@ -517,10 +2566,6 @@ def extract_multiple_bioclim_elev(specimens, dataset, *, trimmed=True):
     >>> data = CrsDataPoint.load_csv(csv_file)
 
     >>> df_trimmed = extract_multiple_bioclim_elev(data, 'worldclim', trimmed=True)
-    Data point with x,y other than EPSG:4326. Calling transform_crs() method...
-    ...than extracting values for sherby_transformed at lon=-71.890 lat=45.394 for all climate variables bio1 to bio19 + elevation in WorldClim V2.1 (1970-2000)...
-    Extracting values for paris at lon=2.347 lat=48.859  for all climate variables bio1 to bio19  + elevation in WorldClim 2.1 (1970-2000) dataset...
-    Done!
     >>> print(df_trimmed)
                     id  epsg        lon  ...  bio18 (kg / m**2 / month)  bio19 (kg / m**2 / month)  elevation_Meters
     0  sherby_transformed  4326 -71.890068  ...                      352.0                      195.0               158
@@ -529,20 +2574,332 @@ def extract_multiple_bioclim_elev(specimens, dataset, *, trimmed=True):
     [2 rows x 24 columns]
  
     """
-    
-    # Get list of dictionnaries containing each CrsDataPoint info + full extracted bioclim/elev values
-    multiple_specimens_full = [single_specimen.extract_bioclim_elev(dataset) for single_specimen in specimens]
-    
-    # Full attribute dataframe
-    if trimmed == True:
-        multiple_specimens_trimmed = list(map(trim_data, multiple_specimens_full))
-        df_trimmed = pd.DataFrame(multiple_specimens_trimmed)
-        return df_trimmed        
-    # Trimmed dataframe by calling the trim_data() func
-    elif trimmed == False : 
-        df_full = pd.DataFrame(multiple_specimens_full)
-        return df_full
-    # Handle error
+    # Output columns and metadata of the dataset
+    _dataset_columns(dataset)
+    if not isinstance(trimmed, bool) :
+        raise TypeError("trimmed argument must be a bool")
+    check_sampling(mode, size, radius)
+
+    # Metrics of this call only, for the summary report
+    since = metrics.report() if metrics is not None else None
+    with _timed("extract") :
+        # Transform all data points to EPSG:4326 in bulk before sampling
+        if not isinstance(specimens, CrsPointCollection) :
+            specimens = CrsPointCollection.from_points(specimens)
+        specimens = specimens.to_crs()
+        _progress(
+            "Extracting values for {} data points for all climate variables bio1 to bio19".format(len(specimens)),
+            "+ elevation in {} dataset...".format(dataset_label(dataset))
+        )
+        outside = int(outside_region(dataset, specimens.coords).sum())
+        if outside :
+            _progress("{} data points are outside of the bounds of the {} region, their values are NaN".format(outside, dataset))
+        df = _extract_values(specimens, dataset, trimmed, workers, mode, size, radius)
+
+    if verbose and metrics is not None :
+        _progress(metrics.summary(since))
+    _progress("Done!")
+    return df
+
+# Extraction of a collection of data points already in EPSG:4326 (no progress messages)
+def _extract_values(specimens, dataset, trimmed, workers=None, mode="nearest", size=3, radius=None):
+    columns = _dataset_columns(dataset)
+    # Sample all the points once per GeoTIFF (each unique pixel once)
+    raw_values = sample_files(
+        [v['filename'] for v in columns.values()], specimens.coords, workers=workers, mode=mode, size=size, radius=radius
+    )
+    # Points outside of a regional dataset are read as nodata, NaN instead
+    outside = outside_region(dataset, specimens.coords)
+    if outside.any() :
+        raw_values = {filename : np.where(outside, np.nan, values) for filename, values in raw_values.items()}
+
+    # Build the numeric columns, correcting values with scale + offset where needed (Chelsa)
+    multiple_specimens = {
+        'id' : specimens.ids,
+        'epsg' : specimens.epsg.astype(int),
+        'lon' : specimens.x,
+        'lat' : specimens.y,
+    }
+    with _timed("dataframe") :
+        for column, v in columns.items() :
+            values = raw_values[v['filename']]
+            multiple_specimens[column] = values*v['scale']+v['offset'] if 'scale' in v else values
+
+        df = pd.DataFrame(multiple_specimens, index=range(len(specimens)))
+        # Full dataframe carries the variables metadata once
+        if not trimmed :
+            df.attrs['metadata'] = {column : dict(v) for column, v in columns.items()}
+    if metrics is not None :
+        metrics.add('points', len(specimens))
+    return df
+
+def extract_csv_to_file(csvfile, outfile, dataset, *, chunksize=100000, trimmed=True, workers=None, mode="nearest", size=3, radius=None):
+    """
+    Function that streams the extraction of the bioclim + elevation values from a (large) csv file to an output .csv or .parquet file.
+    The input csv is read by chunks of data points, each chunk is extracted with extract_multiple_bioclim_elev() and appended to the output file,
+    so the memory used is bounded by the chunk size instead of the size of the input file.
+
+    Parameters
+    ----------
+    csvfile : .csv
+        .csv file containing the data points attributes. Header must include : id, epsg, x, y
+
+    outfile : .csv or .parquet
+        Output file, the format is chosen from the extension (.parquet requires the pyarrow library). Must not already exist.
+
+    dataset : str
+        Name of the dataset to extract the data from : "chelsa", "worldclim" or a regional dataset (see clip.py).
+
+    chunksize : int
+        Number of data points read, extracted and written at a time. (Default = 100000)
+
+    trimmed : bool
+        If false, the variables metadata (see variable_metadata()) is also written once to a <outfile>_metadata.csv file next to the output file. (Default = True)
+
+    workers : int
+        Number of worker processes used to sample the GeoTIFF files (see sample_files()). (Default = None)
+
+    mode, size, radius :
+        Sampling mode, window size (in pixels) and radius (in metres), see extract_multiple_bioclim_elev(). (Default = "nearest", 3, None)
+
+    Returns
+    -------
+    n_points : int
+        Number of data points written to the output file
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import extract_csv_to_file
+    >>> extract_csv_to_file("./data/us-state-capitals.csv", "./data/us-capitals_bioclim.csv", 'worldclim', chunksize=20)
+    50
+    """
+    outfile = Path(outfile)
+    if outfile.suffix not in (".csv", ".parquet") :
+        raise ValueError("Output file must be a .csv or .parquet file")
+    if outfile.is_file() :
+        raise FileExistsError(f'{outfile} file already exists!')
+    if not isinstance(chunksize, int) or chunksize < 1 :
+        raise ValueError("chunksize must be a positive integer")
+    check_sampling(mode, size, radius)
+    if outfile.suffix == ".parquet" :
+        try :
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as error :
+            raise ImportError("Writing .parquet files requires the pyarrow library") from error
+
+    # Variables metadata written once instead of in every row
+    if not trimmed :
+        metadata_file = outfile.with_name(outfile.stem+"_metadata.csv")
+        if metadata_file.is_file() :
+            raise FileExistsError(f'{metadata_file} file already exists!')
+        variable_metadata(dataset).to_csv(metadata_file, index_label='column')
+
+    n_points = 0
+    parquet_writer = None
+    chunks = CrsPointCollection.from_csv(csvfile, chunksize=chunksize)
+    # One process pool for all the chunks
+    try :
+        with worker_pool(workers) :
+            for chunk in chunks :
+                df = extract_multiple_bioclim_elev(chunk, dataset, trimmed=trimmed, workers=workers, mode=mode, size=size, radius=radius)
+                # Append to output file (header/schema from the first chunk)
+                if outfile.suffix == ".csv" :
+                    df.to_csv(outfile, mode='a', header=(n_points == 0), index=False)
+                else :
+                    table = pa.Table.from_pandas(df, preserve_index=False)
+                    if parquet_writer is None :
+                        parquet_writer = pq.ParquetWriter(outfile, table.schema)
+                    parquet_writer.write_table(table.cast(parquet_writer.schema))
+                n_points += len(df)
+    finally :
+        chunks.close()
+        if parquet_writer is not None :
+            parquet_writer.close()
+    _progress("Wrote {} data points to {}".format(n_points, outfile))
+    return n_points
+
+def load_geojson(geojson_file):
+    """
+    Function that reads the polygons of a GeoJSON file (FeatureCollection, Feature or bare geometry) for zonal_statistics().
+    Polygons in another CRS than EPSG:4326 (legacy "crs" member) are transformed to EPSG:4326.
+
+    Parameters
+    ----------
+    geojson_file : .geojson
+        GeoJSON file of Polygon or MultiPolygon geometries
+
+    Returns
+    -------
+    polygons : list
+        List of (id, geometry) tuples. The id is the "id" of the feature, else its "id" or "name" property, else its position in the file.
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import load_geojson
+    >>> parks = load_geojson("./data/parks.geojson")
+    >>> parks[0][0]
+    'mont-orford'
+    """
+    with open(geojson_file) as f :
+        geojson = json.load(f)
+    if geojson.get('type') == "FeatureCollection" :
+        features = geojson['features']
+    elif geojson.get('type') == "Feature" :
+        features = [geojson]
+    else :
+        features = [{'type' : "Feature", 'geometry' : geojson, 'properties' : {}}]
+
+    crs_name = geojson.get('crs', {}).get('properties', {}).get('name')
+    polygons = []
+    for i, feature in enumerate(features) :
+        geometry = feature['geometry']
+        if geometry is None or geometry['type'] not in ("Polygon", "MultiPolygon") :
+            raise ValueError("Feature {} is not a Polygon or MultiPolygon".format(i))
+        if crs_name is not None and rasterio.crs.CRS.from_user_input(crs_name) != rasterio.crs.CRS.from_epsg(4326) :
+            geometry = rasterio.warp.transform_geom(crs_name, "EPSG:4326", geometry)
+        properties = feature.get('properties') or {}
+        polygon_id = feature.get('id', properties.get('id', properties.get('name', i)))
+        polygons.append((polygon_id, geometry))
+    return polygons
+
+# Zonal statistics of a group of polygons : each polygon is rasterized once per grid (by strips of rows)
+# and the mask is reused for all the layers on that grid. Streaming mean/std with Chan's parallel variance update.
+def _zonal_job(polygons, filenames, all_touched=False, strip_rows=1024, memory_map_settings=None):
+    if memory_map_settings != memory_map :
+        path, selected = memory_map_settings if memory_map_settings is not None else (None, None)
+        set_memory_map(path, selected)
+    rasters = {}
+    for filename in filenames :
+        raster = raster_array(filename) or raster_pool.get(raster_path(filename))
+        grid = (tuple(raster.transform), raster.width, raster.height)
+        rasters.setdefault(grid, []).append((filename, raster))
+
+    results = []
+    for _, geometry in polygons :
+        stats = {}
+        for grid_rasters in rasters.values() :
+            grid_raster = grid_rasters[0][1]
+            accumulators = {filename : [0, 0.0, 0.0, np.inf, -np.inf] for filename, _ in grid_rasters}    # count, mean, M2, min, max
+            # Bounding window of the polygon within the raster
+            left, bottom, right, top = rasterio.features.bounds(geometry)
+            window = rasterio.windows.from_bounds(left, bottom, right, top, transform=grid_raster.transform)
+            row_start, col_start = max(int(np.floor(window.row_off)), 0), max(int(np.floor(window.col_off)), 0)
+            row_stop = min(int(np.ceil(window.row_off + window.height)), grid_raster.height)
+            col_stop = min(int(np.ceil(window.col_off + window.width)), grid_raster.width)
+            # Polygon outside of the raster (e.g. of a regional dataset) : no pixels, NaN statistics
+            if row_stop > row_start and col_stop > col_start :
+                for strip_start in range(row_start, row_stop, strip_rows) :
+                    strip = rasterio.windows.Window(col_start, strip_start, col_stop - col_start, min(strip_rows, row_stop - strip_start))
+                    mask = rasterio.features.geometry_mask(
+                        [geometry], (strip.height, strip.width), rasterio.windows.transform(strip, grid_raster.transform),
+                        all_touched=all_touched, invert=True
+                    )
+                    if not mask.any() :
+                        continue
+                    for filename, raster in grid_rasters :
+                        if isinstance(raster, RasterArray) :
+                            values = raster.array[strip.row_off:strip.row_off + strip.height, strip.col_off:strip.col_off + strip.width]
+                        else :
+                            values = raster.read(1, window=strip)
+                        values = values[mask].astype(float)
+                        values = values[~np.isnan(values)]
+                        if raster.nodata is not None :
+                            values = values[values != raster.nodata]
+                        if not len(values) :
+                            continue
+                        acc = accumulators[filename]
+                        count, mean = len(values), values.mean()
+                        delta, total = mean - acc[1], acc[0] + count
+                        acc[2] += ((values - mean)**2).sum() + delta**2 * acc[0] * count / total
+                        acc[1] += delta * count / total
+                        acc[0] = total
+                        acc[3], acc[4] = min(acc[3], values.min()), max(acc[4], values.max())
+            for filename, (count, mean, m2, minimum, maximum) in accumulators.items() :
+                stats[filename] = (
+                    (mean, minimum, maximum, np.sqrt(m2 / count), count) if count else (np.nan, np.nan, np.nan, np.nan, 0)
+                )
+        results.append(stats)
+    return results
+
+def zonal_statistics(polygons, dataset, *, workers=None, all_touched=False):
+    """
+    Function that computes the zonal statistics (mean, min, max, std and count of the valid pixels) of all the bioclim variables + elevation over polygons.
+    Each polygon is rasterized once per raster grid and its mask is reused for all the layers, only the bounding window of the polygon is read
+    (by strips of rows, with streaming statistics) and the polygons are processed in parallel with workers.
+
+    Parameters
+    ----------
+    polygons : str, Path or list
+        GeoJSON file of the polygons (see load_geojson()), or list of (id, GeoJSON geometry) tuples in EPSG:4326.
+
+    dataset : str
+        Name of the dataset to extract the data from : "chelsa", "worldclim" or a regional dataset (see clip.py).
+
+    workers : int
+        Number of worker processes the polygons are split between. If None or 1, the polygons are processed in the current process. (Default = None)
+
+    all_touched : bool
+        If true, all the pixels touched by a polygon are included, otherwise only the pixels whose center is within the polygon. (Default = False)
+
+    Returns
+    -------
+    df : pandas DataFrame
+        One row per polygon with its id and "<column>_<statistic>" columns (e.g. "bio1 (Celcius)_mean"), corrected with scale + offset where needed (Chelsa).
+        Statistics are NaN (and count 0) for a polygon without valid pixels.
+
+    Examples
+    --------
+    >>> from scripts.data_extraction import zonal_statistics
+    >>> df = zonal_statistics("./data/parks.geojson", 'chelsa', workers=4)
+    >>> df[['id', 'bio1 (Celcius)_mean', 'bio1 (Celcius)_count']]
+    """
+    columns = _dataset_columns(dataset)
+    if workers is not None and (not isinstance(workers, int) or workers < 1) :
+        raise ValueError("workers must be a positive integer")
+    if isinstance(polygons, (str, Path)) :
+        polygons = load_geojson(polygons)
+    polygons = list(polygons)
+    filenames = list(dict.fromkeys(v['filename'] for v in columns.values()))
+    _progress(
+        "Computing zonal statistics of {} polygons for all climate variables bio1 to bio19".format(len(polygons)),
+        "+ elevation in {} dataset...".format(dataset_label(dataset))
+    )
+
+    # Memory-mapped layers are decompressed once before the workers start
+    for filename in filenames :
+        raster_array(filename)
+
+    if workers is None or workers == 1 or len(polygons) < 2 :
+        results = _zonal_job(polygons, filenames, all_touched, memory_map_settings=memory_map)
     else :
-        raise TypeError("trimmed argument must be a bool") 
-    
\ No newline at end of file
+        # Polygons dealt round-robin so that large and small polygons are spread between the jobs
+        n_jobs = min(4*workers, len(polygons))
+        with ProcessPoolExecutor(max_workers=workers) as executor :
+            jobs = [
+                executor.submit(_zonal_job, polygons[i::n_jobs], filenames, all_touched, memory_map_settings=memory_map)
+                for i in range(n_jobs)
+            ]
+            job_results = [job.result() for job in jobs]
+        results = [None] * len(polygons)
+        for i, job_result in enumerate(job_results) :
+            results[i::n_jobs] = job_result
+
+    # One row per polygon, statistics corrected with scale + offset (min and max swap for a negative scale)
+    zonal_data = {'id' : [polygon_id for polygon_id, _ in polygons]}
+    for column, v in columns.items() :
+        mean, minimum, maximum, std, count = (np.array(values, dtype=float) for values in zip(*[
+            stats[v['filename']] for stats in results
+        ])) if results else [np.array([])] * 5
+        if 'scale' in v :
+            mean, minimum, maximum, std = (
+                mean*v['scale']+v['offset'], minimum*v['scale']+v['offset'], maximum*v['scale']+v['offset'], std*abs(v['scale'])
+            )
+            if v['scale'] < 0 :
+                minimum, maximum = maximum, minimum
+        zonal_data.update({
+            column+"_mean" : mean, column+"_min" : minimum, column+"_max" : maximum, column+"_std" : std,
+            column+"_count" : count.astype(int),
+        })
+    _progress("Done!")
+    return pd.DataFrame(zonal_data, index=range(len(polygons)))
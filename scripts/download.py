@@ -1,8 +1,11 @@
 import yaml
 import requests
 import time
-from functools import partial
-from zipfile import ZipFile
+import json
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
 from pathlib import Path
 
@@ -12,74 +15,311 @@ def get_urls(urlfile):
         urls = [line.rstrip() for line in f]
         return urls
 
-# Download a single file
-def download_single(url, savepath):
-    filename = url.split("/")[-1]
+# Size of the chunks written to disk
+chunksize = 1024 * 1024
+
+# Bytes downloaded by a range between two saves of the resume state (each save syncs the .part file to disk)
+save_interval = 16 * 1024 * 1024
+
+# Raised when the remote file changed since the start of an interrupted download (If-Range answered with the whole file)
+class RemoteFileChanged(IOError) :
+    pass
+
+# Get file size, range requests support and validator (strong ETag, else Last-Modified) from the server
+def get_file_info(url, session=requests):
+    response = session.head(url, allow_redirects=True)
+    response.raise_for_status()
+    size = response.headers.get('Content-Length')
+    accept_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+    etag = response.headers.get('ETag')
+    validator = etag if etag is not None and not etag.startswith('W/') else response.headers.get('Last-Modified')
+    return (int(size) if size is not None else None), accept_ranges, validator
+
+# Split [0, size) in n_ranges contiguous byte ranges [start, end]
+def split_ranges(size, n_ranges):
+    bounds = [size * i // n_ranges for i in range(n_ranges + 1)]
+    return [(bounds[i], bounds[i+1] - 1) for i in range(n_ranges) if bounds[i+1] > bounds[i]]
+
+# Download one byte range into the .part file, resuming after the bytes already written
+# The resume state only counts the bytes synced to disk, it is saved every save_interval bytes and when the range stops
+def download_range(url, partpath, start, end, state, lock, session=requests):
+    key = str(start)
+    offset = start + state['ranges'][key]
+    if offset > end :
+        return 0
+    written, unsaved = 0, 0
+    headers = {'Range' : 'bytes={}-{}'.format(offset, end)}
+    if state['validator'] is not None :
+        headers['If-Range'] = state['validator']
+    with session.get(url, headers=headers, stream=True) as response :
+        response.raise_for_status()
+        if response.status_code == 200 and 'If-Range' in headers :
+            raise RemoteFileChanged("{} changed on the server since the download started".format(url))
+        if response.status_code != 206 :
+            raise IOError("Server did not honor range request for {}".format(url))
+        with open(partpath, 'r+b') as f :
+            f.seek(offset)
+            try :
+                for chunk in response.iter_content(chunk_size=chunksize) :
+                    f.write(chunk)
+                    written += len(chunk)
+                    unsaved += len(chunk)
+                    if unsaved >= save_interval :
+                        checkpoint_range(f, partpath, key, unsaved, state, lock)
+                        unsaved = 0
+            finally :
+                if unsaved :
+                    checkpoint_range(f, partpath, key, unsaved, state, lock)
+    return written
+
+# Sync the bytes written by a range to disk, then count them in the saved resume state
+def checkpoint_range(f, partpath, key, n_bytes, state, lock):
+    f.flush()
+    os.fsync(f.fileno())
+    with lock :
+        state['ranges'][key] += n_bytes
+        save_progress(partpath, state)
+
+# Resume state of a .part file : validator and size of the remote file, bytes written per range
+def load_progress(partpath):
     try :
-        response = requests.get(url, stream=True)
-        print("\n####   Trying get request...   ####")
-        # Calc file size in MB
-        total_size = (float(response.headers['Content-Length']))/1000000
-        print("{} is {:.1f} MB".format(filename, total_size))
-        # Download in chunks of 5 MB and save to disk
-        if response.status_code == 200 : 
-            print("Server response OK from {}, starting to download {}".format((url.split("/")[2]), filename))
-            with open(savepath+filename, 'wb') as f :
-                chunksize = 1024 * 5000
-                start_time = time.time()
-                for n, chunk in enumerate(response.iter_content(chunk_size=chunksize)) :
-                    percent = (n * chunksize / (total_size*1000000)) * 100
-                    now_time = time.time()
-                    current_speed = (n * chunksize) / (now_time - start_time) / 1000000
-                    print(
-                        "Progress for {} : {:.2f} % completed of {:.1f} MB downloaded [ current speed of  {:.1f} MB/s ]"
-                        .format(filename, percent, total_size, current_speed), end="\r"
-                        )
-                    time.sleep(0.1)
+        with open(partpath+".json") as f :
+            state = json.load(f)
+    except (OSError, ValueError) :
+        return None
+    return state if isinstance(state, dict) and {'validator', 'size', 'ranges'} <= set(state) else None
+
+# Written to a temporary file then swapped in, so an interruption leaves the previous state
+def save_progress(partpath, state):
+    tmppath = partpath+".json.tmp"
+    with open(tmppath, 'w') as f :
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmppath, partpath+".json")
+
+# Download a single file (in parallel byte ranges when supported), resuming an interrupted .part download
+# The download restarts from scratch (once) if the remote file changed since it was interrupted
+def download_single(url, savepath, n_ranges=4, session=requests, restart=True):
+    filename = url.split("/")[-1]
+    filepath = savepath+filename
+    partpath = filepath+".part"
+    size, accept_ranges, validator = get_file_info(url, session)
+    if size is not None and os.path.exists(filepath) and os.path.getsize(filepath) == size :
+        print("{} already downloaded, skipping".format(filename))
+        return filepath, 0
+    print("Server response OK from {}, starting to download {} ({} MB)".format(
+        url.split("/")[2], filename, "{:.1f}".format(size/1000000) if size is not None else "unknown"
+    ))
+    start_time = time.time()
+
+    # Parallel range requests, resumable from the .part file progress of the same remote file (validator and size)
+    if accept_ranges and size :
+        ranges = split_ranges(size, n_ranges)
+        state = load_progress(partpath)
+        if (
+            state is None or not os.path.exists(partpath) or validator is None
+            or state['validator'] != validator or state['size'] != size
+            or sorted(state['ranges'], key=int) != [str(start) for start, _ in ranges]
+        ) :
+            state = {'validator' : validator, 'size' : size, 'ranges' : {str(start) : 0 for start, _ in ranges}}
+            with open(partpath, 'wb') as f :
+                f.truncate(size)
+            save_progress(partpath, state)
+        else :
+            print("Resuming {} from {:.1f} MB".format(filename, sum(state['ranges'].values())/1000000))
+        lock = threading.Lock()
+        try :
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor :
+                jobs = [
+                    executor.submit(download_range, url, partpath, start, end, state, lock, session)
+                    for start, end in ranges
+                ]
+                downloaded = sum(job.result() for job in jobs)
+        except RemoteFileChanged :
+            if not restart :
+                raise
+            print("{} changed on the server, restarting the download".format(filename))
+            os.remove(partpath+".json")
+            return download_single(url, savepath, n_ranges, session, restart=False)
+        os.remove(partpath+".json")
+
+    # Single stream for servers without range requests support
+    else :
+        downloaded = 0
+        with session.get(url, stream=True) as response :
+            response.raise_for_status()
+            with open(partpath, 'wb') as f :
+                for chunk in response.iter_content(chunk_size=chunksize) :
                     f.write(chunk)
-                end_time = time.time()
-                print(
-                    "Progress for {} : 100.00 % completed of {:.1f} MB downloaded [ average speed of  {:.1f} MB/s ]         "
-                    .format(filename, total_size, total_size/(end_time-start_time)), end="\r"
-                    )
-                print()
-                print(
-                    "Done downloading {} in {:.2f} seconds !"
-                    .format(filename, end_time-start_time,)
-                    )
-                    
-    except :
-        print("File {} cannot be downloaded. Status code : {}".format(filename, response.status_code))
-    return savepath+filename
-
-def unzip_worldclim(download_path, biozip, elevzip) :
-    # Unzipping wc2.1_30s_bio.zip
-    print("Extracting {} to {} directory...".format(biozip, download_path))
-    with ZipFile(download_path+biozip) as zipObj_bio :
-        for file in zipObj_bio.namelist() :
-            print("Unzipping file {}...".format(file))
-            zipObj_bio.extract(file, download_path)
+                    downloaded += len(chunk)
+
+    # Verify Content-Length before moving .part file to its final name
+    if size is not None and os.path.getsize(partpath) != size :
+        raise IOError("Downloaded {} is {} bytes, expected {} bytes".format(filename, os.path.getsize(partpath), size))
+    os.replace(partpath, filepath)
+    end_time = time.time()
+    print(
+        "Done downloading {} in {:.2f} seconds ! [ average speed of {:.1f} MB/s ]"
+        .format(filename, end_time-start_time, downloaded/max(end_time-start_time, 1e-9)/1000000)
+        )
+    return filepath, downloaded
+
+# Download several files concurrently and report aggregate throughput
+def download_all(urls, savepath, max_files=4, n_ranges=4, session=requests):
+    start_time = time.time()
+    downloaded, failed = 0, []
+    with ThreadPoolExecutor(max_workers=max_files) as executor :
+        jobs = {executor.submit(download_single, url, savepath, n_ranges, session) : url for url in urls}
+        for job in as_completed(jobs) :
+            try :
+                _, file_downloaded = job.result()
+                downloaded += file_downloaded
+            except (requests.RequestException, OSError) as error :
+                failed.append(jobs[job])
+                print("File {} cannot be downloaded : {}".format(jobs[job].split("/")[-1], error))
+    elapsed = time.time() - start_time
+    print(
+        "Downloaded {:.1f} MB from {} files in {:.2f} seconds [ aggregate speed of {:.1f} MB/s ]"
+        .format(downloaded/1000000, len(urls)-len(failed), elapsed, downloaded/max(elapsed, 1e-9)/1000000)
+        )
+    if failed :
+        print("{} file(s) failed, run the download again to resume them : {}".format(len(failed), failed))
+    return failed
+
+# Buffered reader over an iterable of bytes chunks (e.g. an HTTP response being downloaded)
+class _ChunkReader :
+    def __init__(self, chunks) :
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def read(self, n) :
+        while len(self._buffer) < n :
+            chunk = next(self._chunks, None)
+            if chunk is None :
+                break
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:n], self._buffer[n:]
+        return data
+
+    def read_some(self) :
+        if not self._buffer :
+            self._buffer = next(self._chunks, b"")
+        data, self._buffer = self._buffer, b""
+        return data
+
+    def unread(self, data) :
+        self._buffer = data + self._buffer
+
+    def read_exact(self, n) :
+        data = self.read(n)
+        if len(data) != n :
+            raise IOError("Unexpected end of zip stream")
+        return data
+
+# Extract the members of a zip archive while its bytes arrive, verifying the CRC of each member
+def stream_unzip(chunks, download_path, convert=None):
+    reader = _ChunkReader(chunks)
+    extracted = []
+    conversions = []
+    with ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) - 1)) as executor :
+        while True :
+            # Local file headers come first, the central directory (PK\x01\x02) marks the end of the members
+            if reader.read(4) != b"PK\x03\x04" :
+                break
+            _, flags, method, _, _, crc, csize, usize, name_len, extra_len = struct.unpack("<HHHHHIIIHH", reader.read_exact(26))
+            name = reader.read_exact(name_len).decode('utf-8' if flags & 0x800 else 'cp437')
+            extra = reader.read_exact(extra_len)
+            # Zip64 sizes in the extra field
+            zip64 = False
+            while len(extra) >= 4 :
+                field_id, field_len = struct.unpack("<HH", extra[:4])
+                if field_id == 0x0001 :
+                    zip64 = True
+                    field = extra[4:4+field_len]
+                    if usize == 0xFFFFFFFF :
+                        usize, field = struct.unpack("<Q", field[:8])[0], field[8:]
+                    if csize == 0xFFFFFFFF :
+                        csize = struct.unpack("<Q", field[:8])[0]
+                extra = extra[4+field_len:]
+            if method not in (0, 8) or (method == 0 and flags & 0x08) :
+                raise IOError("Unsupported compression for zip member {}".format(name))
+
+            # Write member to download_path (flat, as in the WorldClim archives)
+            filename = os.path.basename(name)
+            filepath = download_path+filename
+            print("Unzipping file {}...".format(name))
+            member_crc, written = 0, 0
+            with open(filepath+".part", 'wb') if filename else open(os.devnull, 'wb') as f :
+                if method == 8 :
+                    decompressor = zlib.decompressobj(-15)
+                    while not decompressor.eof :
+                        data = reader.read_some()
+                        if not data :
+                            raise IOError("Unexpected end of zip stream")
+                        out = decompressor.decompress(data)
+                        member_crc, written = zlib.crc32(out, member_crc), written + len(out)
+                        f.write(out)
+                    reader.unread(decompressor.unused_data)
+                else :
+                    remaining = csize
+                    while remaining :
+                        data = reader.read_exact(min(remaining, chunksize))
+                        member_crc, written, remaining = zlib.crc32(data, member_crc), written + len(data), remaining - len(data)
+                        f.write(data)
+            # CRC and size from the data descriptor if not in the local header
+            if flags & 0x08 :
+                descriptor = reader.read_exact(4)
+                if descriptor == b"PK\x07\x08" :
+                    descriptor = reader.read_exact(4)
+                crc = struct.unpack("<I", descriptor)[0]
+                usize = struct.unpack("<QQ" if zip64 else "<II", reader.read_exact(16 if zip64 else 8))[1]
+            if not filename :
+                continue
+            if member_crc != crc or written != usize :
+                os.remove(filepath+".part")
+                raise IOError("CRC check failed for zip member {}".format(name))
+            os.replace(filepath+".part", filepath)
+            extracted.append(filepath)
             print("Done !")
-    
-    print("Deleting unecessary .zip files...")  # deleting
-    if os.path.exists(download_path+biozip):
-        os.remove(download_path+biozip)
-        print("Deleted {}".format(biozip))
-    else:
-        print("Could not find {}".format(biozip))
-    
-    # Unzipping wc2.1_30s_elev.zip
-    with ZipFile(download_path+elevzip) as zipObj_elev :
-        print("Unzipping file {}...".format(elevzip))
-        zipObj_elev.extractall(download_path)
-        print("Done !")
-    
-    print("Deleting unecessary .zip files...")  # deleting
-    if os.path.exists(download_path+elevzip):
-        os.remove(download_path+elevzip)
-        print("Deleted {}".format(elevzip))
-    else:
-        print("Could not find {}".format(elevzip))
+            # Convert member in the background while the next members are extracted
+            if convert is not None :
+                conversions.append(executor.submit(convert, filepath))
+        for conversion in conversions :
+            conversion.result()
+    return extracted
+
+# Download a zip archive and extract its members on the fly (the archive itself is never written to disk)
+def download_unzip(url, download_path, convert=None, session=requests):
+    print("Streaming {} from {} to {} directory...".format(url.split("/")[-1], url.split("/")[2], download_path))
+    start_time = time.time()
+    with session.get(url, stream=True) as response :
+        response.raise_for_status()
+        extracted = stream_unzip(response.iter_content(chunk_size=chunksize), download_path, convert)
+    print("Done extracting {} files in {:.2f} seconds !".format(len(extracted), time.time()-start_time))
+    return extracted
+
+# Read a file on disk by chunks
+def read_chunks(filepath):
+    with open(filepath, 'rb') as f :
+        while True :
+            chunk = f.read(chunksize)
+            if not chunk :
+                break
+            yield chunk
+
+def unzip_worldclim(download_path, biozip, elevzip, convert=None) :
+    for zipname in (biozip, elevzip) :
+        # Unzipping wc2.1_30s_bio.zip / wc2.1_30s_elev.zip (CRC verified)
+        print("Extracting {} to {} directory...".format(zipname, download_path))
+        stream_unzip(read_chunks(download_path+zipname), download_path, convert)
+
+        print("Deleting unecessary .zip files...")  # deleting
+        if os.path.exists(download_path+zipname):
+            os.remove(download_path+zipname)
+            print("Deleted {}".format(zipname))
+        else:
+            print("Could not find {}".format(zipname))
 
 
 if __name__ == "__main__" :
@@ -114,29 +354,24 @@ if __name__ == "__main__" :
             print("Initiating download of {} dataset...".format(to_download))
             break
 
-    # Download all user-wanted files
-    download_fixpath = partial(download_single, savepath = download_path)   # fix download_single with a single arg
-    # zipfiles name for WorldClim
-    wc_biozip = "wc2.1_30s_bio.zip"
-    wc_elevzip = "wc2.1_30s_elev.zip"
-
     # Chelsa dataset only
     if to_download == "chelsa" :
         chelsa = get_urls(chelsa_urls)
-        list(map(download_fixpath, chelsa))
+        download_all(chelsa, download_path)
         print("Finished downloading CHELSA V2.1 bioclim dataset")
     
     elif to_download == "worldclim" :
-        # worldclim = get_urls(worldclim_urls)
-        # list(map(download_fixpath, worldclim))
+        worldclim = get_urls(worldclim_urls)
+        for url in worldclim :
+            download_unzip(url, download_path)
         print("Finished downloading WorldClim V2.1 bioclim + elevation dataset")
-        unzip_worldclim(download_path, wc_biozip, wc_elevzip)
 
     else : 
         chelsa = get_urls(chelsa_urls)
         worldclim = get_urls(worldclim_urls)
-        list(map(download_fixpath, chelsa))
+        download_all(chelsa, download_path)
         print("Finished downloading CHELSA V2.1 bioclim dataset")
-        list(map(download_fixpath, worldclim))
-        unzip_worldclim(download_path, wc_biozip, wc_elevzip)
+        for url in worldclim :
+            download_unzip(url, download_path)
+        print("Finished downloading WorldClim V2.1 bioclim + elevation dataset")
         
\ No newline at end of file
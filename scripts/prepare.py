@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from scripts import data_extraction
+from scripts.data_extraction import (
+    chelsa_data, worldclim_data, raster_pool, raster_path, sample_raster, variable_metadata
+)
+
+# Filenames of all the layers listed in config.yaml for each dataset
+def dataset_filenames(dataset):
+    if dataset == "chelsa" :
+        return [v['filename'] for v in chelsa_data.values()]
+    elif dataset == "worldclim" :
+        return [v['filename'] for v in worldclim_data.values()]
+    elif dataset == "both" :
+        return dataset_filenames("chelsa") + dataset_filenames("worldclim")
+    else :
+        raise ValueError("Enter the dataset to prepare : \"chelsa\", \"worldclim\" or \"both\"")
+
+# Rewrite a GeoTIFF with small internal tiles and a fast codec + predictor, reading one row of tiles at a time
+def prepare_layer(filename, blocksize=128, compress="ZSTD"):
+    src_path = data_extraction.data_dir / filename
+    dst_path = data_extraction.prepared_dir / filename
+    start_time = time.time()
+    with rasterio.open(src_path) as src :
+        profile = src.profile
+        profile.update(
+            driver="GTiff", tiled=True, blockxsize=blocksize, blockysize=blocksize, compress=compress,
+            predictor=3 if np.dtype(src.dtypes[0]).kind == 'f' else 2, interleave="band", bigtiff="IF_SAFER",
+        )
+        with rasterio.open(str(dst_path)+".part", 'w', **profile) as dst :
+            for row_off in range(0, src.height, blocksize) :
+                window = Window(0, row_off, src.width, min(blocksize, src.height - row_off))
+                dst.write(src.read(window=window), window=window)
+    os.replace(str(dst_path)+".part", dst_path)
+    stat = src_path.stat()
+    print("Prepared {} in {:.1f} seconds".format(filename, time.time()-start_time))
+    return filename, {
+        'prepared' : filename,
+        'source_size' : stat.st_size,
+        'source_mtime' : stat.st_mtime_ns,
+        'blocksize' : blocksize,
+        'compress' : compress,
+    }
+
+# Prepare all layers in parallel and record them in the manifest
+def prepare_all(filenames, blocksize=128, compress="ZSTD", workers=None):
+    os.makedirs(data_extraction.prepared_dir, exist_ok=True)
+    manifest_file = data_extraction.prepared_dir / "manifest.json"
+    manifest = {}
+    if manifest_file.is_file() :
+        with open(manifest_file) as f :
+            manifest = json.load(f)
+    with ProcessPoolExecutor(max_workers=workers) as executor :
+        jobs = [executor.submit(prepare_layer, filename, blocksize, compress) for filename in dict.fromkeys(filenames)]
+        for job in jobs :
+            filename, entry = job.result()
+            manifest[filename] = entry
+    with open(str(manifest_file)+".part", 'w') as f :
+        json.dump(manifest, f, indent=2)
+    os.replace(str(manifest_file)+".part", manifest_file)
+    print("Wrote manifest of {} prepared files to {}".format(len(manifest), manifest_file))
+    return manifest
+
+# Stack all layers of a dataset sharing the same grid in a single pixel-interleaved GeoTIFF : one block read returns every variable of a pixel
+def build_cube(dataset, blocksize=128, compress="ZSTD"):
+    metadata = variable_metadata(dataset)
+    start_time = time.time()
+    layers, grid = [], None
+    for column, filename in metadata['filename'].items() :
+        with rasterio.open(data_extraction.data_dir / filename) as src :
+            layer_grid = (src.crs, src.transform, src.width, src.height)
+            if grid is None :
+                grid, profile = layer_grid, src.profile
+            if layer_grid != grid :
+                # Kept out of the cube (and sampled from its own file) rather than resampled to keep the extracted values identical
+                print("Skipping {} in the {} cube : not on the same grid as {}".format(filename, dataset, layers[0][1]))
+                continue
+            stat = (data_extraction.data_dir / filename).stat()
+            layers.append((column, filename, {
+                'filename' : filename,
+                'dtype' : src.dtypes[0],
+                'nodata' : src.nodata,
+                'source_size' : stat.st_size,
+                'source_mtime' : stat.st_mtime_ns,
+            }))
+    dtype = np.result_type(*[layer[2]['dtype'] for layer in layers])
+    cube_name = "{}_cube.tif".format(dataset)
+    dst_path = data_extraction.prepared_dir / cube_name
+    os.makedirs(data_extraction.prepared_dir, exist_ok=True)
+    profile.update(
+        driver="GTiff", count=len(layers), dtype=dtype, nodata=None, tiled=True, blockxsize=blocksize, blockysize=blocksize,
+        compress=compress, predictor=3 if dtype.kind == 'f' else 2, interleave="pixel", bigtiff="IF_SAFER",
+    )
+    sources = [rasterio.open(data_extraction.data_dir / filename) for _, filename, _ in layers]
+    try :
+        with rasterio.open(str(dst_path)+".part", 'w', **profile) as dst :
+            for i, (column, filename, _) in enumerate(layers) :
+                dst.set_band_description(i+1, column)
+                dst.update_tags(i+1, filename=filename)
+            # config.yaml scale + offset (Chelsa) and unit of each band, so that other readers of the cube get the corrected values
+            bands = metadata.reindex(columns=['scale', 'offset', 'unit']).loc[[column for column, _, _ in layers]]
+            dst.scales = bands['scale'].fillna(1.0).tolist()
+            dst.offsets = bands['offset'].fillna(0.0).tolist()
+            dst.units = bands['unit'].tolist()
+            # Windows of one row of tiles x 16 tiles, all bands at once
+            for row_off in range(0, dst.height, blocksize) :
+                for col_off in range(0, dst.width, 16*blocksize) :
+                    window = Window(col_off, row_off, min(16*blocksize, dst.width - col_off), min(blocksize, dst.height - row_off))
+                    dst.write(np.stack([src.read(1, window=window).astype(dtype) for src in sources]), window=window)
+    finally :
+        for src in sources :
+            src.close()
+    os.replace(str(dst_path)+".part", dst_path)
+    print("Built {} cube of {} layers in {:.1f} seconds".format(dataset, len(layers), time.time()-start_time))
+    return cube_name, {
+        'prepared' : cube_name,
+        'bands' : [layer[2] for layer in layers],
+        'blocksize' : blocksize,
+        'compress' : compress,
+    }
+
+# Build the cubes of the datasets and record them in the manifest
+def build_cubes(datasets, blocksize=128, compress="ZSTD"):
+    manifest_file = data_extraction.prepared_dir / "manifest.json"
+    entries = [build_cube(dataset, blocksize, compress) for dataset in datasets]
+    manifest = {}
+    if manifest_file.is_file() :
+        with open(manifest_file) as f :
+            manifest = json.load(f)
+    manifest.update(entries)
+    with open(str(manifest_file)+".part", 'w') as f :
+        json.dump(manifest, f, indent=2)
+    os.replace(str(manifest_file)+".part", manifest_file)
+    return manifest
+
+# Time random single point lookups on the original and prepared files
+def benchmark_lookups(filenames, n_points=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    coords = np.column_stack([rng.uniform(-180, 180, n_points), rng.uniform(-60, 80, n_points)])
+    timings = {}
+    for label, path in (("original", lambda filename : data_extraction.data_dir / filename), ("prepared", raster_path)) :
+        raster_pool.close()
+        start_time = time.time()
+        for filename in filenames :
+            tiff = raster_pool.get(path(filename))
+            for xy in coords :
+                sample_raster(tiff, [xy])
+        timings[label] = (time.time()-start_time) / (n_points*len(filenames))
+        print("{} : {:.1f} microseconds per point lookup".format(label, timings[label]*1e6))
+    print("Speedup : {:.2f}x".format(timings["original"]/timings["prepared"]))
+    return timings
+
+
+if __name__ == "__main__" :
+    parser = argparse.ArgumentParser(description="Rewrite the bioclim GeoTIFF files in a point-query friendly layout.")
+    parser.add_argument("dataset", choices=["chelsa", "worldclim", "both"])
+    parser.add_argument("--blocksize", type=int, default=128, help="internal tile size in pixels (multiple of 16)")
+    parser.add_argument("--compress", default="ZSTD", help="GDAL compression codec (e.g. ZSTD, LZW, DEFLATE)")
+    parser.add_argument("--workers", type=int, default=None, help="number of layers prepared in parallel")
+    parser.add_argument("--cube", action="store_true", help="also stack the layers of each dataset in a multi-band cube")
+    parser.add_argument("--benchmark", action="store_true", help="time random point lookups before/after")
+    args = parser.parse_args()
+
+    filenames = dataset_filenames(args.dataset)
+    prepare_all(filenames, args.blocksize, args.compress, args.workers)
+    if args.cube :
+        build_cubes(["chelsa", "worldclim"] if args.dataset == "both" else [args.dataset], args.blocksize, args.compress)
+    if args.benchmark :
+        benchmark_lookups(filenames)
@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import collections
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+from scripts.data_extraction import (
+    CrsPointCollection, variable_metadata, raster_pool, raster_path, raster_array, sample_raster,
+    set_memory_map, set_pixel_cache
+)
+from scripts.async_extraction import BatchExtractor
+
+
+class ServiceMetrics :
+    """
+    Thread-safe counters of the extraction service : requests, data points, errors, latency percentiles (over the last requests)
+    and throughput (over the last minute and since start).
+    """
+
+    def __init__(self, n_latencies=10000) :
+        self.started = time.time()
+        self.requests = 0
+        self.points = 0
+        self.errors = 0
+        self._latencies = collections.deque(maxlen=n_latencies)
+        self._recent = collections.deque()
+        self._lock = threading.Lock()
+
+    def record(self, n_points, latency, error=False) :
+        now = time.time()
+        with self._lock :
+            self.requests += 1
+            self.errors += error
+            self.points += n_points
+            self._latencies.append(latency)
+            self._recent.append((now, n_points))
+            while self._recent and self._recent[0][0] < now - 60 :
+                self._recent.popleft()
+
+    def snapshot(self) :
+        now = time.time()
+        with self._lock :
+            latencies = np.array(self._latencies)
+            recent = [(t, n) for t, n in self._recent if t >= now - 60]
+        uptime = now - self.started
+        return {
+            'uptime_seconds' : round(uptime, 3),
+            'requests' : self.requests,
+            'points' : self.points,
+            'errors' : self.errors,
+            'latency_ms' : {
+                name : round(float(np.percentile(latencies, q))*1000, 3) if len(latencies) else None
+                for name, q in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))
+            },
+            'throughput' : {
+                'points_per_second_1min' : round(sum(n for _, n in recent) / min(60, uptime), 1) if uptime else 0.0,
+                'requests_per_second_1min' : round(len(recent) / min(60, uptime), 1) if uptime else 0.0,
+                'points_per_second' : round(self.points / uptime, 1) if uptime else 0.0,
+            },
+        }
+
+
+class ExtractionService(ThreadingHTTPServer) :
+    """
+    Local HTTP service extracting the bioclim + elevation values of batches of data points, keeping the rasters open and warm.
+    Concurrent requests are coalesced into batched extractions by a BatchExtractor running on a background event loop.
+
+    Endpoints
+    ---------
+    POST /extract?dataset=chelsa&trimmed=true
+        Body : JSON list of {"id", "epsg", "x", "y"} data points (or {"points" : [...]}), or a csv with an id,epsg,x,y header (Content-Type: text/csv).
+        Returns the values as JSON ({"data" : [...]} + "metadata" if not trimmed), or as csv if the request body was csv or Accept is text/csv.
+    GET /metrics
+        Returns the ServiceMetrics counters as JSON.
+    GET /health
+        Returns {"status" : "ok"}.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, window=0.005, max_batch=10000, max_workers=4, timeout=300, verbose=False) :
+        super().__init__(address, _RequestHandler)
+        self.timeout_seconds = timeout
+        self.verbose = verbose
+        self.metrics = ServiceMetrics()
+        self.extractor = BatchExtractor(window=window, max_batch=max_batch, max_workers=max_workers)
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self.loop.run_forever, name="bioclim-service-loop", daemon=True)
+        self._loop_thread.start()
+
+    def extract(self, points, dataset, trimmed=True) :
+        """
+        Extracts the data points through the batching event loop (called from the request handler threads).
+        """
+        future = asyncio.run_coroutine_threadsafe(self.extractor.extract(points, dataset, trimmed), self.loop)
+        try :
+            return future.result(self.timeout_seconds)
+        except TimeoutError :
+            future.cancel()
+            raise
+
+    def warm(self, datasets=("chelsa", "worldclim")) :
+        """
+        Opens all the rasters of the datasets in every extraction thread and reads one pixel of each, so the first requests are not slowed down.
+        """
+        filenames = list(dict.fromkeys(
+            filename for dataset in datasets for filename in variable_metadata(dataset)['filename']
+        ))
+        n_workers = self.extractor.max_workers
+        barrier = threading.Barrier(n_workers)
+
+        # One job per thread : the barrier keeps each job on its own thread
+        def warm_thread() :
+            for filename in filenames :
+                if raster_array(filename) is None :
+                    sample_raster(raster_pool.get(raster_path(filename)), [(0.0, 0.0)])
+            barrier.wait()
+
+        start_time = time.time()
+        for job in [self.extractor.executor.submit(warm_thread) for _ in range(n_workers)] :
+            job.result()
+        print("Warmed {} rasters in {} threads in {:.1f} seconds".format(len(filenames), n_workers, time.time()-start_time))
+
+    def server_close(self) :
+        super().server_close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._loop_thread.join()
+        self.extractor.close()
+
+
+class _RequestHandler(BaseHTTPRequestHandler) :
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args) :
+        if self.server.verbose :
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type="application/json") :
+        body = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) :
+        path = urlparse(self.path).path
+        if path == "/metrics" :
+            self._send(200, json.dumps(self.server.metrics.snapshot()))
+        elif path == "/health" :
+            self._send(200, json.dumps({'status' : "ok"}))
+        else :
+            self._send(404, json.dumps({'error' : "Not found : {}".format(path)}))
+
+    def do_POST(self) :
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if url.path != "/extract" :
+            self._send(404, json.dumps({'error' : "Not found : {}".format(url.path)}))
+            return
+        start_time = time.perf_counter()
+        n_points = 0
+        try :
+            query = parse_qs(url.query)
+            dataset = query.get('dataset', [None])[0]
+            trimmed = query.get('trimmed', ["true"])[0].lower() not in ("false", "0", "no")
+            csv_request = "csv" in self.headers.get("Content-Type", "")
+            csv_response = csv_request or "text/csv" in self.headers.get("Accept", "")
+            points = _parse_points(body, csv_request)
+            n_points = len(points)
+            df = self.server.extract(points, dataset, trimmed)
+        except (ValueError, TypeError, KeyError) as e :
+            self.server.metrics.record(n_points, time.perf_counter()-start_time, error=True)
+            self._send(400, json.dumps({'error' : str(e)}))
+            return
+        except Exception as e :
+            self.server.metrics.record(n_points, time.perf_counter()-start_time, error=True)
+            self._send(500, json.dumps({'error' : "{}: {}".format(type(e).__name__, e)}))
+            return
+
+        if csv_response :
+            self._send(200, df.to_csv(index=False), "text/csv")
+        else :
+            response = '{"data": ' + df.to_json(orient='records', double_precision=15)
+            if 'metadata' in df.attrs :
+                response += ', "metadata": ' + json.dumps(df.attrs['metadata'])
+            self._send(200, response + '}')
+        self.server.metrics.record(n_points, time.perf_counter()-start_time)
+
+
+# Data points of a request body : csv with an id,epsg,x,y header or JSON list of {"id", "epsg", "x", "y"} objects
+def _parse_points(body, csv_request):
+    if csv_request :
+        points = CrsPointCollection.from_csv(io.BytesIO(body))
+    else :
+        points = json.loads(body)
+        if isinstance(points, dict) :
+            points = points['points']
+        if not isinstance(points, list) :
+            raise ValueError("JSON body must be a list of {\"id\", \"epsg\", \"x\", \"y\"} data points")
+        df = pd.DataFrame(points, columns=['id', 'epsg', 'x', 'y'])
+        if df.isna().any().any() :
+            raise ValueError("All data points must have id, epsg, x and y values")
+        points = CrsPointCollection.from_df(df.astype({'id' : str, 'epsg' : int, 'x' : float, 'y' : float}))
+    if not len(points) :
+        raise ValueError("No data points in the request")
+    return points
+
+
+if __name__ == "__main__" :
+    parser = argparse.ArgumentParser(description="Serve the bioclim + elevation extraction over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (0.0.0.0 to serve the LAN)")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--window", type=float, default=0.005, help="seconds concurrent requests are collected for before a batch is extracted")
+    parser.add_argument("--max-batch", type=int, default=10000, help="number of data points that triggers a batch before the end of the window")
+    parser.add_argument("--workers", type=int, default=4, help="number of batches extracted at the same time")
+    parser.add_argument("--memory-map", default=None, help="directory of raw arrays to memory-map all the layers (see set_memory_map())")
+    parser.add_argument("--pixel-cache", default=None, help="SQLite pixel cache file (see set_pixel_cache())")
+    parser.add_argument("--no-warm", action="store_true", help="do not open the rasters before serving")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    if args.memory_map is not None :
+        set_memory_map(args.memory_map)
+    if args.pixel_cache is not None :
+        set_pixel_cache(args.pixel_cache)
+    service = ExtractionService(
+        (args.host, args.port), window=args.window, max_batch=args.max_batch, max_workers=args.workers, verbose=args.verbose
+    )
+    if not args.no_warm :
+        service.warm()
+    print("Serving bioclim extraction on http://{}:{} (POST /extract, GET /metrics)".format(args.host, args.port))
+    try :
+        service.serve_forever()
+    except KeyboardInterrupt :
+        pass
+    finally :
+        service.server_close()
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from scripts import data_extraction
+
+# Synthetic 1 degree global GeoTIFF files for all the layers of config.yaml (value of a pixel = its index + the layer number)
+@pytest.fixture(scope="session")
+def synthetic_data_dir(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp("bioclim")
+    cfg = data_extraction.load_config()
+    filenames = dict.fromkeys(
+        [v['filename'] for v in cfg['chelsa_data'].values()] + [v['filename'] for v in cfg['worldclim_data'].values()]
+    )
+    for layer, filename in enumerate(filenames) :
+        values = (np.arange(360*180).reshape(180, 360) % 10000 + layer).astype('int16')
+        with rasterio.open(
+            data_dir / filename, 'w', driver="GTiff", width=360, height=180, count=1, dtype='int16', nodata=-32768,
+            crs="EPSG:4326", transform=from_origin(-180, 90, 1, 1), tiled=True, blockxsize=64, blockysize=64,
+        ) as dst :
+            dst.write(values, 1)
+    return data_dir
+
+@pytest.fixture
+def bioclim_data(synthetic_data_dir):
+    previous = data_extraction.data_dir
+    data_extraction.set_data_dir(synthetic_data_dir)
+    yield synthetic_data_dir
+    data_extraction.set_data_dir(previous)
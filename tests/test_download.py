@@ -0,0 +1,114 @@
+import hashlib
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from scripts import download
+from scripts.download import download_all, download_single
+
+# Local HTTP server of in-memory files with range requests, strong ETags and If-Range support
+class RangeHandler(BaseHTTPRequestHandler) :
+    def log_message(self, *args) :
+        pass
+
+    def send_headers(self, status, content, length) :
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"{}"'.format(hashlib.md5(content).hexdigest()))
+        self.end_headers()
+
+    def do_HEAD(self) :
+        content = self.server.files[self.path]
+        self.send_headers(200, content, len(content))
+        # Hook to change the file between the HEAD and the GET requests of a download
+        if self.server.after_head is not None :
+            self.server.after_head()
+
+    def do_GET(self) :
+        content = self.server.files[self.path]
+        etag = '"{}"'.format(hashlib.md5(content).hexdigest())
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get('Range', ''))
+        if match is None or self.headers.get('If-Range', etag) != etag :
+            self.server.requests.append((self.path, None))
+            self.send_headers(200, content, len(content))
+            self.wfile.write(content)
+            return
+        start, end = int(match.group(1)), min(int(match.group(2)), len(content) - 1)
+        self.server.requests.append((self.path, start))
+        self.send_headers(206, content, end - start + 1)
+        self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, len(content)))
+        self.wfile.write(content[start:end+1])
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    httpd.files, httpd.requests, httpd.after_head = {}, [], None
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+# Session whose downloads are cut after the first chunk of each range request
+class InterruptedSession(requests.Session) :
+    def get(self, url, **kwargs) :
+        response = super().get(url, **kwargs)
+        iter_content = response.iter_content
+        def cut(*args, **kwargs) :
+            chunks = iter_content(*args, **kwargs)
+            yield next(chunks)
+            raise requests.ConnectionError("connection lost")
+        response.iter_content = cut
+        return response
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(download, "chunksize", 1024)
+    monkeypatch.setattr(download, "save_interval", 2048)
+
+def interrupted_download(server, tmp_path, content):
+    server.files["/layer.tif"] = content
+    url = "http://127.0.0.1:{}/layer.tif".format(server.server_port)
+    savepath = str(tmp_path) + "/"
+    assert download_all([url], savepath, session=InterruptedSession()) == [url]
+    assert os.path.exists(savepath+"layer.tif.part") and os.path.exists(savepath+"layer.tif.part.json")
+    server.requests.clear()
+    return url, savepath
+
+def test_resume_interrupted_download(server, tmp_path):
+    content = os.urandom(64 * 1024)
+    url, savepath = interrupted_download(server, tmp_path, content)
+
+    filepath, downloaded = download_single(url, savepath)
+    with open(filepath, 'rb') as f :
+        assert f.read() == content
+    # Each range resumed after its first chunk
+    assert downloaded == len(content) - 4 * 1024
+    assert sorted(start % (16 * 1024) for _, start in server.requests) == [1024] * 4
+    assert not os.path.exists(savepath+"layer.tif.part.json")
+
+def test_restart_if_remote_file_changed(server, tmp_path):
+    url, savepath = interrupted_download(server, tmp_path, os.urandom(64 * 1024))
+    server.files["/layer.tif"] = changed = os.urandom(64 * 1024)
+
+    filepath, downloaded = download_single(url, savepath)
+    with open(filepath, 'rb') as f :
+        assert f.read() == changed
+    assert downloaded == len(changed)
+
+def test_restart_if_remote_file_changes_after_head(server, tmp_path):
+    url, savepath = interrupted_download(server, tmp_path, os.urandom(64 * 1024))
+    changed = os.urandom(64 * 1024)
+    def change() :
+        server.files["/layer.tif"], server.after_head = changed, None
+    server.after_head = change
+
+    # The ranges resumed with the old ETag get the whole file (If-Range) : the download restarts
+    filepath, downloaded = download_single(url, savepath)
+    with open(filepath, 'rb') as f :
+        assert f.read() == changed
+    assert any(start is None for _, start in server.requests)
+    assert downloaded == len(changed)
@@ -0,0 +1,84 @@
+import numbers
+import numpy as np
+import pandas as pd
+import pytest
+from scripts import data_extraction
+from scripts.data_extraction import (
+    CrsDataPoint, CrsPointCollection, extract_csv_to_file, extract_multiple_bioclim_elev, raster_pool, read_pixels, trim_data
+)
+
+@pytest.mark.parametrize("dataset", ["chelsa", "worldclim"])
+def test_single_point_matches_collection(bioclim_data, dataset):
+    sherby = CrsDataPoint('sherby', epsg=4326, x=-71.890068, y=45.393869)
+    values = sherby.extract_bioclim_elev(dataset)
+
+    # Numeric values only, the same keys and values as the rows of the collection path
+    assert all(isinstance(v, numbers.Number) for k, v in values.items() if k != 'id')
+    assert trim_data(values) == values
+    df = extract_multiple_bioclim_elev(CrsPointCollection.from_points([sherby]), dataset)
+    assert list(df.columns) == list(values)
+    assert df.iloc[0].tolist() == list(values.values())
+
+# The chunks of a csv file are sampled by the same worker processes
+def test_csv_chunks_share_one_process_pool(bioclim_data, tmp_path, monkeypatch):
+    pools = []
+    class CountedPool(data_extraction.ProcessPoolExecutor) :
+        def __init__(self, *args, **kwargs) :
+            pools.append(self)
+            super().__init__(*args, **kwargs)
+    monkeypatch.setattr(data_extraction, "ProcessPoolExecutor", CountedPool)
+
+    csvfile = tmp_path / "points.csv"
+    pd.DataFrame({
+        'id' : [str(i) for i in range(30)], 'epsg' : 4326, 'x' : range(-150, 150, 10), 'y' : range(-60, 60, 4)
+    }).to_csv(csvfile, index=False)
+    assert extract_csv_to_file(csvfile, tmp_path / "parallel.csv", 'chelsa', chunksize=10, workers=2) == 30
+    assert len(pools) == 1
+    extract_csv_to_file(csvfile, tmp_path / "serial.csv", 'chelsa', chunksize=10)
+    assert (tmp_path / "parallel.csv").read_text() == (tmp_path / "serial.csv").read_text()
+
+# Pixels of sparse blocks (1 x 1 window reads) and dense blocks (whole block reads) match rasterio's sample_gen()
+def test_read_pixels_matches_sample_gen(bioclim_data):
+    tiff = raster_pool.get(bioclim_data / data_extraction.load_config()['chelsa_data']['bio1']['filename'])
+    rows = np.array([0, 10, 11, 12, 100, 179, -1])
+    cols = np.array([0, 10, 11, 12, 300, 359, 5])
+    expected = [v[0] for v in tiff.sample([tiff.xy(row, col) for row, col in zip(rows[:-1], cols[:-1])])]
+    assert read_pixels(tiff, rows, cols).tolist() == expected + [tiff.nodata]
+
+# Library calls print nothing unless verbose, even with the metrics enabled
+def test_metrics_summary_only_printed_if_verbose(bioclim_data, capsys):
+    metrics = data_extraction.set_metrics(data_extraction.ExtractionMetrics())
+    points = CrsPointCollection(ids=['sherby'], epsg=[4326], x=[-71.890068], y=[45.393869])
+    try :
+        extract_multiple_bioclim_elev(points, 'chelsa')
+        assert capsys.readouterr().out == ""
+        data_extraction.set_verbose(True)
+        extract_multiple_bioclim_elev(points, 'chelsa')
+        assert "1 data points extracted" in capsys.readouterr().out
+    finally :
+        data_extraction.set_verbose(False)
+        data_extraction.set_metrics(None)
+    assert metrics.report()['counters']['points'] == 2
+
+# Points without a radius window (NaN coordinates, too many pixels near a pole) get NaN values, not an error for the whole batch
+def test_radius_window_bad_points_are_nan(bioclim_data):
+    points = CrsPointCollection(
+        ids=['equator', 'nan', 'pole'], epsg=[4326, 4326, 4326], x=[10.0, np.nan, 10.0], y=[0.5, 0.5, 89.5]
+    )
+    df = extract_multiple_bioclim_elev(points, 'chelsa', mode="mean", radius=5000000)
+    values = df['bio1 (Celcius)']
+    assert np.isfinite(values[0]) and np.isnan(values[1]) and np.isnan(values[2])
+    single = extract_multiple_bioclim_elev(points[[0]], 'chelsa', mode="mean", radius=5000000)
+    assert single['bio1 (Celcius)'][0] == values[0]
+
+# Points sharing a pixel are read once and reported as duplicates in the metrics
+def test_metrics_duplicate_pixels(bioclim_data):
+    metrics = data_extraction.set_metrics(data_extraction.ExtractionMetrics())
+    try :
+        points = CrsPointCollection(ids=['a', 'b', 'c'], epsg=[4326]*3, x=[10.2, 10.7, 50.5], y=[0.5, 0.5, 0.5])
+        extract_multiple_bioclim_elev(points, 'chelsa')
+    finally :
+        data_extraction.set_metrics(None)
+    counters = metrics.report()['counters']
+    assert counters['unique_pixels'] * 3 == counters['pixels_inside'] * 2
+    assert "(33.3% duplicates)" in metrics.summary()
@@ -0,0 +1,16 @@
+import rasterio
+from scripts import data_extraction
+from scripts.data_extraction import variable_metadata
+from scripts.prepare import build_cube
+
+# The bands of a cube carry the config.yaml scale, offset and unit of their variable
+def test_cube_band_scales_offsets(bioclim_data):
+    cube_name, _ = build_cube("chelsa")
+    metadata = variable_metadata("chelsa")
+    with rasterio.open(data_extraction.prepared_dir / cube_name) as cube :
+        for band, column in enumerate(cube.descriptions) :
+            assert cube.units[band] == metadata.loc[column, 'unit']
+        bio1 = cube.descriptions.index('bio1 (Celcius)')
+        assert (cube.scales[bio1], cube.offsets[bio1]) == (0.1, -273.15)
+        elevation = cube.descriptions.index('elevation_Meters')
+        assert (cube.scales[elevation], cube.offsets[elevation]) == (1.0, 0.0)
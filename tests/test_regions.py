@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from scripts.clip import clip_region
+from scripts.data_extraction import (
+    CrsDataPoint, CrsPointCollection, extract_multiple_bioclim_elev, outside_region, zonal_statistics
+)
+
+@pytest.fixture
+def us_region(bioclim_data):
+    clip_region("us", "chelsa", (-125, 24, -66, 50), workers=2)
+    return "us"
+
+def test_outside_region_mask(us_region):
+    coords = [(-71.89, 45.39), (2.35, 48.86), (-125, 50), (np.nan, np.nan)]
+    assert outside_region(us_region, coords).tolist() == [False, True, False, True]
+    assert not outside_region("chelsa", coords).any()
+
+def test_points_outside_region_are_nan(us_region):
+    points = CrsPointCollection(
+        ids=['sherby', 'paris'], epsg=[4326, 4326], x=[-71.890068, 2.346963], y=[45.393869, 48.858885]
+    )
+    regional = extract_multiple_bioclim_elev(points, us_region)
+    values = regional.columns[4:]
+    assert regional.loc[1, values].isna().all()
+
+    # Values of the points within the region are the same as with the global files
+    full = extract_multiple_bioclim_elev(points, "chelsa")
+    assert regional.loc[0, values].notna().all()
+    np.testing.assert_allclose(regional.loc[0, values].astype(float), full.loc[0, values].astype(float))
+
+def test_single_point_outside_region_is_nan(us_region):
+    paris = CrsDataPoint('paris', epsg=4326, x=2.346963, y=48.858885)
+    values = paris.extract_bioclim_elev(us_region)
+    assert np.isnan(values['bio1 (Celcius)'])
+    assert np.isnan(values['elevation_Meters'])
+
+    sherby = CrsDataPoint('sherby', epsg=4326, x=-71.890068, y=45.393869)
+    assert sherby.extract_bioclim_elev(us_region)['bio1 (Celcius)'] == sherby.extract_bioclim_elev("chelsa")['bio1 (Celcius)']
+
+# A polygon within the rows but not the columns of a regional dataset has no pixels
+def test_zonal_statistics_outside_region(bioclim_data):
+    clip_region("africa", "chelsa", (-20, -20, 30, 30), workers=2)
+    square = lambda x, y : {'type' : 'Polygon', 'coordinates' : [[(x, y), (x+1, y), (x+1, y+1), (x, y+1), (x, y)]]}
+    df = zonal_statistics([('outside', square(100, 0)), ('inside', square(10, 0))], "africa")
+    assert df.loc[0, 'bio1 (Celcius)_count'] == 0
+    assert np.isnan(df.loc[0, 'bio1 (Celcius)_mean'])
+    assert df.loc[1, 'bio1 (Celcius)_count'] > 0
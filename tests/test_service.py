@@ -0,0 +1,18 @@
+import json
+import pytest
+from scripts.service import _parse_points
+
+# csv and JSON request bodies give the same data points, parsed as CrsPointCollection.from_csv() does
+def test_parse_points_csv_and_json():
+    csv_points = _parse_points(b"id,epsg,x,y\n007,4326,-71.890068,45.393869\nparis,4326,2.346963,48.858885\n", True)
+    json_points = _parse_points(json.dumps([
+        {'id' : '007', 'epsg' : 4326, 'x' : -71.890068, 'y' : 45.393869}, {'id' : 'paris', 'epsg' : 4326, 'x' : 2.346963, 'y' : 48.858885},
+    ]).encode(), False)
+    for points in (csv_points, json_points) :
+        assert points.ids.tolist() == ['007', 'paris']
+        assert points.x.tolist() == [-71.890068, 2.346963]
+
+def test_parse_points_empty_body():
+    for body, csv_request in ((b"id,epsg,x,y\n", True), (b"[]", False)) :
+        with pytest.raises(ValueError, match="No data points") :
+            _parse_points(body, csv_request)
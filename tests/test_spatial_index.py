@@ -0,0 +1,13 @@
+from pathlib import Path
+import numpy as np
+from scripts.data_extraction import CrsPointCollection, SpatialIndex
+
+# A NaN coordinate only drops its own point, not the other points of its page
+def test_query_with_nan_coordinate():
+    capitals = CrsPointCollection.from_csv(Path(__file__).parent.parent / "data" / "us-state-capitals.csv")
+    expected = capitals.spatial_index().query(-80, 40, -70, 45)
+    x = capitals.x.copy()
+    x[0] = np.nan
+    index = SpatialIndex(x, capitals.y)
+    assert index.query(-80, 40, -70, 45).tolist() == [i for i in expected.tolist() if i != 0]
+    assert index.query(-180, -90, 180, 90).tolist() == list(range(1, len(capitals)))